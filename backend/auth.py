@@ -0,0 +1,106 @@
+import base64
+import hashlib
+import hmac
+import ipaddress
+import struct
+import time
+from typing import Optional
+
+from fastapi import Depends, HTTPException, Request
+
+from config import METRICS_ALLOWED_IPS, METRICS_TOKEN, SECRET_KEY, SESSION_TTL_SECONDS, SYNC_API_KEY
+
+# Payload: telegram_id (int64) + expiry unix time (uint32), big-endian
+_PAYLOAD = struct.Struct(">qI")
+
+# Separate key so session tokens can never be confused with initData hashes
+_SESSION_KEY = hmac.new(b"GiftTinderSession", SECRET_KEY.encode(), hashlib.sha256).digest()
+
+_METRICS_NETWORKS = [ipaddress.ip_network(network, strict=False) for network in METRICS_ALLOWED_IPS]
+
+def _b64encode(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode()
+
+def _b64decode(data: str) -> bytes:
+    return base64.urlsafe_b64decode(data + "=" * (-len(data) % 4))
+
+def _sign(payload: bytes) -> bytes:
+    return hmac.new(_SESSION_KEY, payload, hashlib.sha256).digest()
+
+def issue_session_token(telegram_id: int, ttl: int = SESSION_TTL_SECONDS,
+                        now: Optional[float] = None) -> str:
+    """
+    Issue a stateless session token for a verified Telegram user
+    """
+    now = time.time() if now is None else now
+    payload = _PAYLOAD.pack(telegram_id, int(now) + ttl)
+    return f"{_b64encode(payload)}.{_b64encode(_sign(payload))}"
+
+def verify_session_token(token: str, now: Optional[float] = None) -> Optional[int]:
+    """
+    Verify a session token, returns the telegram_id or None
+    """
+    try:
+        payload_part, signature_part = token.split(".", 1)
+        payload = _b64decode(payload_part)
+        signature = _b64decode(signature_part)
+        telegram_id, expires_at = _PAYLOAD.unpack(payload)
+    except (ValueError, struct.error):
+        return None
+
+    if not hmac.compare_digest(_sign(payload), signature):
+        return None
+
+    now = time.time() if now is None else now
+    if now >= expires_at:
+        return None
+
+    return telegram_id
+
+def current_user_id(request: Request) -> int:
+    """Dependency: telegram_id of the session token in the Authorization header"""
+    scheme, _, token = request.headers.get("Authorization", "").partition(" ")
+    if scheme.lower() != "bearer" or not token:
+        raise HTTPException(status_code=401, detail="Missing session token")
+
+    telegram_id = verify_session_token(token.strip())
+    if telegram_id is None:
+        raise HTTPException(status_code=401, detail="Invalid or expired session token")
+
+    return telegram_id
+
+def service_client(request: Request) -> None:
+    """Dependency: the X-API-Key header must carry SYNC_API_KEY (userbot endpoints)"""
+    if not SYNC_API_KEY:
+        raise HTTPException(status_code=403, detail="Service API is disabled")
+
+    api_key = request.headers.get("X-API-Key", "")
+    if not hmac.compare_digest(api_key.encode(), SYNC_API_KEY.encode()):
+        raise HTTPException(status_code=401, detail="Invalid API key")
+
+def metrics_client(request: Request) -> None:
+    """
+    Dependency: /metrics is only served to METRICS_ALLOWED_IPS or to
+    requests carrying METRICS_TOKEN as a bearer token.
+    """
+    if METRICS_TOKEN:
+        authorization = request.headers.get("Authorization", "")
+        if hmac.compare_digest(authorization.encode(), f"Bearer {METRICS_TOKEN}".encode()):
+            return
+
+    try:
+        address = ipaddress.ip_address(request.client.host) if request.client else None
+    except ValueError:
+        address = None
+    if address is not None and address.version == 6 and address.ipv4_mapped:
+        # Dual-stack sockets report IPv4 clients as ::ffff:a.b.c.d
+        address = address.ipv4_mapped
+    if address is not None and any(address in network for network in _METRICS_NETWORKS):
+        return
+    raise HTTPException(status_code=401 if METRICS_TOKEN else 403, detail="Metrics are not public")
+
+def authorized_user(telegram_id: int, session_user_id: int = Depends(current_user_id)) -> int:
+    """Dependency: the telegram_id route parameter, which must match the session"""
+    if telegram_id != session_user_id:
+        raise HTTPException(status_code=403, detail="Forbidden")
+    return telegram_id
@@ -0,0 +1,98 @@
+import hashlib
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Optional, Tuple
+
+import orjson
+from fastapi import Request, Response
+
+from config import RESPONSE_CACHE_TTL_SECONDS, RESPONSE_CACHE_MAX_ENTRIES
+
+class MemoryCacheBackend:
+    """
+    In-process TTL + LRU key/value store.
+
+    Any object with the same get/set methods (e.g. Redis GET/SET EX) can be
+    plugged into ResponseCache to share cached responses and invalidations
+    between workers.
+    """
+
+    def __init__(self, max_entries: int = RESPONSE_CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: Any, ttl: float):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+class ResponseCache:
+    """
+    Read-through cache of JSON responses keyed per (kind, telegram_id).
+
+    Every (kind, telegram_id) has a generation token stored next to the
+    entries; invalidate() replaces the token, which makes all cached
+    variants of that user's responses (e.g. every matches page)
+    unreachable at once. Old entries simply age out of the LRU.
+    """
+
+    def __init__(self, backend=None, ttl: float = RESPONSE_CACHE_TTL_SECONDS):
+        self.backend = backend if backend is not None else MemoryCacheBackend()
+        self.ttl = ttl
+
+    def _generation(self, kind: str, telegram_id: int) -> str:
+        key = f"gen:{kind}:{telegram_id}"
+        generation = self.backend.get(key)
+        if generation is None:
+            # Unknown (or evicted) generation: start a new one so nothing stale matches
+            generation = uuid.uuid4().hex
+            self.backend.set(key, generation, self.ttl)
+        return generation
+
+    def invalidate(self, kind: str, *telegram_ids: int):
+        """Drop every cached kind response of the given users"""
+        for telegram_id in telegram_ids:
+            self.backend.set(f"gen:{kind}:{telegram_id}", uuid.uuid4().hex, self.ttl)
+
+    async def get_or_load(self, kind: str, telegram_id: int, variant: str,
+                          loader: Callable[[], Awaitable[Any]]) -> Tuple[bytes, str]:
+        """Return (JSON body, ETag), calling loader on a miss"""
+        key = f"{kind}:{telegram_id}:{self._generation(kind, telegram_id)}:{variant}"
+        cached = self.backend.get(key)
+        if cached is not None:
+            return cached
+
+        body = orjson.dumps(await loader())
+        entry = (body, f'"{hashlib.sha1(body).hexdigest()}"')
+        self.backend.set(key, entry, self.ttl)
+        return entry
+
+    async def respond(self, request: Request, kind: str, telegram_id: int,
+                      loader: Callable[[], Awaitable[Any]], variant: str = "") -> Response:
+        """Serve a cached JSON response, or 304 if the client already has it"""
+        body, etag = await self.get_or_load(kind, telegram_id, variant, loader)
+        headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+
+        if_none_match = request.headers.get("If-None-Match", "")
+        if etag in (tag.strip().removeprefix("W/") for tag in if_none_match.split(",")):
+            return Response(status_code=304, headers=headers)
+        return Response(content=body, media_type="application/json", headers=headers)
+
+response_cache = ResponseCache()
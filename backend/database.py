@@ -1,13 +1,223 @@
-from sqlalchemy import create_engine
+import asyncio
+import threading
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from typing import Optional
+
+from fastapi import Request
+from sqlalchemy import create_engine, event
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
-from config import DB_URL
+from config import (
+    DB_URL, ASYNC_DB_URL, DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_TIMEOUT, DB_READ_URLS, DB_READ_STICKY_SECONDS, METRICS_ENABLED,
+    SQLITE_TUNING, SQLITE_WRITER, SQLITE_SYNCHRONOUS, SQLITE_MMAP_SIZE, SQLITE_CACHE_SIZE_KB, SQLITE_BUSY_TIMEOUT_MS
+)
+from metrics import metrics
+
+# Async drivers used when ASYNC_DB_URL is not set explicitly
+ASYNC_DRIVERS = {
+    "sqlite": "sqlite+aiosqlite",
+    "postgresql": "postgresql+asyncpg",
+    "postgres": "postgresql+asyncpg",
+}
+
+def to_async_url(url: str) -> str:
+    """Swap the driver of a sync database URL for its async counterpart"""
+    scheme, sep, rest = url.partition("://")
+    dialect = scheme.split("+", 1)[0]
+    return ASYNC_DRIVERS.get(dialect, scheme) + sep + rest
+
+def apply_sqlite_pragmas(dbapi_connection, connection_record):
+    """
+    WAL lets readers run alongside the writer, and synchronous=NORMAL only
+    fsyncs at checkpoints instead of on every commit. The busy timeout
+    makes writers from other processes wait instead of failing with
+    "database is locked".
+    """
+    cursor = dbapi_connection.cursor()
+    for pragma in (
+        "PRAGMA journal_mode=WAL",
+        f"PRAGMA synchronous={SQLITE_SYNCHRONOUS}",
+        f"PRAGMA mmap_size={SQLITE_MMAP_SIZE}",
+        f"PRAGMA cache_size=-{SQLITE_CACHE_SIZE_KB}",
+        f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}",
+        "PRAGMA temp_store=MEMORY",
+    ):
+        cursor.execute(pragma)
+    cursor.close()
 
-# Create database engine
+def begin_immediate(engine):
+    """
+    Take the write lock when a transaction starts. A deferred transaction
+    that reads first and writes later cannot wait on busy_timeout when
+    another connection holds the lock; it fails at once.
+    """
+    @event.listens_for(engine, "connect")
+    def disable_driver_transactions(dbapi_connection, connection_record):
+        dbapi_connection.isolation_level = None
+
+    @event.listens_for(engine, "begin")
+    def emit_begin(conn):
+        conn.exec_driver_sql("BEGIN IMMEDIATE")
+
+# Create database engine (migrations, scripts and the userbot tooling)
 engine = create_engine(DB_URL, connect_args={"check_same_thread": False} if "sqlite" in DB_URL else {})
 
+# Create async engine used by the API routes
+ASYNC_URL = ASYNC_DB_URL or to_async_url(DB_URL)
+async_engine = create_async_engine(
+    ASYNC_URL,
+    # aiosqlite defaults to NullPool (a new connection per session)
+    poolclass=AsyncAdaptedQueuePool,
+    pool_size=DB_POOL_SIZE,
+    max_overflow=DB_MAX_OVERFLOW,
+    pool_timeout=DB_POOL_TIMEOUT,
+    pool_pre_ping=True
+)
+
+# Read replicas, used for read-only routes
+read_engines = [
+    create_async_engine(
+        to_async_url(url),
+        poolclass=AsyncAdaptedQueuePool,
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_timeout=DB_POOL_TIMEOUT,
+        pool_pre_ping=True
+    )
+    for url in DB_READ_URLS
+]
+
+# SQLite allows one writer at a time: writes get their own single connection
+# and the pool above only serves reads. Other databases write on the shared pool.
+if SQLITE_WRITER:
+    write_engine = create_async_engine(
+        ASYNC_URL,
+        poolclass=AsyncAdaptedQueuePool,
+        pool_size=1,
+        max_overflow=0,
+        pool_pre_ping=True
+    )
+    begin_immediate(write_engine.sync_engine)
+else:
+    write_engine = async_engine
+
+if SQLITE_TUNING and DB_URL.startswith("sqlite"):
+    for sqlite_engine in {engine, async_engine.sync_engine, write_engine.sync_engine}:
+        event.listen(sqlite_engine, "connect", apply_sqlite_pragmas)
+
+# Time every statement for /metrics and the slow-query log
+if METRICS_ENABLED:
+    for instrumented in {engine, async_engine.sync_engine, write_engine.sync_engine, *(e.sync_engine for e in read_engines)}:
+        metrics.instrument_engine(instrumented)
+
 # Create SessionLocal class
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+AsyncWriteSessionLocal = async_sessionmaker(write_engine, autoflush=False, expire_on_commit=False)
+
+class DatabaseWriter:
+    """
+    Hands out write sessions, one at a time when there is a single writer.
+
+    Write transactions queue here (in arrival order, without the pool's
+    checkout timeout) for the writer connection; waiting is the queue
+    depth. Without a single writer sessions are handed out immediately.
+    """
+
+    def __init__(self, session_factory: async_sessionmaker, serialize: bool):
+        self.session_factory = session_factory
+        self.serialize = serialize
+        self.waiting = 0
+        self._lock = asyncio.Lock()
+
+    @asynccontextmanager
+    async def session(self):
+        if not self.serialize:
+            async with self.session_factory() as db:
+                yield db
+            return
+
+        self.waiting += 1
+        try:
+            await self._lock.acquire()
+        finally:
+            self.waiting -= 1
+        try:
+            async with self.session_factory() as db:
+                yield db
+        finally:
+            self._lock.release()
+
+db_writer = DatabaseWriter(AsyncWriteSessionLocal, serialize=SQLITE_WRITER)
+metrics.gauge("db_writer_queue_depth", "Write transactions waiting for the database writer", lambda: db_writer.waiting)
+
+class ReadRouter:
+    """
+    Picks the database for read-only work.
+
+    Reads go round-robin to the replicas, except for users who wrote in
+    the last sticky_seconds: their reads stay on the primary, so they see
+    their own swipes and syncs despite replication lag. Without replicas
+    every read uses the primary pool.
+    """
+
+    def __init__(self, primary: async_sessionmaker, replicas, sticky_seconds: float = DB_READ_STICKY_SECONDS):
+        self.primary = primary
+        self.replicas = list(replicas)
+        self.sticky_seconds = sticky_seconds
+        self._next = 0
+        # telegram_id -> end of its sticky window, oldest first
+        self._recent_writers: "OrderedDict[int, float]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _prune(self, now: float):
+        while self._recent_writers:
+            telegram_id, expires_at = next(iter(self._recent_writers.items()))
+            if expires_at > now:
+                break
+            self._recent_writers.popitem(last=False)
+
+    def note_write(self, *telegram_ids: int):
+        """Pin these users' reads to the primary for the sticky window"""
+        if not self.replicas:
+            return
+        now = time.monotonic()
+        with self._lock:
+            for telegram_id in telegram_ids:
+                self._recent_writers[telegram_id] = now + self.sticky_seconds
+                self._recent_writers.move_to_end(telegram_id)
+            self._prune(now)
+
+    @property
+    def sticky_users(self) -> int:
+        with self._lock:
+            self._prune(time.monotonic())
+            return len(self._recent_writers)
+
+    def session_factory(self, telegram_id: Optional[int] = None) -> async_sessionmaker:
+        if not self.replicas:
+            return self.primary
+        with self._lock:
+            if telegram_id is not None:
+                self._prune(time.monotonic())
+                if telegram_id in self._recent_writers:
+                    return self.primary
+            factory = self.replicas[self._next % len(self.replicas)]
+            self._next += 1
+            return factory
+
+    def session(self, telegram_id: Optional[int] = None) -> AsyncSession:
+        """Read session for work on behalf of telegram_id (or of nobody in particular)"""
+        return self.session_factory(telegram_id)()
+
+read_router = ReadRouter(AsyncSessionLocal, [
+    async_sessionmaker(read_engine, autoflush=False, expire_on_commit=False) for read_engine in read_engines
+])
+metrics.gauge("db_read_sticky_users", "Users whose reads are pinned to the primary after a write", lambda: read_router.sticky_users)
 
 # Create Base class
 Base = declarative_base()
@@ -20,6 +230,21 @@ def get_db():
     finally:
         db.close()
 
-# Create all tables
+# Dependency to get async database session (reads, on a replica when configured)
+async def get_async_db(request: Request):
+    try:
+        telegram_id = int(request.path_params["telegram_id"])
+    except (KeyError, ValueError):
+        telegram_id = None
+    async with read_router.session(telegram_id) as db:
+        yield db
+
+# Dependency to get async database session for routes that write
+async def get_async_write_db():
+    async with db_writer.session() as db:
+        yield db
+
+# Create all tables and apply pending migrations
 def create_tables():
-    Base.metadata.create_all(bind=engine) 
\ No newline at end of file
+    from migrations import upgrade
+    upgrade(engine)
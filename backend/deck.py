@@ -0,0 +1,256 @@
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Any, Deque, Dict, Iterable, List, Optional, Set
+
+from sqlalchemy import Row, and_, exists, func, select
+from sqlalchemy.orm import Session, aliased
+
+from database import read_router
+from models import GIFT_COLUMNS, Gift, LikeEdge, Swipe
+from ranking import FeatureRanker
+from utils import format_gift_data
+from config import (
+    DECK_QUEUE_CAPACITY,
+    DECK_REFILL_THRESHOLD,
+    DECK_MAX_USERS,
+    DECK_EXHAUSTED_RETRY_SECONDS,
+    DECK_RANKING,
+    DECK_RANK_POOL_SIZE,
+    DECK_RECIPROCITY,
+    DECK_RECIPROCAL_SHARE,
+)
+
+def fetch_candidates(db: Session, telegram_id: int, after_id: int, limit: int) -> List[Row]:
+    """Fetch unswiped visible gifts of other users with ids greater than after_id"""
+    already_swiped = exists().where(and_(
+        Swipe.user_id == telegram_id,
+        Swipe.gift_id == Gift.id
+    ))
+    return db.execute(select(*GIFT_COLUMNS).where(
+        Gift.telegram_id != telegram_id,  # Not user's own gifts
+        Gift.is_visible == True,
+        Gift.id > after_id,
+        ~already_swiped
+    ).order_by(Gift.id).limit(limit)).all()
+
+def swiped_gift_ids(db: Session, telegram_id: int, gift_ids: Iterable[int]) -> Set[int]:
+    """Which of gift_ids the user already swiped (one probe of the unique swipe index)"""
+    gift_ids = list(gift_ids)
+    if not gift_ids:
+        return set()
+    return set(db.execute(
+        select(Swipe.gift_id).where(Swipe.user_id == telegram_id, Swipe.gift_id.in_(gift_ids))
+    ).scalars())
+
+def fetch_reciprocal_candidates(db: Session, telegram_id: int, limit: int) -> List[Row]:
+    """
+    Fetch one unswiped gift from each user who liked the user's gifts
+    and has not been liked back yet, most recent likes first.
+
+    Liking any of these gifts creates a match straight away.
+    """
+    liked_back = aliased(LikeEdge)
+    already_swiped = exists().where(and_(
+        Swipe.user_id == telegram_id,
+        Swipe.gift_id == Gift.id
+    ))
+
+    # Newest candidate gift per admirer, via the (owner_id, liker_id) index
+    query = select(
+        func.max(Gift.id)
+    ).join(
+        LikeEdge, LikeEdge.liker_id == Gift.telegram_id
+    ).where(
+        LikeEdge.owner_id == telegram_id,
+        ~exists().where(and_(
+            liked_back.liker_id == telegram_id,
+            liked_back.owner_id == LikeEdge.liker_id
+        )),
+        Gift.is_visible == True,
+        ~already_swiped
+    )
+
+    gift_ids = db.execute(
+        query.group_by(Gift.telegram_id)
+        .order_by(func.max(LikeEdge.created_at).desc())
+        .limit(limit)
+    ).scalars().all()
+    if not gift_ids:
+        return []
+
+    gifts = {gift.id: gift for gift in db.execute(select(*GIFT_COLUMNS).where(Gift.id.in_(gift_ids)))}
+    return [gifts[gift_id] for gift_id in gift_ids if gift_id in gifts]
+
+class _UserDeck:
+    __slots__ = ("items", "cursor", "refilling", "exhausted_at", "new_admirers")
+
+    def __init__(self):
+        self.items: Deque[Dict[str, Any]] = deque()
+        self.cursor = 0  # Highest Gift.id already pulled into the queue
+        self.refilling = False
+        self.exhausted_at: Optional[float] = None
+        self.new_admirers = False  # Someone liked the user since the last refill
+
+class CandidateQueue:
+    """
+    Per-user queue of swipe candidates.
+
+    Candidates are pulled from the database in batches walking Gift.id
+    upwards, so each refill is a short range scan instead of an anti-join
+    over the user's whole swipe history. Gifts synced later always get
+    larger ids and are picked up by the next refill.
+
+    With a ranker, each refill instead scores a pool of the newest
+    pool_size unswiped gifts and queues the best ones.
+
+    With reciprocity on, gifts of users who already liked the user (and
+    would match on a like back) are interleaved at the front of the queue,
+    up to reciprocal_share of each refill.
+    """
+
+    def __init__(self, capacity: int = DECK_QUEUE_CAPACITY,
+                 refill_threshold: int = DECK_REFILL_THRESHOLD,
+                 max_users: int = DECK_MAX_USERS,
+                 exhausted_retry: float = DECK_EXHAUSTED_RETRY_SECONDS,
+                 ranker=None, pool_size: int = DECK_RANK_POOL_SIZE,
+                 reciprocity: bool = DECK_RECIPROCITY,
+                 reciprocal_share: float = DECK_RECIPROCAL_SHARE):
+        self.ranker = ranker
+        self.reciprocity = reciprocity
+        self.reciprocal_share = reciprocal_share
+        self.pool_size = pool_size
+        self.capacity = capacity
+        self.refill_threshold = refill_threshold
+        self.max_users = max_users
+        self.exhausted_retry = exhausted_retry
+        self._decks: "OrderedDict[int, _UserDeck]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _deck(self, telegram_id: int) -> _UserDeck:
+        # Caller must hold self._lock
+        deck = self._decks.get(telegram_id)
+        if deck is None:
+            deck = _UserDeck()
+            self._decks[telegram_id] = deck
+            if len(self._decks) > self.max_users:
+                self._decks.popitem(last=False)
+        else:
+            self._decks.move_to_end(telegram_id)
+        return deck
+
+    def _can_refill(self, deck: _UserDeck) -> bool:
+        if deck.refilling:
+            return False
+        if deck.exhausted_at is None or deck.new_admirers:
+            return True
+        return time.monotonic() - deck.exhausted_at >= self.exhausted_retry
+
+    def peek(self, telegram_id: int, size: int) -> List[Dict[str, Any]]:
+        """Return up to size queued candidates without removing them"""
+        with self._lock:
+            deck = self._deck(telegram_id)
+            return [deck.items[i] for i in range(min(size, len(deck.items)))]
+
+    def needs_refill(self, telegram_id: int, size: int = 0) -> bool:
+        """Check whether the queue is below its refill threshold (or size)"""
+        with self._lock:
+            deck = self._deck(telegram_id)
+            low = len(deck.items) < max(size, self.refill_threshold)
+            return (low or deck.new_admirers) and self._can_refill(deck)
+
+    def refill(self, db: Session, telegram_id: int) -> int:
+        """Top the queue up to capacity, returns number of gifts added"""
+        with self._lock:
+            deck = self._deck(telegram_id)
+            if not self._can_refill(deck):
+                return 0
+            deck.refilling = True
+            deck.new_admirers = False
+            after_id = deck.cursor
+            queued_ids = [item["id"] for item in deck.items]
+            limit = self.capacity - len(deck.items)
+
+        reciprocal = []
+        fresh = []
+        added = []
+        try:
+            if self.reciprocity:
+                # Reciprocal gifts may push the queue slightly past capacity
+                share = max(1, int(self.capacity * self.reciprocal_share))
+                reciprocal = fetch_reciprocal_candidates(db, telegram_id, share)
+                fresh = [gift.id for gift in reciprocal if gift.id not in queued_ids]
+                queued_ids.extend(fresh)
+                limit = max(0, limit - len(fresh))
+            if limit > 0 and self.ranker is not None:
+                added = self.ranker.rank(db, telegram_id, queued_ids, self.pool_size, limit)
+            elif limit > 0:
+                added = fetch_candidates(db, telegram_id, after_id, limit)
+            # Drop gifts swiped while the queries ran
+            swiped = swiped_gift_ids(db, telegram_id, [gift.id for gift in reciprocal + added])
+            reciprocal = [gift for gift in reciprocal if gift.id not in swiped]
+            added = [gift for gift in added if gift.id not in swiped]
+        finally:
+            with self._lock:
+                deck = self._deck(telegram_id)
+                deck.refilling = False
+                queued = {item["id"] for item in deck.items}
+                if reciprocal:
+                    # Interleave: reciprocal, queued, reciprocal, queued...
+                    # Reciprocal gifts that were already queued move forward
+                    promoted = {gift.id for gift in reciprocal}
+                    current = [item for item in deck.items if item["id"] not in promoted]
+                    deck.items.clear()
+                    for i in range(max(len(reciprocal), len(current))):
+                        if i < len(reciprocal):
+                            deck.items.append(format_gift_data(reciprocal[i]._mapping))
+                        if i < len(current):
+                            deck.items.append(current[i])
+                    queued |= promoted
+                for gift in added:
+                    if gift.id not in queued:
+                        deck.items.append(format_gift_data(gift._mapping))
+                        queued.add(gift.id)
+                if added and self.ranker is None:
+                    deck.cursor = max(deck.cursor, added[-1].id)
+                deck.exhausted_at = time.monotonic() if len(added) < limit else None
+
+        return len(fresh) + len(added)
+
+    def note_like(self, owner_id: int):
+        """
+        Let the owner's next deck request pull in the new admirer's gifts
+        (called after a like on one of owner_id's gifts)
+        """
+        if not self.reciprocity:
+            return
+        with self._lock:
+            deck = self._decks.get(owner_id)
+            if deck is not None:
+                deck.new_admirers = True
+
+    def discard(self, telegram_id: int, gift_id: int):
+        """Remove a gift from the user's queue (e.g. after it was swiped)"""
+        with self._lock:
+            deck = self._decks.get(telegram_id)
+            if deck is None:
+                return
+            for item in deck.items:
+                if item["id"] == gift_id:
+                    deck.items.remove(item)
+                    break
+
+    def invalidate(self, telegram_id: Optional[int] = None):
+        """Drop cached candidates for one user, or for everyone"""
+        with self._lock:
+            if telegram_id is None:
+                self._decks.clear()
+            else:
+                self._decks.pop(telegram_id, None)
+
+candidate_queue = CandidateQueue(ranker=FeatureRanker() if DECK_RANKING else None)
+
+async def refill_in_background(telegram_id: int):
+    """Refill a user's queue with its own session (run as a background task)"""
+    async with read_router.session(telegram_id) as db:
+        await db.run_sync(candidate_queue.refill, telegram_id)
@@ -0,0 +1,118 @@
+from typing import Any, Dict, List, Sequence
+
+from sqlalchemy import select, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+
+from models import FeatureWatermark, Gift, GiftFeatures, Swipe, UserFeatures
+from matching import insert_ignore
+from config import FEATURE_REFRESH_BATCH
+
+WATERMARK = "swipes"
+
+def upsert_increment(db: Session, model, key: str, rows: List[Dict[str, Any]], fields: Sequence[str]):
+    """
+    Add the given counter values to existing rows, inserting missing ones.
+    """
+    if not rows:
+        return
+
+    dialect = db.get_bind().dialect.name
+    if dialect in ("sqlite", "postgresql"):
+        dialect_insert = sqlite.insert if dialect == "sqlite" else postgresql.insert
+        statement = dialect_insert(model).values(rows)
+        statement = statement.on_conflict_do_update(
+            index_elements=[key],
+            set_={field: getattr(model, field) + statement.excluded[field] for field in fields}
+        )
+        db.execute(statement)
+        return
+
+    key_column = getattr(model, key)
+    for row in rows:
+        result = db.execute(
+            update(model)
+            .where(key_column == row[key])
+            .values({field: getattr(model, field) + row[field] for field in fields})
+        )
+        if result.rowcount == 0:
+            db.add(model(**row))
+    db.flush()
+
+def refresh_features_batch(db: Session, batch_size: int = FEATURE_REFRESH_BATCH) -> int:
+    """
+    Fold up to batch_size swipes past the stored watermark into the feature
+    tables and advance the watermark in the same transaction.
+
+    Processes swipes in Swipe.id order, so each swipe is counted exactly
+    once. Commits, returns the number of swipes processed (less than
+    batch_size once the backlog is drained).
+    """
+    insert_ignore(db, FeatureWatermark, {"name": WATERMARK, "last_swipe_id": 0})
+    watermark = db.execute(
+        select(FeatureWatermark.last_swipe_id).where(FeatureWatermark.name == WATERMARK)
+    ).scalar_one()
+
+    rows = db.execute(
+        select(Swipe.id, Swipe.user_id, Swipe.gift_id, Swipe.is_like, Gift.telegram_id)
+        .join(Gift, Gift.id == Swipe.gift_id)
+        .where(Swipe.id > watermark)
+        .order_by(Swipe.id)
+        .limit(batch_size)
+    ).all()
+    if not rows:
+        db.commit()
+        return 0
+
+    gifts: Dict[int, Dict[str, Any]] = {}
+    users: Dict[int, Dict[str, Any]] = {}
+
+    def user_row(telegram_id: int) -> Dict[str, Any]:
+        row = users.get(telegram_id)
+        if row is None:
+            row = users[telegram_id] = {
+                "telegram_id": telegram_id,
+                "likes_given": 0,
+                "swipes_given": 0,
+                "swipes_received": 0
+            }
+        return row
+
+    for swipe_id, user_id, gift_id, is_like, owner_id in rows:
+        liked = 1 if is_like else 0
+        gift = gifts.setdefault(gift_id, {"gift_id": gift_id, "likes": 0, "swipes": 0})
+        gift["likes"] += liked
+        gift["swipes"] += 1
+
+        swiper = user_row(user_id)
+        swiper["likes_given"] += liked
+        swiper["swipes_given"] += 1
+
+        user_row(owner_id)["swipes_received"] += 1
+
+    upsert_increment(db, GiftFeatures, "gift_id", list(gifts.values()), ("likes", "swipes"))
+    upsert_increment(
+        db, UserFeatures, "telegram_id", list(users.values()),
+        ("likes_given", "swipes_given", "swipes_received")
+    )
+
+    db.execute(
+        update(FeatureWatermark)
+        .where(FeatureWatermark.name == WATERMARK)
+        .values(last_swipe_id=rows[-1][0])
+    )
+    db.commit()
+    return len(rows)
+
+def refresh_features(db: Session, batch_size: int = FEATURE_REFRESH_BATCH) -> int:
+    """
+    Fold every swipe recorded since the last refresh into the feature tables.
+
+    Commits after every batch, returns the number of swipes processed.
+    """
+    processed = 0
+    while True:
+        count = refresh_features_batch(db, batch_size)
+        processed += count
+        if count < batch_size:
+            return processed
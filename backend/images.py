@@ -0,0 +1,367 @@
+import asyncio
+import hashlib
+import io
+import ipaddress
+import logging
+import os
+import re
+import time
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+from urllib.parse import urljoin, urlsplit
+
+from fastapi import HTTPException, Request, Response
+from fastapi.responses import FileResponse
+from sqlalchemy import or_, select, update
+
+from database import AsyncSessionLocal, db_writer, read_router
+from models import Gift
+from cache import response_cache
+from config import (
+    IMAGE_CACHE_DIR,
+    IMAGE_THUMBNAIL_SIZES,
+    IMAGE_MAX_BYTES,
+    IMAGE_ALLOWED_HOSTS,
+    IMAGE_MAX_REDIRECTS,
+    IMAGE_FETCH_CONCURRENCY,
+    IMAGE_FETCH_TIMEOUT_SECONDS,
+    IMAGE_RETRY_SECONDS,
+)
+
+try:
+    from PIL import Image
+except ImportError:  # Without Pillow only originals are served
+    Image = None
+
+logger = logging.getLogger(__name__)
+
+HASH_PATTERN = re.compile(r"^[0-9a-f]{64}$")
+
+# Content-addressed files never change
+CACHE_HEADERS = {
+    "Cache-Control": "public, max-age=31536000, immutable",
+    "Accept-Ranges": "bytes",
+}
+
+_SIGNATURES = (
+    (b"\x89PNG\r\n\x1a\n", "image/png"),
+    (b"\xff\xd8\xff", "image/jpeg"),
+    (b"GIF87a", "image/gif"),
+    (b"GIF89a", "image/gif"),
+)
+
+def sniff_content_type(head: bytes) -> str:
+    for signature, content_type in _SIGNATURES:
+        if head.startswith(signature):
+            return content_type
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "image/webp"
+    return "application/octet-stream"
+
+IMAGE_CONTENT_TYPES = {"image/png", "image/jpeg", "image/gif", "image/webp"}
+
+class ForbiddenImageURL(ValueError):
+    pass
+
+def check_image_url(url: str, allowed_hosts: Iterable[str] = IMAGE_ALLOWED_HOSTS) -> str:
+    """Validate a gift image URL before fetching it, returns its host"""
+    parts = urlsplit(url)
+    host = (parts.hostname or "").lower().rstrip(".")
+    if parts.scheme not in ("http", "https") or not host or parts.username or parts.password:
+        raise ForbiddenImageURL(f"Unsupported image URL: {url}")
+    try:
+        address = ipaddress.ip_address(host)
+    except ValueError:
+        address = None
+    if address is not None and not address.is_global:
+        raise ForbiddenImageURL(f"Image URL points at a non-public address: {url}")
+    allowed_hosts = list(allowed_hosts)
+    if allowed_hosts and not any(host == allowed or host.endswith("." + allowed) for allowed in allowed_hosts):
+        raise ForbiddenImageURL(f"Image host not allowed: {host}")
+    return host
+
+def _public_resolver():
+    """
+    aiohttp resolver that drops private, loopback, link-local and other
+    non-public addresses. Checking at connect time (rather than resolving
+    once up front) also covers hosts that re-resolve to an internal address.
+    """
+    from aiohttp.resolver import ThreadedResolver
+
+    class PublicResolver(ThreadedResolver):
+        async def resolve(self, host, port=0, family=0):
+            hosts = [
+                entry for entry in await super().resolve(host, port, family)
+                if ipaddress.ip_address(entry["host"]).is_global
+            ]
+            if not hosts:
+                raise ForbiddenImageURL(f"{host} does not resolve to a public address")
+            return hosts
+
+    return PublicResolver()
+
+class ImageStore:
+    """
+    Content-addressed image files on local disk.
+
+    Originals are stored once per SHA-256 of their bytes, so a gift image
+    owned by many users (or reachable from several URLs) is kept once.
+    Thumbnails are JPEGs fitted into size x size boxes.
+    """
+
+    def __init__(self, root: str = IMAGE_CACHE_DIR, sizes: Tuple[int, ...] = IMAGE_THUMBNAIL_SIZES):
+        self.root = root
+        self.sizes = sizes
+
+    def path(self, image_hash: str, size: Optional[int] = None) -> str:
+        name = image_hash if size is None else f"{image_hash}_{size}.jpg"
+        return os.path.join(self.root, image_hash[:2], name)
+
+    def _write(self, path: str, data: bytes):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    def validate(self, data: bytes):
+        """Reject anything but a PNG, JPEG, GIF or WEBP (that Pillow can decode, when installed)"""
+        if sniff_content_type(data[:12]) not in IMAGE_CONTENT_TYPES:
+            raise ValueError("Not a PNG, JPEG, GIF or WEBP image")
+        if Image is None:
+            return
+        try:
+            with Image.open(io.BytesIO(data)) as image:
+                image.verify()
+        except Exception as e:
+            raise ValueError(f"Undecodable image: {e}") from e
+
+    def store(self, data: bytes) -> str:
+        """Save an original and its thumbnails, returns its content hash"""
+        self.validate(data)
+        image_hash = hashlib.sha256(data).hexdigest()
+        original = self.path(image_hash)
+        if not os.path.exists(original):
+            self._write(original, data)
+        if Image is not None:
+            self._thumbnails(image_hash, data)
+        return image_hash
+
+    def _thumbnails(self, image_hash: str, data: bytes):
+        try:
+            with Image.open(io.BytesIO(data)) as image:
+                image = image.convert("RGB")
+                for size in self.sizes:
+                    path = self.path(image_hash, size)
+                    if os.path.exists(path):
+                        continue
+                    thumbnail = image.copy()
+                    thumbnail.thumbnail((size, size))
+                    buffer = io.BytesIO()
+                    thumbnail.save(buffer, "JPEG", quality=85, optimize=True, progressive=True)
+                    self._write(path, buffer.getvalue())
+        except Exception as e:
+            # Thumbnailing failed, the original is still served
+            logger.warning(f"Cannot make thumbnails for {image_hash}: {e}")
+
+    def resolve(self, image_hash: str, size: Optional[int] = None) -> Optional[str]:
+        """Best existing file: the smallest thumbnail covering size, else the original"""
+        if size is not None:
+            for thumbnail_size in sorted(self.sizes):
+                if thumbnail_size >= size:
+                    path = self.path(image_hash, thumbnail_size)
+                    if os.path.exists(path):
+                        return path
+                    break
+        path = self.path(image_hash)
+        return path if os.path.exists(path) else None
+
+class ImageFetcher:
+    """
+    Background downloader filling the ImageStore from gift image URLs.
+
+    URLs are queued after each gift sync. Each URL is downloaded at most
+    once: if any gift with the same URL already has an image_hash it is
+    reused, otherwise the image is fetched, stored and the hash is written
+    to every gift pointing at that URL. Failed URLs are retried after
+    retry_seconds.
+
+    Only URLs on allowed_hosts are fetched, never from non-public
+    addresses, and every redirect hop is checked the same way.
+    """
+
+    def __init__(self, store: ImageStore, concurrency: int = IMAGE_FETCH_CONCURRENCY,
+                 max_bytes: int = IMAGE_MAX_BYTES, timeout: float = IMAGE_FETCH_TIMEOUT_SECONDS,
+                 retry_seconds: float = IMAGE_RETRY_SECONDS, allowed_hosts: Iterable[str] = IMAGE_ALLOWED_HOSTS,
+                 max_redirects: int = IMAGE_MAX_REDIRECTS):
+        self.store = store
+        self.allowed_hosts: List[str] = list(allowed_hosts)
+        self.max_redirects = max_redirects
+        self.concurrency = concurrency
+        self.max_bytes = max_bytes
+        self.timeout = timeout
+        self.retry_seconds = retry_seconds
+        self._queue: Optional[asyncio.Queue] = None
+        self._pending: Set[str] = set()
+        self._failed: Dict[str, float] = {}
+        self._workers = []
+        self._session = None
+
+    def start(self):
+        self._queue = asyncio.Queue()
+        self._workers = [asyncio.create_task(self._worker()) for _ in range(self.concurrency)]
+
+    async def close(self):
+        for worker in self._workers:
+            worker.cancel()
+        self._workers = []
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    def enqueue(self, urls: Iterable[str]):
+        """Schedule downloads for gift image URLs (no-op before start())"""
+        if self._queue is None:
+            return
+        now = time.monotonic()
+        for url in urls:
+            if not url or url in self._pending:
+                continue
+            try:
+                check_image_url(url, self.allowed_hosts)
+            except ForbiddenImageURL as e:
+                logger.warning(f"Skipping gift image: {e}")
+                continue
+            if now - self._failed.get(url, -self.retry_seconds) < self.retry_seconds:
+                continue
+            self._pending.add(url)
+            self._queue.put_nowait(url)
+
+    async def _worker(self):
+        while True:
+            url = await self._queue.get()
+            try:
+                await self.process(url)
+                self._failed.pop(url, None)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self._failed[url] = time.monotonic()
+                logger.warning(f"Error caching image {url}: {e}")
+            finally:
+                self._pending.discard(url)
+                self._queue.task_done()
+
+    async def download(self, url: str) -> bytes:
+        import aiohttp
+
+        if self._session is None:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(resolver=_public_resolver()),
+                timeout=aiohttp.ClientTimeout(total=self.timeout)
+            )
+        # Redirects are followed by hand so each hop goes through the same checks
+        for _ in range(self.max_redirects + 1):
+            check_image_url(url, self.allowed_hosts)
+            async with self._session.get(url, allow_redirects=False) as response:
+                if response.status in (301, 302, 303, 307, 308) and "Location" in response.headers:
+                    url = urljoin(url, response.headers["Location"])
+                    continue
+                response.raise_for_status()
+                if (response.content_length or 0) > self.max_bytes:
+                    raise ValueError(f"Image larger than {self.max_bytes} bytes")
+                # content.read(n) returns what is buffered so far, not n bytes: read to EOF
+                chunks, size = [], 0
+                async for chunk in response.content.iter_chunked(64 * 1024):
+                    size += len(chunk)
+                    if size > self.max_bytes:
+                        raise ValueError(f"Image larger than {self.max_bytes} bytes")
+                    chunks.append(chunk)
+            return b"".join(chunks)
+        raise ValueError(f"Too many redirects ({self.max_redirects})")
+
+    async def process(self, url: str):
+        """Make sure every gift with this image URL points at a cached copy"""
+        missing = Gift.image_hash.is_(None)
+        async with AsyncSessionLocal() as db:
+            owners = (await db.execute(
+                select(Gift.telegram_id).where(Gift.gift_image_url == url, missing).distinct()
+            )).scalars().all()
+            if not owners:
+                return
+
+            image_hash = await db.scalar(select(Gift.image_hash).where(
+                Gift.gift_image_url == url,
+                Gift.image_hash.is_not(None)
+            ).limit(1))
+        if image_hash is None or self.store.resolve(image_hash) is None:
+            data = await self.download(url)
+            image_hash = await asyncio.to_thread(self.store.store, data)
+
+        async with db_writer.session() as db:
+            await db.execute(
+                update(Gift)
+                .where(Gift.gift_image_url == url, or_(missing, Gift.image_hash != image_hash))
+                .values(image_hash=image_hash)
+                .execution_options(synchronize_session=False)
+            )
+            await db.commit()
+        response_cache.invalidate("gifts", *owners)
+        read_router.note_write(*owners)
+
+def _read_range(path: str, start: int, length: int) -> bytes:
+    with open(path, "rb") as f:
+        f.seek(start)
+        return f.read(length)
+
+def _parse_range(header: str, file_size: int) -> Optional[Tuple[int, int]]:
+    """Parse a single "bytes=start-end" range, returns (start, end) inclusive"""
+    unit, _, spec = header.partition("=")
+    if unit.strip() != "bytes" or "," in spec:
+        return None
+    first, _, last = spec.strip().partition("-")
+    if first:
+        start = int(first)
+        end = int(last) if last else file_size - 1
+    elif last:
+        start = max(0, file_size - int(last))  # Suffix range: the last N bytes
+        end = file_size - 1
+    else:
+        return None
+    end = min(end, file_size - 1)
+    return (start, end) if start <= end else None
+
+async def image_response(request: Request, store: ImageStore, image_hash: str, size: Optional[int]) -> Response:
+    """Serve a cached image with immutable caching, ETag and Range support"""
+    if not HASH_PATTERN.match(image_hash):
+        raise HTTPException(status_code=404, detail="Image not found")
+    path = store.resolve(image_hash, size)
+    if path is None:
+        raise HTTPException(status_code=404, detail="Image not found")
+
+    etag = f'"{os.path.basename(path)}"'
+    headers = dict(CACHE_HEADERS, ETag=etag)
+    if request.headers.get("If-None-Match") == etag:
+        return Response(status_code=304, headers=headers)
+
+    with open(path, "rb") as f:
+        media_type = sniff_content_type(f.read(12))
+
+    range_header = request.headers.get("Range")
+    if range_header:
+        file_size = os.path.getsize(path)
+        try:
+            byte_range = _parse_range(range_header, file_size)
+        except ValueError:
+            byte_range = None
+        if byte_range is None:
+            return Response(status_code=416, headers=dict(headers, **{"Content-Range": f"bytes */{file_size}"}))
+        start, end = byte_range
+        body = await asyncio.to_thread(_read_range, path, start, end - start + 1)
+        headers["Content-Range"] = f"bytes {start}-{end}/{file_size}"
+        return Response(body, status_code=206, media_type=media_type, headers=headers)
+
+    # Streamed from disk (zero-copy where the server supports it)
+    return FileResponse(path, media_type=media_type, headers=headers)
+
+image_store = ImageStore()
+image_fetcher = ImageFetcher(image_store)
@@ -1,19 +1,50 @@
-from fastapi import FastAPI, Depends, HTTPException, Request
+from fastapi import FastAPI, Depends, HTTPException, Request, Response, BackgroundTasks, Query
 from fastapi.middleware.cors import CORSMiddleware
-from sqlalchemy.orm import Session
-from typing import List, Optional
-import json
+from fastapi.responses import ORJSONResponse, StreamingResponse
+from sqlalchemy import and_, func, or_, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Optional, Tuple
+from datetime import datetime
+import asyncio
+import logging
+import os
 
-from database import get_db, create_tables
-from models import User, Gift, Swipe, Match
-from utils import validate_telegram_webapp_data, extract_user_from_init_data, format_gift_data, format_match_data
-from config import APP_NAME, APP_VERSION
+import orjson
+
+from database import (
+    SessionLocal, async_engine, write_engine, read_engines, db_writer, read_router, get_async_db, get_async_write_db,
+    create_tables
+)
+from models import GIFT_COLUMNS, User, Gift, Swipe, Match
+from utils import verify_init_data, format_gift_data, format_match_data, format_user_data
+from auth import issue_session_token, current_user_id, authorized_user, metrics_client, service_client
+from deck import candidate_queue, refill_in_background
+from sync import diff_sync_gifts, mark_synced
+from matching import backfill_like_edges
+from quota import swipe_quota
+from features import refresh_features_batch
+from cache import response_cache
+from images import image_fetcher, image_response, image_store
+from metrics import MetricsMiddleware, PROMETHEUS_CONTENT_TYPE, metrics
+from schemas import (
+    BootstrapOut, DeckOut, GiftOut, MatchesPage, SessionOut, SwipeBatchOut, SwipeOut, UserOut, UsersPage
+)
+from swipes import commit_swipes, finish_swipes, swipe_buffer
+from config import (
+    APP_NAME, APP_VERSION, BACKGROUND_JOBS, SESSION_TTL_SECONDS, FEATURE_REFRESH_SECONDS, FEATURE_REFRESH_BATCH, DECK_SIZE, DECK_MAX_SIZE, USERS_PAGE_SIZE, USERS_MAX_PAGE_SIZE,
+    MATCHES_PAGE_SIZE, MATCHES_MAX_PAGE_SIZE, MAX_SWIPES_PER_BATCH, SWIPE_WRITE_BEHIND, METRICS_ENABLED,
+    API_HEARTBEAT_PATH, HEALTH_CHECK_INTERVAL_SECONDS
+)
+
+logger = logging.getLogger(__name__)
 
 # Create FastAPI app
 app = FastAPI(
     title=APP_NAME,
     version=APP_VERSION,
-    description="Gift Tinder API - Telegram Mini App Backend"
+    description="Gift Tinder API - Telegram Mini App Backend",
+    default_response_class=ORJSONResponse
 )
 
 # Add CORS middleware
@@ -25,69 +56,221 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Per-route latency, SQL statement counts and DB time, exported on /metrics
+if METRICS_ENABLED:
+    app.add_middleware(MetricsMiddleware)
+
+async def refresh_features_task():
+    """Fold new swipes into the ranking feature tables periodically"""
+    while True:
+        try:
+            # One writer transaction per batch: swipes queued behind a long
+            # backlog get the writer between batches (the lock is FIFO)
+            while True:
+                async with db_writer.session() as db:
+                    processed = await db.run_sync(refresh_features_batch)
+                if processed < FEATURE_REFRESH_BATCH:
+                    break
+        except Exception as e:
+            logger.error(f"Error refreshing ranking features: {e}")
+        await asyncio.sleep(FEATURE_REFRESH_SECONDS)
+
+async def heartbeat_task():
+    """Touch API_HEARTBEAT_PATH while the event loop keeps running (watched by run.py)"""
+    while True:
+        try:
+            with open(API_HEARTBEAT_PATH, "a"):
+                os.utime(API_HEARTBEAT_PATH)
+        except OSError as e:
+            logger.error(f"Error updating heartbeat file: {e}")
+        await asyncio.sleep(HEALTH_CHECK_INTERVAL_SECONDS / 2)
+
 # Create tables on startup
 @app.on_event("startup")
 async def startup_event():
     create_tables()
+    
+    db = SessionLocal()
+    try:
+        # Build the like-edge index for databases created before it existed
+        backfill_like_edges(db)
+        
+        # Restore today's swipe counters
+        swipe_quota.rebuild(db)
+    finally:
+        db.close()
+    
+    # Background jobs run in one worker when the API has several
+    if BACKGROUND_JOBS:
+        app.state.feature_refresher = asyncio.create_task(refresh_features_task())
+    if API_HEARTBEAT_PATH:
+        app.state.heartbeat = asyncio.create_task(heartbeat_task())
+    image_fetcher.start()
+
+# Close pooled connections on shutdown
+@app.on_event("shutdown")
+async def shutdown_event():
+    if BACKGROUND_JOBS:
+        app.state.feature_refresher.cancel()
+    if API_HEARTBEAT_PATH:
+        app.state.heartbeat.cancel()
+    await image_fetcher.close()
+    await swipe_buffer.flush()
+    
+    await async_engine.dispose()
+    if write_engine is not async_engine:
+        await write_engine.dispose()
+    for read_engine in read_engines:
+        await read_engine.dispose()
 
 @app.get("/")
 async def root():
     return {"message": "Gift Tinder API", "version": APP_VERSION}
 
-@app.get("/api/user/{telegram_id}")
-async def get_user(telegram_id: int, db: Session = Depends(get_db)):
-    """Get user by Telegram ID"""
-    user = db.query(User).filter(User.telegram_id == telegram_id).first()
+@app.get("/health", include_in_schema=False)
+async def health(db: AsyncSession = Depends(get_async_db)):
+    """Liveness and database check for run.py and load balancers"""
+    try:
+        await db.execute(select(1))
+    except Exception as e:
+        logger.error(f"Health check failed: {e}")
+        raise HTTPException(status_code=503, detail="Database unavailable")
+    return {"status": "ok"}
+
+@app.get("/metrics", include_in_schema=False, dependencies=[Depends(metrics_client)])
+async def get_metrics():
+    """Prometheus scrape endpoint (metrics of this worker process)"""
+    if not METRICS_ENABLED:
+        raise HTTPException(status_code=404, detail="Not Found")
+    return Response(metrics.render(), media_type=PROMETHEUS_CONTENT_TYPE)
+
+async def _load_user(db: AsyncSession, telegram_id: int) -> dict:
+    user = (await db.execute(select(
+        User.id,
+        User.telegram_id,
+        User.username,
+        User.first_name,
+        User.last_name,
+        User.created_at,
+        User.is_active
+    ).where(User.telegram_id == telegram_id))).first()
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     
-    return {
-        "id": user.id,
-        "telegram_id": user.telegram_id,
-        "username": user.username,
-        "first_name": user.first_name,
-        "last_name": user.last_name,
-        "created_at": user.created_at,
-        "is_active": user.is_active
-    }
+    return user._asdict()
+
+async def _load_gifts(db: AsyncSession, telegram_id: int) -> List[dict]:
+    gifts = await db.execute(select(*GIFT_COLUMNS).where(
+        Gift.telegram_id == telegram_id,
+        Gift.is_visible == True
+    ))
+    
+    return [format_gift_data(gift._mapping) for gift in gifts]
+
+async def _load_matches(db: AsyncSession, telegram_id: int, after_id: int, limit: int,
+                        since: Optional[datetime] = None) -> dict:
+    """One page of a user's matches with the other user's info (one joined query)"""
+    query = select(
+        Match.id,
+        Match.created_at,
+        User.telegram_id,
+        User.username,
+        User.first_name,
+        User.last_name
+    ).join(User, or_(
+        and_(Match.user1_id == telegram_id, User.telegram_id == Match.user2_id),
+        and_(Match.user2_id == telegram_id, User.telegram_id == Match.user1_id)
+    )).where(
+        Match.is_active == True,
+        Match.id > after_id
+    )
+    
+    if since is not None:
+        query = query.where(Match.created_at > since)
+    
+    rows = (await db.execute(query.order_by(Match.id).limit(limit))).all()
+    
+    result = [
+        {
+            "match_id": row.id,
+            "other_user": {
+                "telegram_id": row.telegram_id,
+                "username": row.username,
+                "first_name": row.first_name,
+                "last_name": row.last_name
+            },
+            "created_at": row.created_at
+        }
+        for row in rows
+    ]
+    next_cursor = rows[-1].id if len(rows) == limit else None
+    
+    return {"matches": result, "next_cursor": next_cursor}
+
+async def _deck_batch(db: AsyncSession, background_tasks: BackgroundTasks, telegram_id: int, size: int) -> List[dict]:
+    # Fill the queue inline only when it cannot serve this request
+    if candidate_queue.needs_refill(telegram_id, size):
+        await db.run_sync(candidate_queue.refill, telegram_id)
+
+    gifts = candidate_queue.peek(telegram_id, size)
 
-@app.post("/api/user")
-async def create_user(request: Request, db: Session = Depends(get_db)):
+    # Top up in the background so the next request is served from memory
+    if candidate_queue.needs_refill(telegram_id):
+        background_tasks.add_task(refill_in_background, telegram_id)
+
+    return gifts
+
+@app.get("/api/user/{telegram_id}", response_model=UserOut)
+async def get_user(request: Request, telegram_id: int = Depends(authorized_user), db: AsyncSession = Depends(get_async_db)):
+    """Get user by Telegram ID"""
+    return await response_cache.respond(request, "user", telegram_id, lambda: _load_user(db, telegram_id))
+
+@app.post("/api/user", response_model=SessionOut)
+async def create_user(request: Request, db: AsyncSession = Depends(get_async_write_db)):
     """Create or update user"""
-    # Validate Telegram WebApp data
-    init_data = request.headers.get("X-Telegram-Init-Data", "")
-    if not validate_telegram_webapp_data(init_data):
+    # Validate Telegram WebApp data (signature, freshness) and parse it once
+    init_data = verify_init_data(request.headers.get("X-Telegram-Init-Data", ""))
+    if not init_data:
         raise HTTPException(status_code=401, detail="Invalid Telegram data")
     
-    # Extract user data
-    user_data = extract_user_from_init_data(init_data)
-    if not user_data:
-        raise HTTPException(status_code=400, detail="Invalid user data")
+    user_data = init_data.user
     
     telegram_id = user_data.get("id")
     if not telegram_id:
         raise HTTPException(status_code=400, detail="Missing user ID")
     
     # Check if user exists
-    user = db.query(User).filter(User.telegram_id == telegram_id).first()
+    user = await db.scalar(select(User).where(User.telegram_id == telegram_id))
     
+    partners = []
     if user:
         # Update existing user
-        user.username = user_data.get("username")
-        user.first_name = user_data.get("first_name")
-        user.last_name = user_data.get("last_name")
+        names = (user_data.get("username"), user_data.get("first_name"), user_data.get("last_name"))
+        if names != (user.username, user.first_name, user.last_name):
+            # Partners' cached match lists show these names
+            partners = (await db.execute(
+                select(Match.user2_id).where(Match.user1_id == telegram_id).union_all(
+                    select(Match.user1_id).where(Match.user2_id == telegram_id)
+                )
+            )).scalars().all()
+        user.username, user.first_name, user.last_name = names
+        user.last_active_at = datetime.utcnow()
     else:
         # Create new user
         user = User(
             telegram_id=telegram_id,
             username=user_data.get("username"),
             first_name=user_data.get("first_name"),
-            last_name=user_data.get("last_name")
+            last_name=user_data.get("last_name"),
+            last_active_at=datetime.utcnow()
         )
         db.add(user)
     
-    db.commit()
-    db.refresh(user)
+    await db.commit()
+    await db.refresh(user)
+    response_cache.invalidate("user", telegram_id)
+    response_cache.invalidate("matches", *partners)
+    read_router.note_write(telegram_id, *partners)
     
     return {
         "id": user.id,
@@ -96,133 +279,294 @@ async def create_user(request: Request, db: Session = Depends(get_db)):
         "first_name": user.first_name,
         "last_name": user.last_name,
         "created_at": user.created_at,
-        "is_active": user.is_active
+        "is_active": user.is_active,
+        # Sent as "Authorization: Bearer <token>" to every other route
+        "session_token": issue_session_token(user.telegram_id),
+        "expires_in": SESSION_TTL_SECONDS
     }
 
-@app.get("/api/gifts/{telegram_id}")
-async def get_user_gifts(telegram_id: int, db: Session = Depends(get_db)):
-    """Get all gifts for a user"""
-    gifts = db.query(Gift).filter(
-        Gift.telegram_id == telegram_id,
-        Gift.is_visible == True
-    ).all()
+USER_LISTING_COLUMNS = (
+    User.id,
+    User.telegram_id,
+    User.username,
+    User.first_name,
+    User.last_name,
+    User.is_active,
+    User.updated_at,
+    User.last_active_at,
+    User.last_synced_at
+)
+
+async def _users_page(db: AsyncSession, after_id: int, limit: int, updated_since: Optional[datetime]) -> List[dict]:
+    """Fetch one keyset page of users ordered by User.id"""
+    query = select(*USER_LISTING_COLUMNS).where(User.id > after_id)
+    
+    if updated_since is not None:
+        query = query.where(User.updated_at >= updated_since)
     
-    return [format_gift_data(gift.__dict__) for gift in gifts]
+    result = await db.execute(query.order_by(User.id).limit(limit))
+    return [format_user_data(row._asdict()) for row in result]
 
-@app.post("/api/sync_gifts/{telegram_id}")
-async def sync_gifts(telegram_id: int, gifts_data: List[dict], db: Session = Depends(get_db)):
-    """Sync gifts for a user (called by userbot)"""
-    # Clear existing gifts for this user
-    db.query(Gift).filter(Gift.telegram_id == telegram_id).delete()
+def _sync_priority_tier(tier: int, started: datetime):
+    """Filter, sort column and direction of one tier of the order=priority listing"""
+    if tier == 0:
+        # Never synced, in signup order
+        return User.last_synced_at.is_(None), User.id, False
+    # Users synced since the listing started are done for this cycle
+    synced_before = User.last_synced_at < started
+    if tier == 1:
+        # Logged in since their last sync, most recently active first
+        return and_(synced_before, User.last_active_at > User.last_synced_at), User.last_active_at, True
+    # Everyone else, longest since their last sync first
+    return and_(synced_before, or_(
+        User.last_active_at.is_(None), User.last_active_at <= User.last_synced_at
+    )), User.last_synced_at, False
+
+SYNC_PRIORITY_TIERS = 3
+
+async def _priority_users_page(db: AsyncSession, tier: int, cursor: Optional[Tuple[object, int]], limit: int,
+                               updated_since: Optional[datetime], started: datetime) -> List[dict]:
+    """Fetch one keyset page of a sync priority tier, after the (sort value, id) cursor"""
+    condition, column, descending = _sync_priority_tier(tier, started)
+    query = select(*USER_LISTING_COLUMNS).where(condition)
+    if cursor is not None:
+        value, user_id = cursor
+        if descending:
+            query = query.where(or_(column < value, and_(column == value, User.id < user_id)))
+        else:
+            query = query.where(or_(column > value, and_(column == value, User.id > user_id)))
     
-    # Add new gifts
-    for gift_data in gifts_data:
-        gift = Gift(
-            telegram_id=telegram_id,
-            gift_id=gift_data.get("id"),
-            gift_name=gift_data.get("name", "Unknown Gift"),
-            gift_description=gift_data.get("description", ""),
-            gift_image_url=gift_data.get("image_url", "")
+    if updated_since is not None:
+        query = query.where(User.updated_at >= updated_since)
+    
+    order = (column.desc(), User.id.desc()) if descending else (column, User.id)
+    result = await db.execute(query.order_by(*order).limit(limit))
+    return [row._asdict() for row in result]
+
+async def _stream_users(after_id: int, page_size: int, updated_since: Optional[datetime], priority: bool = False):
+    """
+    Yield all users as NDJSON, one keyset page in memory at a time. Every
+    page is read in its own short session, so a slow consumer does not
+    keep a transaction (and a pool connection) open for the whole stream.
+    """
+    if not priority:
+        while True:
+            async with read_router.session() as db:
+                page = await _users_page(db, after_id, page_size, updated_since)
+            for user in page:
+                yield orjson.dumps(user) + b"\n"
+            if len(page) < page_size:
+                return
+            after_id = page[-1]["id"]
+
+    started = datetime.utcnow()
+    for tier in range(SYNC_PRIORITY_TIERS):
+        column = _sync_priority_tier(tier, started)[1]
+        cursor = None
+        while True:
+            async with read_router.session() as db:
+                rows = await _priority_users_page(db, tier, cursor, page_size, updated_since, started)
+            for row in rows:
+                yield orjson.dumps(format_user_data(row)) + b"\n"
+            if len(rows) < page_size:
+                break
+            cursor = (rows[-1][column.key], rows[-1]["id"])
+
+@app.get("/api/users", response_model=UsersPage, dependencies=[Depends(service_client)])
+async def list_users(
+    after_id: int = 0,
+    limit: int = Query(USERS_PAGE_SIZE, ge=1, le=USERS_MAX_PAGE_SIZE),
+    updated_since: Optional[datetime] = None,
+    stream: bool = False,
+    order: str = Query("id", pattern="^(id|priority)$"),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """List users page by page (used by userbot)"""
+    if stream:
+        # Whole listing from after_id on (or, with order=priority, never synced
+        # users first, then recently active ones, then the longest unsynced),
+        # limit is the page size of each query
+        return StreamingResponse(
+            _stream_users(after_id, limit, updated_since, priority=order == "priority"),
+            media_type="application/x-ndjson"
+        )
+    if order != "id":
+        raise HTTPException(status_code=400, detail="order=priority requires stream=true")
+    
+    users = await _users_page(db, after_id, limit, updated_since)
+    next_cursor = users[-1]["id"] if len(users) == limit else None
+    
+    return {"users": users, "next_cursor": next_cursor}
+
+@app.get("/api/gifts/{telegram_id}", response_model=List[GiftOut])
+async def get_user_gifts(request: Request, telegram_id: int = Depends(authorized_user), db: AsyncSession = Depends(get_async_db)):
+    """Get all gifts for a user"""
+    return await response_cache.respond(request, "gifts", telegram_id, lambda: _load_gifts(db, telegram_id))
+
+@app.post("/api/sync_gifts", dependencies=[Depends(service_client)])
+async def sync_gifts_bulk(inventories: List[dict], db: AsyncSession = Depends(get_async_write_db)):
+    """Sync gifts for many users in one request (called by userbot)"""
+    results = {}
+    for inventory in inventories:
+        telegram_id = inventory.get("telegram_id")
+        if telegram_id is None:
+            raise HTTPException(status_code=400, detail="Missing user ID")
+        results[telegram_id] = await db.run_sync(
+            diff_sync_gifts, telegram_id, inventory.get("gifts") or []
         )
-        db.add(gift)
+    await db.run_sync(mark_synced, results)
     
-    db.commit()
-    return {"message": f"Synced {len(gifts_data)} gifts"}
+    # One transaction for the whole batch
+    await db.commit()
+    response_cache.invalidate("gifts", *results)
+    read_router.note_write(*results)
+    image_fetcher.enqueue(
+        gift.get("image_url") for inventory in inventories for gift in inventory.get("gifts") or []
+    )
+    
+    return {"message": f"Synced gifts for {len(results)} users", "users": results}
+
+@app.post("/api/sync_gifts/{telegram_id}", dependencies=[Depends(service_client)])
+async def sync_gifts(telegram_id: int, gifts_data: List[dict], db: AsyncSession = Depends(get_async_write_db)):
+    """Sync gifts for a user (called by userbot)"""
+    # Only write what changed since the previous sync
+    counts = await db.run_sync(diff_sync_gifts, telegram_id, gifts_data)
+    await db.run_sync(mark_synced, [telegram_id])
+    await db.commit()
+    response_cache.invalidate("gifts", telegram_id)
+    read_router.note_write(telegram_id)
+    image_fetcher.enqueue(gift.get("image_url") for gift in gifts_data)
+    
+    return {"message": f"Synced {len(gifts_data)} gifts", **counts}
+
+@app.get("/api/images/{image_hash}")
+async def get_image(request: Request, image_hash: str, size: Optional[int] = Query(None, ge=1)):
+    """Cached gift image (thumbnail fitting size when given)"""
+    return await image_response(request, image_store, image_hash, size)
+
+@app.get("/api/deck/{telegram_id}", response_model=DeckOut)
+async def get_deck(
+    background_tasks: BackgroundTasks,
+    telegram_id: int = Depends(authorized_user),
+    size: int = Query(DECK_SIZE, ge=1, le=DECK_MAX_SIZE),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Get a batch of gifts to swipe for a user"""
+    return {"gifts": await _deck_batch(db, background_tasks, telegram_id, size)}
 
 @app.get("/api/next_gift/{telegram_id}")
-async def get_next_gift(telegram_id: int, db: Session = Depends(get_db)):
+async def get_next_gift(background_tasks: BackgroundTasks, telegram_id: int = Depends(authorized_user), db: AsyncSession = Depends(get_async_db)):
     """Get next gift to swipe for a user"""
-    # Get gifts that user hasn't swiped on yet
-    swiped_gift_ids = db.query(Swipe.gift_id).filter(Swipe.user_id == telegram_id).subquery()
-    
-    next_gift = db.query(Gift).filter(
-        Gift.telegram_id != telegram_id,  # Not user's own gifts
-        Gift.is_visible == True,
-        ~Gift.id.in_(swiped_gift_ids)
-    ).first()
+    deck = await get_deck(background_tasks, telegram_id=telegram_id, size=1, db=db)
     
-    if not next_gift:
+    if not deck["gifts"]:
         return {"message": "No more gifts to swipe"}
     
-    return format_gift_data(next_gift.__dict__)
+    return deck["gifts"][0]
+
+# ingest_swipes statuses that fail a single swipe
+SWIPE_ERRORS = {
+    "not_found": (404, "User or gift not found"),
+    "duplicate": (400, "Already swiped on this gift"),
+    "quota_exceeded": (429, "Daily swipe limit reached"),
+}
 
-@app.post("/api/swipe")
-async def swipe_gift(telegram_id: int, gift_id: int, is_like: bool, db: Session = Depends(get_db)):
+@app.post("/api/swipe", response_model=SwipeOut)
+async def swipe_gift(gift_id: int, is_like: bool, telegram_id: int = Depends(current_user_id)):
     """Record a swipe (like/dislike)"""
-    # Check if user exists
-    user = db.query(User).filter(User.telegram_id == telegram_id).first()
-    if not user:
-        raise HTTPException(status_code=404, detail="User not found")
+    swipes = [{"gift_id": gift_id, "is_like": is_like}]
+    if SWIPE_WRITE_BEHIND:
+        # Committed together with other users' swipes
+        result = (await swipe_buffer.submit(telegram_id, swipes))[0]
+    else:
+        async with db_writer.session() as db:
+            try:
+                result = (await commit_swipes(db, telegram_id, swipes))[0]
+            except IntegrityError:
+                # Still conflicting when ingested again
+                raise HTTPException(status_code=409, detail="Swipe conflicts with a concurrent request, retry")
+            await db.run_sync(finish_swipes, telegram_id, [result])
+    
+    if result["status"] in SWIPE_ERRORS:
+        status_code, detail = SWIPE_ERRORS[result["status"]]
+        raise HTTPException(status_code=status_code, detail=detail)
+    
+    return {
+        "message": "Swipe recorded",
+        "is_like": is_like,
+        "is_match": result["is_match"],
+        "swipes_left": swipe_quota.remaining(telegram_id)
+    }
+
+@app.post("/api/swipes", response_model=SwipeBatchOut)
+async def swipe_gifts(
+    swipes: List[dict],
+    telegram_id: int = Depends(current_user_id)
+):
+    """Record an ordered batch of swipes [{"gift_id": ..., "is_like": ...}]"""
+    if len(swipes) > MAX_SWIPES_PER_BATCH:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_SWIPES_PER_BATCH} swipes per batch")
+    
+    if SWIPE_WRITE_BEHIND:
+        # Committed together with other users' swipes
+        results = await swipe_buffer.submit(telegram_id, swipes)
+    else:
+        async with db_writer.session() as db:
+            try:
+                results = await commit_swipes(db, telegram_id, swipes)
+            except IntegrityError:
+                # Still conflicting when ingested again
+                raise HTTPException(status_code=409, detail="Swipes conflict with a concurrent request, retry")
+            await db.run_sync(finish_swipes, telegram_id, results)
     
-    # Check if gift exists
-    gift = db.query(Gift).filter(Gift.id == gift_id).first()
-    if not gift:
-        raise HTTPException(status_code=404, detail="Gift not found")
-    
-    # Check if already swiped
-    existing_swipe = db.query(Swipe).filter(
-        Swipe.user_id == telegram_id,
-        Swipe.gift_id == gift_id
-    ).first()
-    
-    if existing_swipe:
-        raise HTTPException(status_code=400, detail="Already swiped on this gift")
-    
-    # Create swipe
-    swipe = Swipe(
-        user_id=telegram_id,
-        gift_id=gift_id,
-        is_like=is_like
+    return {
+        "results": results,
+        "matches": sum(1 for result in results if result["is_match"]),
+        "swipes_left": swipe_quota.remaining(telegram_id)
+    }
+
+@app.get("/api/matches/{telegram_id}", response_model=MatchesPage)
+async def get_matches(
+    request: Request,
+    telegram_id: int = Depends(authorized_user),
+    after_id: int = 0,
+    limit: int = Query(MATCHES_PAGE_SIZE, ge=1, le=MATCHES_MAX_PAGE_SIZE),
+    since: Optional[datetime] = None,
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Get matches for a user, page by page"""
+    variant = f"{after_id}:{limit}:{since.isoformat() if since else ''}"
+    return await response_cache.respond(
+        request, "matches", telegram_id,
+        lambda: _load_matches(db, telegram_id, after_id, limit, since), variant
     )
-    db.add(swipe)
-    
-    # Check for match if it's a like
-    if is_like:
-        # Check if the gift owner also liked this user's gift
-        gift_owner_swipe = db.query(Swipe).filter(
-            Swipe.user_id == gift.telegram_id,
-            Swipe.gift_id.in_(
-                db.query(Gift.id).filter(Gift.telegram_id == telegram_id)
-            ),
-            Swipe.is_like == True
-        ).first()
-        
-        if gift_owner_swipe:
-            # Create match
-            match = Match(
-                user1_id=telegram_id,
-                user2_id=gift.telegram_id
-            )
-            db.add(match)
-    
-    db.commit()
-    
-    return {"message": "Swipe recorded", "is_like": is_like}
-
-@app.get("/api/matches/{telegram_id}")
-async def get_matches(telegram_id: int, db: Session = Depends(get_db)):
-    """Get all matches for a user"""
-    matches = db.query(Match).filter(
-        (Match.user1_id == telegram_id) | (Match.user2_id == telegram_id),
+
+@app.get("/api/bootstrap/{telegram_id}", response_model=BootstrapOut)
+async def bootstrap(
+    background_tasks: BackgroundTasks,
+    telegram_id: int = Depends(authorized_user),
+    deck_size: int = Query(DECK_SIZE, ge=0, le=DECK_MAX_SIZE),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Everything the Mini App shows on open (profile, gifts, matches, deck) in one round-trip"""
+    user = await _load_user(db, telegram_id)
+    gifts = await _load_gifts(db, telegram_id)
+    matches = await _load_matches(db, telegram_id, 0, MATCHES_PAGE_SIZE)
+    matches_count = await db.scalar(select(func.count(Match.id)).where(
+        or_(Match.user1_id == telegram_id, Match.user2_id == telegram_id),
         Match.is_active == True
-    ).all()
+    ))
+    deck = await _deck_batch(db, background_tasks, telegram_id, deck_size) if deck_size else []
     
-    result = []
-    for match in matches:
-        # Get the other user's info
-        other_user_id = match.user2_id if match.user1_id == telegram_id else match.user1_id
-        other_user = db.query(User).filter(User.telegram_id == other_user_id).first()
-        
-        if other_user:
-            result.append({
-                "match_id": match.id,
-                "other_user": {
-                    "telegram_id": other_user.telegram_id,
-                    "username": other_user.username,
-                    "first_name": other_user.first_name,
-                    "last_name": other_user.last_name
-                },
-                "created_at": match.created_at
-            })
-    
-    return result 
\ No newline at end of file
+    return {
+        "user": user,
+        "gifts": gifts,
+        "matches": matches["matches"],
+        "matches_next_cursor": matches["next_cursor"],
+        "counts": {
+            "gifts": len(gifts),
+            "matches": matches_count,
+            "swipes_left": swipe_quota.remaining(telegram_id)
+        },
+        "deck": deck
+    }
@@ -0,0 +1,101 @@
+from typing import Any, Dict, Tuple
+
+from sqlalchemy import func, insert, select
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from models import Gift, LikeEdge, Match, Swipe
+
+def insert_ignore(db: Session, model, values: Dict[str, Any]) -> bool:
+    """
+    INSERT a row unless it violates a unique constraint.
+
+    Returns True if the row was inserted. Uses ON CONFLICT DO NOTHING where
+    the dialect supports it and a savepoint otherwise, so concurrent
+    callers racing on the same key never fail.
+    """
+    dialect = db.get_bind().dialect.name
+    if dialect in ("sqlite", "postgresql"):
+        dialect_insert = sqlite.insert if dialect == "sqlite" else postgresql.insert
+        result = db.execute(dialect_insert(model).values(**values).on_conflict_do_nothing())
+        return result.rowcount > 0
+
+    try:
+        with db.begin_nested():
+            db.execute(insert(model).values(**values))
+        return True
+    except IntegrityError:
+        return False
+
+def match_pair(user_a: int, user_b: int) -> Tuple[int, int]:
+    """Order a pair of users the way matches are stored"""
+    return (user_a, user_b) if user_a < user_b else (user_b, user_a)
+
+def has_like(db: Session, liker_id: int, owner_id: int) -> bool:
+    """Check whether liker_id liked any gift of owner_id (one unique-index probe)"""
+    return db.execute(
+        select(LikeEdge.id).where(
+            LikeEdge.liker_id == liker_id,
+            LikeEdge.owner_id == owner_id
+        ).limit(1)
+    ).first() is not None
+
+def create_match(db: Session, user_a: int, user_b: int) -> bool:
+    """Create the match for a pair, returns False if it already existed"""
+    user1_id, user2_id = match_pair(user_a, user_b)
+    return insert_ignore(db, Match, {"user1_id": user1_id, "user2_id": user2_id, "is_active": True})
+
+def record_like(db: Session, liker_id: int, owner_id: int) -> bool:
+    """
+    Record a like edge and report whether it created a new match.
+
+    Idempotent: repeated likes between the same users reuse the edge and
+    never create a second match. Does not commit.
+    """
+    if liker_id == owner_id:
+        return False
+
+    insert_ignore(db, LikeEdge, {"liker_id": liker_id, "owner_id": owner_id})
+    if not has_like(db, owner_id, liker_id):
+        return False
+
+    return create_match(db, liker_id, owner_id)
+
+def recheck_match(db: Session, liker_id: int, owner_id: int) -> bool:
+    """
+    Re-run match detection after the like edge was committed.
+
+    Two users liking each other at the same time can each miss the other's
+    uncommitted edge; whichever re-checks last sees both and creates the
+    match. Commits and returns True if a match is created.
+    """
+    if not has_like(db, owner_id, liker_id):
+        return False
+
+    if not create_match(db, liker_id, owner_id):
+        return False
+    db.commit()
+    return True
+
+def backfill_like_edges(db: Session) -> int:
+    """Build like edges from existing swipes if the table is still empty"""
+    if db.query(LikeEdge.id).first() is not None:
+        return 0
+
+    pairs = select(
+        Swipe.user_id,
+        Gift.telegram_id,
+        func.min(Swipe.created_at)
+    ).join(
+        Gift, Gift.id == Swipe.gift_id
+    ).where(
+        Swipe.is_like == True,
+        Swipe.user_id != Gift.telegram_id
+    ).group_by(Swipe.user_id, Gift.telegram_id)
+
+    result = db.execute(
+        insert(LikeEdge).from_select(["liker_id", "owner_id", "created_at"], pairs)
+    )
+    db.commit()
+    return result.rowcount or 0
@@ -0,0 +1,298 @@
+import asyncio
+import bisect
+import contextvars
+import cProfile
+import logging
+import os
+import random
+import re
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+from sqlalchemy import event
+
+from config import (
+    METRICS_SLOW_QUERY_MS,
+    METRICS_PROFILE_SAMPLE_RATE,
+    METRICS_PROFILE_THRESHOLD_MS,
+    METRICS_PROFILE_DIR,
+)
+
+logger = logging.getLogger(__name__)
+
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4"
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 50, 100)
+QUERY_LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0)
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def _format_number(value: float) -> str:
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class Counter:
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values: str, amount: float = 1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for label_values, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.labels, label_values)} {_format_number(value)}")
+        return "\n".join(lines)
+
+class Gauge(Counter):
+    def dec(self, *label_values: str, amount: float = 1):
+        self.inc(*label_values, amount=-amount)
+
+    def render(self) -> str:
+        return super().render().replace(f"# TYPE {self.name} counter", f"# TYPE {self.name} gauge")
+
+class CallbackGauge:
+    """Gauge whose value is read from a function at scrape time"""
+
+    def __init__(self, name: str, documentation: str, read: Callable[[], float]):
+        self.name = name
+        self.documentation = documentation
+        self.read = read
+
+    def render(self) -> str:
+        return "\n".join((
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} gauge",
+            f"{self.name} {_format_number(self.read())}",
+        ))
+
+class Histogram:
+    """Cumulative-bucket histogram in the Prometheus exposition format"""
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.buckets = tuple(sorted(buckets))
+        # label values -> [per-bucket counts (last one is +Inf), sum]
+        self._series: Dict[Tuple[str, ...], list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *label_values: str):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = sorted((label_values, list(counts), total) for label_values, (counts, total) in self._series.items())
+        for label_values, counts, total in series:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else _format_number(bound)
+                labels = _format_labels(self.labels, label_values, 'le="' + le + '"')
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labels, label_values)
+            lines.append(f"{self.name}_sum{labels} {_format_number(total)}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return "\n".join(lines)
+
+class RequestStats:
+    """SQL work done while serving one request"""
+    __slots__ = ("scope", "queries", "db_seconds")
+
+    def __init__(self, scope: dict):
+        self.scope = scope
+        self.queries = 0
+        self.db_seconds = 0.0
+
+# Set by the middleware for the duration of a request; SQLAlchemy runs the
+# async engine's cursor calls in the request's context, so the engine hooks
+# can attribute queries to it.
+_current_request: contextvars.ContextVar[Optional[RequestStats]] = contextvars.ContextVar(
+    "current_request", default=None
+)
+
+def route_template(scope: dict) -> str:
+    """Route path with placeholders ("/api/user/{telegram_id}") to keep label cardinality bounded"""
+    route = scope.get("route")
+    return getattr(route, "path", None) or "unmatched"
+
+class Metrics:
+    """Request and database metrics of this process"""
+
+    def __init__(self, slow_query_ms: float = METRICS_SLOW_QUERY_MS):
+        self.slow_query_seconds = slow_query_ms / 1000
+        self.requests = Histogram(
+            "http_request_duration_seconds", "Request latency by route",
+            ("method", "route", "status")
+        )
+        self.in_progress = Gauge("http_requests_in_progress", "Requests being served")
+        self.request_queries = Histogram(
+            "http_request_db_queries", "SQL statements executed per request",
+            ("method", "route"), QUERY_COUNT_BUCKETS
+        )
+        self.request_db_seconds = Histogram(
+            "http_request_db_duration_seconds", "Time spent in SQL statements per request",
+            ("method", "route")
+        )
+        self.queries = Histogram(
+            "db_query_duration_seconds", "SQL statement latency", (), QUERY_LATENCY_BUCKETS
+        )
+        self.slow_queries = Counter("db_slow_queries_total", "SQL statements slower than the slow-query threshold")
+        self.gauges: List[CallbackGauge] = []
+
+    def gauge(self, name: str, documentation: str, read: Callable[[], float]):
+        """Export a value owned by another component (queue depths and the like)"""
+        self.gauges.append(CallbackGauge(name, documentation, read))
+
+    def observe_request(self, method: str, route: str, status: int, seconds: float, stats: RequestStats):
+        self.requests.observe(seconds, method, route, str(status))
+        self.request_queries.observe(stats.queries, method, route)
+        self.request_db_seconds.observe(stats.db_seconds, method, route)
+
+    def observe_query(self, statement: str, seconds: float):
+        self.queries.observe(seconds)
+        stats = _current_request.get()
+        if stats is not None:
+            stats.queries += 1
+            stats.db_seconds += seconds
+
+        if self.slow_query_seconds and seconds >= self.slow_query_seconds:
+            self.slow_queries.inc()
+            route = route_template(stats.scope) if stats is not None else "-"
+            logger.warning(f"Slow query ({seconds * 1000:.0f} ms, {route}): {' '.join(statement.split())}")
+
+    def render(self) -> str:
+        return "\n".join(metric.render() for metric in (
+            self.requests,
+            self.in_progress,
+            self.request_queries,
+            self.request_db_seconds,
+            self.queries,
+            self.slow_queries,
+            *self.gauges,
+        )) + "\n"
+
+    def instrument_engine(self, engine):
+        """Time every SQL statement executed on a sync engine (or an async engine's sync_engine)"""
+
+        def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+        def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            started = conn.info["query_started"].pop()
+            self.observe_query(statement, time.perf_counter() - started)
+
+        def handle_error(exception_context):
+            started = exception_context.connection.info.get("query_started") if exception_context.connection else None
+            if started:
+                started.pop()
+
+        event.listen(engine, "before_cursor_execute", before_cursor_execute)
+        event.listen(engine, "after_cursor_execute", after_cursor_execute)
+        event.listen(engine, "handle_error", handle_error)
+
+class RequestProfiler:
+    """
+    Runs a sample of requests under cProfile and keeps the profiles of slow ones.
+
+    cProfile sees everything running on the event loop thread, so a
+    profile also contains whatever other requests did meanwhile; only one
+    profile is taken at a time. Load the .prof files with pstats or
+    snakeviz.
+    """
+
+    def __init__(self, sample_rate: float = METRICS_PROFILE_SAMPLE_RATE,
+                 threshold_ms: float = METRICS_PROFILE_THRESHOLD_MS, directory: str = METRICS_PROFILE_DIR):
+        self.sample_rate = sample_rate
+        self.threshold_seconds = threshold_ms / 1000
+        self.directory = directory
+        self._active = False
+
+    def start(self) -> Optional[cProfile.Profile]:
+        if self._active or self.sample_rate <= 0 or random.random() >= self.sample_rate:
+            return None
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:  # Another profiler is already running
+            return None
+        self._active = True
+        return profiler
+
+    async def finish(self, profiler: cProfile.Profile, method: str, route: str, seconds: float):
+        profiler.disable()
+        self._active = False
+        if seconds < self.threshold_seconds:
+            return
+
+        name = re.sub(r"[^A-Za-z0-9]+", "_", f"{method}_{route}").strip("_")
+        path = os.path.join(self.directory, f"{time.strftime('%Y%m%d-%H%M%S')}_{int(seconds * 1000)}ms_{name}.prof")
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            await asyncio.to_thread(profiler.dump_stats, path)
+            logger.warning(f"Slow request {method} {route} ({seconds * 1000:.0f} ms), profile saved to {path}")
+        except OSError as e:
+            logger.error(f"Error saving request profile: {e}")
+
+class MetricsMiddleware:
+    """ASGI middleware recording latency, status and SQL work of every HTTP request"""
+
+    def __init__(self, app, registry: Optional[Metrics] = None, profiler: Optional[RequestProfiler] = None):
+        self.app = app
+        self.metrics = registry if registry is not None else metrics
+        self.profiler = profiler if profiler is not None else request_profiler
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        stats = RequestStats(scope)
+        token = _current_request.set(stats)
+        profiler = self.profiler.start()
+        self.metrics.in_progress.inc()
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            seconds = time.perf_counter() - started
+            self.metrics.in_progress.dec()
+            _current_request.reset(token)
+            route = route_template(scope)
+            self.metrics.observe_request(scope["method"], route, status, seconds, stats)
+            if profiler is not None:
+                await self.profiler.finish(profiler, scope["method"], route, seconds)
+
+metrics = Metrics()
+request_profiler = RequestProfiler()
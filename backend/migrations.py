@@ -0,0 +1,222 @@
+"""
+Versioned schema migrations.
+
+Fresh databases get the full schema from the models and are stamped with
+the latest version; existing databases get every pending migration applied
+in order. Usage:
+
+    python migrations.py upgrade   # apply pending migrations
+    python migrations.py status    # show applied/pending migrations
+    python migrations.py explain   # check that hot queries use an index
+"""
+import sys
+from datetime import datetime
+from typing import Callable, Dict, List, Tuple
+
+from sqlalchemy import (
+    Column, DateTime, Integer, String, Table, and_, exists, inspect, select, text
+)
+from sqlalchemy.engine import Connection, Engine
+
+from database import Base, engine as default_engine
+from models import FeatureWatermark, Gift, GiftFeatures, LikeEdge, Match, Swipe, User, UserFeatures
+
+schema_migrations = Table(
+    "schema_migrations",
+    Base.metadata,
+    Column("version", Integer, primary_key=True),
+    Column("name", String, nullable=False),
+    Column("applied_at", DateTime, default=datetime.utcnow),
+)
+
+def _create_index(conn: Connection, table: Table, name: str):
+    """Create one of the indexes declared on a model if it is missing"""
+    for index in table.indexes:
+        if index.name == name:
+            index.create(conn, checkfirst=True)
+            return
+    raise KeyError(f"Index {name} is not declared on {table.name}")
+
+def _add_users_updated_at(conn: Connection):
+    columns = {column["name"] for column in inspect(conn).get_columns("users")}
+    if "updated_at" not in columns:
+        conn.execute(text("ALTER TABLE users ADD COLUMN updated_at TIMESTAMP"))
+        conn.execute(text("UPDATE users SET updated_at = created_at"))
+    _create_index(conn, User.__table__, "ix_users_updated_at")
+
+def _normalize_matches(conn: Connection):
+    # Store pairs ordered and drop duplicates before making them unique
+    conn.execute(text(
+        "UPDATE matches SET user1_id = user2_id, user2_id = user1_id "
+        "WHERE user1_id > user2_id"
+    ))
+    conn.execute(text(
+        "DELETE FROM matches WHERE id NOT IN "
+        "(SELECT MIN(id) FROM matches GROUP BY user1_id, user2_id)"
+    ))
+    for name in ("uq_matches_pair", "ix_matches_user1_active", "ix_matches_user2_active"):
+        _create_index(conn, Match.__table__, name)
+
+def _swipe_and_gift_indexes(conn: Connection):
+    conn.execute(text(
+        "DELETE FROM swipes WHERE id NOT IN "
+        "(SELECT MIN(id) FROM swipes GROUP BY user_id, gift_id)"
+    ))
+    _create_index(conn, Swipe.__table__, "uq_swipes_user_gift")
+    _create_index(conn, Gift.__table__, "ix_gifts_owner_visible")
+    _create_index(conn, Gift.__table__, "ix_gifts_owner_gift")
+
+def _ranking_feature_tables(conn: Connection):
+    # Filled from scratch by features.refresh_features
+    for model in (GiftFeatures, UserFeatures, FeatureWatermark):
+        model.__table__.create(conn, checkfirst=True)
+
+def _likes_inbound_index(conn: Connection):
+    _create_index(conn, LikeEdge.__table__, "ix_likes_owner_liker")
+
+def _gift_image_hash(conn: Connection):
+    columns = {column["name"] for column in inspect(conn).get_columns("gifts")}
+    if "image_hash" not in columns:
+        conn.execute(text("ALTER TABLE gifts ADD COLUMN image_hash VARCHAR(64)"))
+    _create_index(conn, Gift.__table__, "ix_gifts_image_url")
+
+def _users_sync_priority(conn: Connection):
+    columns = {column["name"] for column in inspect(conn).get_columns("users")}
+    for name in ("last_active_at", "last_synced_at"):
+        if name not in columns:
+            conn.execute(text(f"ALTER TABLE users ADD COLUMN {name} TIMESTAMP"))
+        _create_index(conn, User.__table__, f"ix_users_{name}")
+
+def _rebuild_ranking_features(conn: Connection):
+    # user_features lost likes_received; the tables only hold derived
+    # counters, so recreate them and let the next refresh recount from zero
+    for model in (UserFeatures, GiftFeatures, FeatureWatermark):
+        model.__table__.drop(conn, checkfirst=True)
+    for model in (GiftFeatures, UserFeatures, FeatureWatermark):
+        model.__table__.create(conn)
+
+# (version, name, upgrade function), append only
+MIGRATIONS: List[Tuple[int, str, Callable[[Connection], None]]] = [
+    (1, "add_users_updated_at", _add_users_updated_at),
+    (2, "normalize_matches", _normalize_matches),
+    (3, "swipe_and_gift_indexes", _swipe_and_gift_indexes),
+    (4, "ranking_feature_tables", _ranking_feature_tables),
+    (5, "likes_inbound_index", _likes_inbound_index),
+    (6, "gift_image_hash", _gift_image_hash),
+    (7, "users_sync_priority", _users_sync_priority),
+    (8, "rebuild_ranking_features", _rebuild_ranking_features),
+]
+
+def applied_versions(conn: Connection) -> Dict[int, str]:
+    rows = conn.execute(select(schema_migrations.c.version, schema_migrations.c.name))
+    return {row.version: row.name for row in rows}
+
+def upgrade(engine: Engine = default_engine) -> List[str]:
+    """Bring the database schema up to date, returns applied migration names"""
+    fresh = not inspect(engine).has_table("users")
+
+    # New tables (and all indexes of a fresh database) come from the models
+    Base.metadata.create_all(bind=engine)
+
+    applied = []
+    with engine.begin() as conn:
+        done = applied_versions(conn)
+        for version, name, migrate in MIGRATIONS:
+            if version in done:
+                continue
+            if not fresh:
+                migrate(conn)
+                applied.append(name)
+            conn.execute(schema_migrations.insert().values(version=version, name=name))
+    return applied
+
+def _hot_queries() -> Dict[str, object]:
+    """Representative statements for the queries issued by backend/main.py"""
+    telegram_id, gift_id = 1, 1
+    already_swiped = exists().where(and_(Swipe.user_id == telegram_id, Swipe.gift_id == Gift.id))
+    return {
+        "deck candidates (swipes probe)": select(Gift.id).where(
+            Gift.telegram_id != telegram_id,
+            Gift.is_visible == True,
+            Gift.id > 0,
+            ~already_swiped
+        ).order_by(Gift.id).limit(100),
+        "user gifts": select(Gift.id).where(
+            Gift.telegram_id == telegram_id,
+            Gift.is_visible == True
+        ),
+        "sync diff": select(Gift.id, Gift.gift_id).where(Gift.telegram_id == telegram_id),
+        "duplicate swipe": select(Swipe.id).where(
+            Swipe.user_id == telegram_id,
+            Swipe.gift_id == gift_id
+        ),
+        "like edge": select(LikeEdge.id).where(
+            LikeEdge.liker_id == telegram_id,
+            LikeEdge.owner_id == 2
+        ),
+        "matches as user1": select(Match.id).where(
+            Match.user1_id == telegram_id,
+            Match.is_active == True
+        ),
+        "matches as user2": select(Match.id).where(
+            Match.user2_id == telegram_id,
+            Match.is_active == True
+        ),
+        "users page": select(User.id).where(User.id > 0).order_by(User.id).limit(1000),
+        "user by telegram_id": select(User.id).where(User.telegram_id == telegram_id),
+    }
+
+def _uses_index(dialect: str, plan: str) -> bool:
+    if dialect == "sqlite":
+        return "INDEX" in plan or "PRIMARY KEY" in plan
+    return "Index" in plan
+
+def explain_hot_queries(engine: Engine = default_engine) -> Dict[str, Tuple[bool, str]]:
+    """
+    EXPLAIN every hot query and report whether its plan uses an index.
+
+    Note that Postgres may still prefer sequential scans on tiny tables.
+    """
+    dialect = engine.dialect.name
+    prefix = "EXPLAIN QUERY PLAN " if dialect == "sqlite" else "EXPLAIN "
+    results = {}
+    with engine.connect() as conn:
+        for name, statement in _hot_queries().items():
+            sql = str(statement.compile(engine, compile_kwargs={"literal_binds": True}))
+            rows = conn.execute(text(prefix + sql)).fetchall()
+            plan = "\n".join(str(row[-1]) for row in rows)
+            results[name] = (_uses_index(dialect, plan), plan)
+    return results
+
+def main(argv: List[str]) -> int:
+    command = argv[1] if len(argv) > 1 else "upgrade"
+
+    if command == "upgrade":
+        applied = upgrade()
+        print(f"Applied: {', '.join(applied) if applied else 'nothing to do'}")
+        return 0
+
+    if command == "status":
+        has_table = inspect(default_engine).has_table("schema_migrations")
+        done = {}
+        if has_table:
+            with default_engine.connect() as conn:
+                done = applied_versions(conn)
+        for version, name, _ in MIGRATIONS:
+            print(f"{version:>4} {name:<30} {'applied' if version in done else 'pending'}")
+        return 0
+
+    if command == "explain":
+        failed = 0
+        for name, (uses_index, plan) in explain_hot_queries().items():
+            print(f"{'OK  ' if uses_index else 'SCAN'} {name}")
+            if not uses_index:
+                failed += 1
+                print("     " + plan.replace("\n", "\n     "))
+        return 1 if failed else 0
+
+    print(__doc__)
+    return 2
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
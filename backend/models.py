@@ -1,9 +1,7 @@
-from sqlalchemy import Column, Integer, String, DateTime, Boolean, ForeignKey, Text
-from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy import Column, Integer, String, DateTime, Boolean, ForeignKey, Text, Index
 from sqlalchemy.orm import relationship
 from datetime import datetime
-
-Base = declarative_base()
+from database import Base
 
 class User(Base):
     __tablename__ = "users"
@@ -14,7 +12,11 @@ class User(Base):
     first_name = Column(String, nullable=True)
     last_name = Column(String, nullable=True)
     created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)
     is_active = Column(Boolean, default=True)
+    # Sync priority of the userbot listing (order=priority)
+    last_active_at = Column(DateTime, nullable=True, index=True)  # Last login to the web app
+    last_synced_at = Column(DateTime, nullable=True, index=True)  # Last gift push from the userbot
     
     # Relationships
     gifts = relationship("Gift", back_populates="user")
@@ -24,6 +26,12 @@ class User(Base):
 
 class Gift(Base):
     __tablename__ = "gifts"
+    __table_args__ = (
+        # Own/visible gifts lookups and the per-user sync diff
+        Index("ix_gifts_owner_visible", "telegram_id", "is_visible"),
+        Index("ix_gifts_owner_gift", "telegram_id", "gift_id"),
+        Index("ix_gifts_image_url", "gift_image_url"),  # Image cache lookups by source URL
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     telegram_id = Column(Integer, ForeignKey("users.telegram_id"))
@@ -31,6 +39,7 @@ class Gift(Base):
     gift_name = Column(String)
     gift_description = Column(Text, nullable=True)
     gift_image_url = Column(String, nullable=True)
+    image_hash = Column(String(64), nullable=True)  # Cached copy of gift_image_url (see images.py)
     is_visible = Column(Boolean, default=True)
     created_at = Column(DateTime, default=datetime.utcnow)
     
@@ -40,6 +49,10 @@ class Gift(Base):
 
 class Swipe(Base):
     __tablename__ = "swipes"
+    __table_args__ = (
+        # One swipe per user and gift; also serves the "already swiped" probe
+        Index("uq_swipes_user_gift", "user_id", "gift_id", unique=True),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.telegram_id"))
@@ -51,8 +64,27 @@ class Swipe(Base):
     user = relationship("User", back_populates="swipes")
     gift = relationship("Gift", back_populates="swipes")
 
+class LikeEdge(Base):
+    """User-to-user like: liker liked at least one of owner's gifts"""
+    __tablename__ = "likes"
+    __table_args__ = (
+        Index("uq_likes_liker_owner", "liker_id", "owner_id", unique=True),
+        Index("ix_likes_owner_liker", "owner_id", "liker_id"),  # Inbound "likes me" lookups
+    )
+    
+    id = Column(Integer, primary_key=True, index=True)
+    liker_id = Column(Integer, ForeignKey("users.telegram_id"), nullable=False)
+    owner_id = Column(Integer, ForeignKey("users.telegram_id"), nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
 class Match(Base):
     __tablename__ = "matches"
+    __table_args__ = (
+        # Pairs are stored ordered (user1_id < user2_id)
+        Index("uq_matches_pair", "user1_id", "user2_id", unique=True),
+        Index("ix_matches_user1_active", "user1_id", "is_active"),
+        Index("ix_matches_user2_active", "user2_id", "is_active"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     user1_id = Column(Integer, ForeignKey("users.telegram_id"))
@@ -62,4 +94,40 @@ class Match(Base):
     
     # Relationships
     user1 = relationship("User", back_populates="matches", foreign_keys=[user1_id])
-    user2 = relationship("User", back_populates="matches2", foreign_keys=[user2_id]) 
\ No newline at end of file
+    user2 = relationship("User", back_populates="matches2", foreign_keys=[user2_id]) 
+
+class GiftFeatures(Base):
+    """Per-gift ranking features, refreshed incrementally from swipes"""
+    __tablename__ = "gift_features"
+    
+    gift_id = Column(Integer, ForeignKey("gifts.id"), primary_key=True)
+    likes = Column(Integer, nullable=False, default=0)
+    swipes = Column(Integer, nullable=False, default=0)
+
+class UserFeatures(Base):
+    """Per-user ranking features, refreshed incrementally from swipes"""
+    __tablename__ = "user_features"
+    
+    telegram_id = Column(Integer, ForeignKey("users.telegram_id"), primary_key=True)
+    likes_given = Column(Integer, nullable=False, default=0)
+    swipes_given = Column(Integer, nullable=False, default=0)
+    swipes_received = Column(Integer, nullable=False, default=0)
+
+class FeatureWatermark(Base):
+    """Last Swipe.id folded into the feature tables"""
+    __tablename__ = "feature_watermarks"
+    
+    name = Column(String, primary_key=True)
+    last_swipe_id = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+# Columns behind utils.format_gift_data, for selects that skip ORM hydration
+GIFT_COLUMNS = (
+    Gift.id,
+    Gift.gift_name,
+    Gift.gift_description,
+    Gift.gift_image_url,
+    Gift.telegram_id,
+    Gift.created_at,
+    Gift.image_hash
+)
@@ -0,0 +1,223 @@
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from typing import Dict, Optional, Tuple
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from models import Swipe
+from config import MAX_SWIPES_PER_DAY, QUOTA_STORE_PATH, SQLITE_BUSY_TIMEOUT_MS
+
+class MemoryQuotaStore:
+    """
+    In-process counter store: key -> (window index, current count, previous count).
+
+    Any object with the same transaction/get/add/set/prune methods (such
+    as SQLiteQuotaStore below, or one backed by Redis INCR on "key:window"
+    with an expiry) can be plugged into SlidingWindowQuota to share
+    counters between workers.
+    """
+
+    def __init__(self):
+        self._counters: Dict[int, Tuple[int, int, int]] = {}
+        self._lock = threading.RLock()
+
+    def transaction(self):
+        """Make a get followed by an add atomic"""
+        return self._lock
+
+    def _roll(self, key: int, window: int) -> Tuple[int, int, int]:
+        # Caller must hold self._lock
+        start, current, previous = self._counters.get(key, (window, 0, 0))
+        if start == window:
+            return start, current, previous
+        if start == window - 1:
+            return window, 0, current
+        return window, 0, 0
+
+    def get(self, key: int, window: int) -> Tuple[int, int]:
+        """Return (current window count, previous window count)"""
+        with self._lock:
+            _, current, previous = self._roll(key, window)
+            return current, previous
+
+    def add(self, key: int, window: int, amount: int, previous_amount: int = 0):
+        with self._lock:
+            start, current, previous = self._roll(key, window)
+            self._counters[key] = (start, current + amount, previous + previous_amount)
+
+    def set(self, key: int, window: int, current: int, previous: int):
+        with self._lock:
+            self._counters[key] = (window, current, previous)
+
+    def prune(self, window: int):
+        """Drop counters that can no longer affect the estimate"""
+        with self._lock:
+            stale = [key for key, (start, _, _) in self._counters.items() if start < window - 1]
+            for key in stale:
+                del self._counters[key]
+
+class SQLiteQuotaStore:
+    """
+    Counters in a SQLite file, shared by the API worker processes of one host.
+
+    Rows are (key, period, count) for the current and previous window;
+    transaction() holds the file's write lock so a check-and-add is atomic
+    across processes. Counters can always be rebuilt from the swipes
+    table, so commits are not fsynced.
+    """
+
+    def __init__(self, path: str, busy_timeout_ms: int = SQLITE_BUSY_TIMEOUT_MS):
+        self._conn = sqlite3.connect(
+            path, timeout=busy_timeout_ms / 1000, isolation_level=None, check_same_thread=False
+        )
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=OFF")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS quota_counters ("
+            "key INTEGER NOT NULL, period INTEGER NOT NULL, count INTEGER NOT NULL, "
+            "PRIMARY KEY (key, period))"
+        )
+        self._lock = threading.RLock()
+        self._depth = 0
+
+    @contextmanager
+    def transaction(self):
+        with self._lock:
+            if self._depth:
+                yield
+                return
+            self._depth += 1
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            finally:
+                self._depth -= 1
+
+    def _increment(self, key: int, period: int, amount: int):
+        self._conn.execute(
+            "INSERT INTO quota_counters (key, period, count) VALUES (?, ?, ?) "
+            "ON CONFLICT (key, period) DO UPDATE SET count = count + excluded.count",
+            (key, period, amount)
+        )
+
+    def get(self, key: int, window: int) -> Tuple[int, int]:
+        """Return (current window count, previous window count)"""
+        with self._lock:
+            counts = dict(self._conn.execute(
+                "SELECT period, count FROM quota_counters WHERE key = ? AND period IN (?, ?)",
+                (key, window, window - 1)
+            ).fetchall())
+        return counts.get(window, 0), counts.get(window - 1, 0)
+
+    def add(self, key: int, window: int, amount: int, previous_amount: int = 0):
+        with self.transaction():
+            if amount:
+                self._increment(key, window, amount)
+            if previous_amount:
+                self._increment(key, window - 1, previous_amount)
+
+    def set(self, key: int, window: int, current: int, previous: int):
+        with self.transaction():
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO quota_counters (key, period, count) VALUES (?, ?, ?)",
+                ((key, window, current), (key, window - 1, previous))
+            )
+
+    def prune(self, window: int):
+        """Drop counters that can no longer affect the estimate"""
+        with self.transaction():
+            self._conn.execute("DELETE FROM quota_counters WHERE period < ?", (window - 1,))
+
+class SlidingWindowQuota:
+    """
+    Per-user sliding-window rate limit in O(1) per check.
+
+    Uses the sliding window counter approximation: the count of the
+    current fixed window plus the previous window's count weighted by how
+    much of it still overlaps the sliding window.
+    """
+
+    def __init__(self, limit: int, window_seconds: int, store=None, prune_every: int = 10000):
+        self.limit = limit
+        self.window_seconds = window_seconds
+        self.store = store if store is not None else MemoryQuotaStore()
+        self.prune_every = prune_every
+        self._operations = 0
+
+    def _position(self, now: Optional[float]) -> Tuple[int, float]:
+        now = time.time() if now is None else now
+        window, offset = divmod(now, self.window_seconds)
+        return int(window), offset / self.window_seconds
+
+    def used(self, key: int, now: Optional[float] = None) -> float:
+        """Estimated number of hits inside the sliding window"""
+        window, elapsed = self._position(now)
+        current, previous = self.store.get(key, window)
+        return current + previous * (1 - elapsed)
+
+    def remaining(self, key: int, now: Optional[float] = None) -> int:
+        return max(0, int(self.limit - self.used(key, now)))
+
+    def try_acquire(self, key: int, amount: int = 1, now: Optional[float] = None) -> bool:
+        """Count amount hits if they fit in the quota, returns False otherwise"""
+        window, elapsed = self._position(now)
+        with self.store.transaction():
+            current, previous = self.store.get(key, window)
+            if current + previous * (1 - elapsed) + amount > self.limit:
+                return False
+            self.store.add(key, window, amount)
+
+        self._operations += 1
+        if self._operations % self.prune_every == 0:
+            self.store.prune(window)
+        return True
+
+    def release(self, key: int, amount: int = 1, now: Optional[float] = None):
+        """Give back hits whose action did not happen"""
+        window, _ = self._position(now)
+        self.store.add(key, window, -amount)
+
+    def rebuild(self, db: Session, now: Optional[float] = None) -> int:
+        """
+        Load counters from the swipes table, returns the number of users loaded
+
+        Counters are overwritten rather than added to, so every worker
+        sharing a store can rebuild it on startup.
+        """
+        window, _ = self._position(now)
+        current_start = datetime.utcfromtimestamp(window * self.window_seconds)
+        previous_start = current_start - timedelta(seconds=self.window_seconds)
+
+        in_current = (Swipe.created_at >= current_start).label("in_current")
+        rows = db.query(
+            Swipe.user_id,
+            in_current,
+            func.count(Swipe.id)
+        ).filter(
+            Swipe.created_at >= previous_start
+        ).group_by(Swipe.user_id, in_current).all()
+
+        counts: Dict[int, Tuple[int, int]] = {}
+        for user_id, is_current, count in rows:
+            current, previous = counts.get(user_id, (0, 0))
+            counts[user_id] = (current + count, previous) if is_current else (current, previous + count)
+
+        with self.store.transaction():
+            for user_id, (current, previous) in counts.items():
+                self.store.set(user_id, window, current, previous)
+        return len(counts)
+
+# Daily swipe limit (config.MAX_SWIPES_PER_DAY), shared between API workers
+# through QUOTA_STORE_PATH when run.py starts several
+swipe_quota = SlidingWindowQuota(
+    MAX_SWIPES_PER_DAY, 24 * 60 * 60,
+    store=SQLiteQuotaStore(QUOTA_STORE_PATH) if QUOTA_STORE_PATH else None
+)
@@ -0,0 +1,186 @@
+import math
+from datetime import datetime, timedelta
+from itertools import repeat
+from operator import sub
+from typing import Dict, List, Optional, Sequence
+
+from sqlalchemy import Row, and_, exists, func, select
+from sqlalchemy.orm import Session
+
+from models import GIFT_COLUMNS, Gift, GiftFeatures, Match, Swipe, UserFeatures
+
+try:
+    import numpy as np
+except ImportError:  # Scoring falls back to pure Python
+    np = None
+
+# Order of the columns in the feature matrix
+FEATURES = (
+    "recency",            # exp(-age / half-life), newer gifts first
+    "like_rate",          # smoothed share of likes the gift received
+    "owner_reciprocity",  # smoothed share of likes the owner gives when swiping
+    "owner_exposure",     # log1p(swipes the owner's gifts already received)
+    "liked_by_matches",   # log1p(likes on the gift from the viewer's matches)
+)
+
+DEFAULT_WEIGHTS = {
+    "recency": 1.0,
+    "like_rate": 1.5,
+    "owner_reciprocity": 2.0,
+    "owner_exposure": -0.3,  # Balance exposure away from already popular owners
+    "liked_by_matches": 1.0,
+}
+
+# Beta prior for the smoothed rates
+PRIOR_LIKES = 1.0
+PRIOR_SWIPES = 2.0
+
+RECENCY_HALF_LIFE_HOURS = 72.0
+
+def score_features(matrix, weights: Sequence[float]):
+    """
+    Score a (candidates x features) matrix, returns one score per row.
+
+    Uses a single matrix-vector product when NumPy is available.
+    """
+    if np is not None:
+        return np.asarray(matrix, dtype=np.float64) @ np.asarray(weights, dtype=np.float64)
+    return [sum(value * weight for value, weight in zip(row, weights)) for row in matrix]
+
+def top_k(scores, k: int) -> List[int]:
+    """Indices of the k highest scores, best first"""
+    n = len(scores)
+    if k >= n:
+        k = n
+    if k == 0:
+        return []
+    if np is not None:
+        scores = np.asarray(scores)
+        if k < n:
+            # Partial selection is O(n), only the top k get sorted
+            candidates = np.argpartition(-scores, k - 1)[:k]
+        else:
+            candidates = np.arange(n)
+        return candidates[np.argsort(-scores[candidates], kind="stable")].tolist()
+    return sorted(range(n), key=lambda i: -scores[i])[:k]
+
+class FeatureRanker:
+    """
+    Ranks swipe candidates by a weighted sum of precomputed features.
+
+    Gift and owner features come from the gift_features/user_features
+    tables (see features.refresh_features) joined into the candidate
+    query, so ranking costs one extra query for the viewer's matches plus
+    a vectorized scoring pass.
+    """
+
+    def __init__(self, weights: Optional[Dict[str, float]] = None):
+        weights = dict(DEFAULT_WEIGHTS, **(weights or {}))
+        self.weights = [weights[name] for name in FEATURES]
+
+    def fetch_pool(self, db: Session, telegram_id: int, exclude_ids: Sequence[int], limit: int):
+        """Newest unswiped visible gifts of other users together with their features"""
+        already_swiped = exists().where(and_(
+            Swipe.user_id == telegram_id,
+            Swipe.gift_id == Gift.id
+        ))
+
+        # Gifts and owners nobody swiped yet have no feature rows
+        query = select(
+            *GIFT_COLUMNS,
+            func.coalesce(GiftFeatures.likes, 0).label("likes"),
+            func.coalesce(GiftFeatures.swipes, 0).label("swipes"),
+            func.coalesce(UserFeatures.likes_given, 0).label("likes_given"),
+            func.coalesce(UserFeatures.swipes_given, 0).label("swipes_given"),
+            func.coalesce(UserFeatures.swipes_received, 0).label("swipes_received")
+        ).outerjoin(
+            GiftFeatures, GiftFeatures.gift_id == Gift.id
+        ).outerjoin(
+            UserFeatures, UserFeatures.telegram_id == Gift.telegram_id
+        ).where(
+            Gift.telegram_id != telegram_id,  # Not user's own gifts
+            Gift.is_visible == True,
+            ~already_swiped
+        )
+        if exclude_ids:
+            query = query.where(Gift.id.not_in(list(exclude_ids)))
+
+        return db.execute(query.order_by(Gift.id.desc()).limit(limit)).all()
+
+    def match_likes(self, db: Session, telegram_id: int, gift_ids: List[int]) -> Dict[int, int]:
+        """Number of likes each gift got from users the viewer matched with"""
+        if not gift_ids:
+            return {}
+
+        partners = select(Match.user2_id).where(
+            Match.user1_id == telegram_id, Match.is_active == True
+        ).union_all(
+            select(Match.user1_id).where(Match.user2_id == telegram_id, Match.is_active == True)
+        )
+
+        rows = db.execute(
+            select(Swipe.gift_id, func.count(Swipe.id))
+            .where(
+                Swipe.user_id.in_(partners),
+                Swipe.gift_id.in_(gift_ids),
+                Swipe.is_like == True
+            )
+            .group_by(Swipe.gift_id)
+        ).all()
+        return dict(rows)
+
+    def feature_matrix(self, rows, match_likes: Dict[int, int], now: datetime):
+        """Build the (candidates x FEATURES) matrix from the pool rows"""
+        half_life_seconds = RECENCY_HALF_LIFE_HOURS * 3600
+        decay = math.log(2) / half_life_seconds
+        if not rows:
+            return np.empty((0, len(FEATURES))) if np is not None else []
+
+        # Transpose once instead of reading every field of every row
+        columns = dict(zip(rows[0]._fields, zip(*rows)))
+        created = columns["created_at"]
+        if None in created:
+            # Gifts without a timestamp count as one half-life old
+            unknown = now - timedelta(seconds=half_life_seconds)
+            created = [created_at or unknown for created_at in created]
+        ages = map(timedelta.total_seconds, map(sub, repeat(now), created))
+        matched = map(match_likes.get, columns["id"], repeat(0))
+        if np is not None:
+            count = len(rows)
+
+            def column(values):
+                return np.fromiter(values, dtype=np.float64, count=count)
+
+            return np.column_stack((
+                np.exp(-np.maximum(column(ages), 0.0) * decay),
+                (column(columns["likes"]) + PRIOR_LIKES) / (column(columns["swipes"]) + PRIOR_SWIPES),
+                (column(columns["likes_given"]) + PRIOR_LIKES) / (column(columns["swipes_given"]) + PRIOR_SWIPES),
+                np.log1p(column(columns["swipes_received"])),
+                np.log1p(column(matched)),
+            ))
+
+        return [
+            [
+                math.exp(-max(age, 0.0) * decay),
+                (likes + PRIOR_LIKES) / (swipes + PRIOR_SWIPES),
+                (likes_given + PRIOR_LIKES) / (swipes_given + PRIOR_SWIPES),
+                math.log1p(received),
+                math.log1p(matched_likes),
+            ]
+            for age, likes, swipes, likes_given, swipes_given, received, matched_likes in zip(
+                ages, columns["likes"], columns["swipes"], columns["likes_given"],
+                columns["swipes_given"], columns["swipes_received"], matched
+            )
+        ]
+
+    def rank(self, db: Session, telegram_id: int, exclude_ids: Sequence[int],
+             pool_size: int, limit: int) -> List[Row]:
+        """Return the limit best unswiped gifts out of a pool of pool_size candidates"""
+        rows = self.fetch_pool(db, telegram_id, exclude_ids, pool_size)
+        if not rows:
+            return []
+
+        match_likes = self.match_likes(db, telegram_id, [row.id for row in rows])
+        matrix = self.feature_matrix(rows, match_likes, datetime.utcnow())
+        scores = score_features(matrix, self.weights)
+        return [rows[i] for i in top_k(scores, limit)]
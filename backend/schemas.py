@@ -0,0 +1,88 @@
+from datetime import datetime
+from typing import Any, List, Optional
+
+from pydantic import BaseModel
+
+class UserOut(BaseModel):
+    id: int
+    telegram_id: int
+    username: Optional[str] = None
+    first_name: Optional[str] = None
+    last_name: Optional[str] = None
+    created_at: Optional[datetime] = None
+    is_active: bool = True
+
+class SessionOut(UserOut):
+    session_token: str
+    expires_in: int
+
+class UserListItem(BaseModel):
+    id: int
+    telegram_id: int
+    username: Optional[str] = None
+    first_name: Optional[str] = None
+    last_name: Optional[str] = None
+    is_active: bool = True
+    updated_at: Optional[str] = None
+    last_active_at: Optional[str] = None
+    last_synced_at: Optional[str] = None
+
+class UsersPage(BaseModel):
+    users: List[UserListItem]
+    next_cursor: Optional[int] = None
+
+class GiftOut(BaseModel):
+    id: int
+    name: Optional[str] = None
+    description: Optional[str] = None
+    image_url: Optional[str] = None
+    thumbnail_url: Optional[str] = None
+    user_id: int
+    created_at: Optional[datetime] = None
+
+class DeckOut(BaseModel):
+    gifts: List[GiftOut]
+
+class MatchUser(BaseModel):
+    telegram_id: int
+    username: Optional[str] = None
+    first_name: Optional[str] = None
+    last_name: Optional[str] = None
+
+class MatchOut(BaseModel):
+    match_id: int
+    other_user: MatchUser
+    created_at: Optional[datetime] = None
+
+class MatchesPage(BaseModel):
+    matches: List[MatchOut]
+    next_cursor: Optional[int] = None
+
+class Counts(BaseModel):
+    gifts: int
+    matches: int
+    swipes_left: int
+
+class BootstrapOut(BaseModel):
+    user: UserOut
+    gifts: List[GiftOut]
+    matches: List[MatchOut]
+    matches_next_cursor: Optional[int] = None
+    counts: Counts
+    deck: List[GiftOut]
+
+class SwipeOut(BaseModel):
+    message: str
+    is_like: bool
+    is_match: bool
+    swipes_left: int
+
+class SwipeResult(BaseModel):
+    gift_id: Any = None  # Echoes the request, which may be malformed
+    status: str
+    is_match: bool
+
+class SwipeBatchOut(BaseModel):
+    results: List[SwipeResult]
+    matches: int
+    swipes_left: int
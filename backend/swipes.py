@@ -0,0 +1,230 @@
+import asyncio
+import logging
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import insert, select
+from sqlalchemy.exc import IntegrityError, SQLAlchemyError
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from database import db_writer, read_router
+from models import Gift, Swipe, User
+from matching import record_like, recheck_match
+from deck import candidate_queue, swiped_gift_ids
+from quota import swipe_quota
+from cache import response_cache
+from metrics import metrics
+from config import SWIPE_BUFFER_FLUSH_MS, SWIPE_BUFFER_MAX_ITEMS
+
+logger = logging.getLogger(__name__)
+
+def ingest_swipes(db: Session, telegram_id: int, swipes: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Record an ordered batch of swipes for one user with a fixed number of queries.
+
+    Returns one result per input swipe with a status of "recorded",
+    "duplicate", "not_found", "invalid" or "quota_exceeded" and whether
+    the swipe created a match. Does not commit.
+    """
+    results = [{"gift_id": swipe.get("gift_id"), "status": "invalid", "is_match": False} for swipe in swipes]
+
+    if db.execute(select(User.id).where(User.telegram_id == telegram_id)).first() is None:
+        for result in results:
+            result["status"] = "not_found"
+        return results
+
+    gift_ids = {swipe.get("gift_id") for swipe in swipes if isinstance(swipe.get("gift_id"), int)}
+    owners = dict(db.execute(
+        select(Gift.id, Gift.telegram_id).where(Gift.id.in_(gift_ids))
+    ).all()) if gift_ids else {}
+    already_swiped = swiped_gift_ids(db, telegram_id, owners)
+
+    rows = []
+    liked_owners: Dict[int, List[Dict[str, Any]]] = {}
+    for swipe, result in zip(swipes, results):
+        gift_id = swipe.get("gift_id")
+        is_like = swipe.get("is_like")
+        if not isinstance(gift_id, int) or not isinstance(is_like, bool):
+            continue
+        if gift_id not in owners:
+            result["status"] = "not_found"
+            continue
+        if gift_id in already_swiped:
+            result["status"] = "duplicate"
+            continue
+        if not swipe_quota.try_acquire(telegram_id):
+            result["status"] = "quota_exceeded"
+            continue
+
+        already_swiped.add(gift_id)
+        rows.append({"user_id": telegram_id, "gift_id": gift_id, "is_like": is_like})
+        result["status"] = "recorded"
+        if is_like:
+            liked_owners.setdefault(owners[gift_id], []).append(result)
+
+    try:
+        if rows:
+            db.execute(insert(Swipe), rows)
+
+        # One like edge and match probe per distinct owner, reported on the first like
+        for owner_id, owner_results in liked_owners.items():
+            owner_results[0]["is_match"] = record_like(db, telegram_id, owner_id)
+            owner_results[0]["owner_id"] = owner_id
+    except Exception:
+        # The caller never sees these results, so it cannot give the quota back
+        release_quota(telegram_id, results)
+        raise
+
+    return results
+
+async def commit_swipes(db: AsyncSession, telegram_id: int, swipes: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Ingest and commit one user's batch in its own transaction.
+
+    A unique conflict means a concurrent transaction (another request or
+    worker) recorded some of the swipes after the duplicate check: the
+    batch is ingested once more, which reports them as duplicates.
+    """
+    for attempt in range(2):
+        results = None
+        try:
+            results = await db.run_sync(ingest_swipes, telegram_id, swipes)
+            await db.commit()
+            return results
+        except IntegrityError:
+            await db.rollback()
+            if results is not None:
+                release_quota(telegram_id, results)
+            if attempt:
+                raise
+
+def release_quota(telegram_id: int, results: List[Dict[str, Any]]):
+    """Give back the quota of swipes that were not committed"""
+    recorded = sum(1 for result in results if result["status"] == "recorded")
+    if recorded:
+        swipe_quota.release(telegram_id, recorded)
+
+def finish_swipes(db: Session, telegram_id: int, results: List[Dict[str, Any]]):
+    """
+    Post-commit bookkeeping: re-check matches for likes that raced with the
+    owner's like, point owners at their new admirers and drop swiped gifts
+    (including ones already swiped elsewhere) from the candidate queue.
+    """
+    for result in results:
+        owner_id = result.pop("owner_id", None)
+        if owner_id is not None and not result["is_match"]:
+            result["is_match"] = recheck_match(db, telegram_id, owner_id)
+            if not result["is_match"]:
+                candidate_queue.note_like(owner_id)
+        if owner_id is not None and result["is_match"]:
+            response_cache.invalidate("matches", telegram_id, owner_id)
+            read_router.note_write(owner_id)
+        if result["status"] == "recorded":
+            read_router.note_write(telegram_id)
+            candidate_queue.discard(telegram_id, result["gift_id"])
+        elif result["status"] == "duplicate":
+            candidate_queue.discard(telegram_id, result["gift_id"])
+
+class SwipeWriteBuffer:
+    """
+    Write-behind buffer that groups swipe batches from many users.
+
+    Submitted batches wait at most flush_ms milliseconds (or until max_items
+    swipes are pending) and are then written in a single transaction. If
+    that transaction fails, each batch is retried in its own transaction so
+    one bad batch cannot fail the others. A batch that still hits the
+    unique constraint raced with a concurrent transaction (another request
+    or worker) and is ingested once more, which reports those swipes as
+    duplicates.
+    """
+
+    def __init__(self, flush_ms: float = SWIPE_BUFFER_FLUSH_MS, max_items: int = SWIPE_BUFFER_MAX_ITEMS):
+        self.flush_ms = flush_ms
+        self.max_items = max_items
+        self._pending: List[Tuple[int, List[Dict[str, Any]], asyncio.Future]] = []
+        self._pending_items = 0
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._flush_lock = asyncio.Lock()
+        self.flushes = 0
+
+    @property
+    def depth(self) -> int:
+        """Number of swipes waiting to be written"""
+        return self._pending_items
+
+    async def submit(self, telegram_id: int, swipes: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Queue a user's batch and wait until it is committed"""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((telegram_id, swipes, future))
+        self._pending_items += len(swipes)
+
+        if self._pending_items >= self.max_items:
+            self._schedule(loop, 0)
+        elif self._timer is None:
+            self._schedule(loop, self.flush_ms / 1000)
+
+        return await future
+
+    def _schedule(self, loop: asyncio.AbstractEventLoop, delay: float):
+        if self._timer is not None:
+            self._timer.cancel()
+        self._timer = loop.call_later(delay, lambda: asyncio.ensure_future(self.flush()))
+
+    async def flush(self):
+        """Write everything pending in one transaction"""
+        async with self._flush_lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            batch, self._pending = self._pending, []
+            self._pending_items = 0
+            if not batch:
+                return
+            self.flushes += 1
+
+            try:
+                outcomes = await self._write(batch)
+            except SQLAlchemyError as e:
+                logger.warning(f"Grouped swipe write failed, retrying per batch: {e}")
+                outcomes = []
+                for item in batch:
+                    try:
+                        outcomes.extend(await self._write([item]))
+                    except IntegrityError:
+                        try:
+                            outcomes.extend(await self._write([item]))
+                        except Exception as item_error:
+                            outcomes.append(item_error)
+                    except Exception as item_error:
+                        outcomes.append(item_error)
+            except Exception as e:
+                outcomes = [e] * len(batch)
+
+            for (_, _, future), outcome in zip(batch, outcomes):
+                if future.done():
+                    continue
+                if isinstance(outcome, Exception):
+                    future.set_exception(outcome)
+                else:
+                    future.set_result(outcome)
+
+    async def _write(self, batch) -> List[List[Dict[str, Any]]]:
+        async with db_writer.session() as db:
+            outcomes = []
+            try:
+                for telegram_id, swipes, _ in batch:
+                    outcomes.append(await db.run_sync(ingest_swipes, telegram_id, swipes))
+                await db.commit()
+            except Exception:
+                await db.rollback()
+                for (telegram_id, _, _), results in zip(batch, outcomes):
+                    release_quota(telegram_id, results)
+                raise
+
+            for (telegram_id, _, _), results in zip(batch, outcomes):
+                await db.run_sync(finish_swipes, telegram_id, results)
+            return outcomes
+
+swipe_buffer = SwipeWriteBuffer()
+metrics.gauge("swipe_buffer_depth", "Swipes waiting in the write-behind buffer", lambda: swipe_buffer.depth)
@@ -0,0 +1,117 @@
+from datetime import datetime
+from typing import Any, Dict, Iterable, List
+
+from sqlalchemy import insert, update
+from sqlalchemy.orm import Session
+
+from models import Gift, User
+from config import MAX_GIFTS_PER_USER
+
+# Gift columns that the userbot payload can change
+SYNCED_FIELDS = ("gift_name", "gift_description", "gift_image_url")
+
+def _payload_fields(gift_data: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "gift_name": gift_data.get("name", "Unknown Gift"),
+        "gift_description": gift_data.get("description", ""),
+        "gift_image_url": gift_data.get("image_url", "")
+    }
+
+def diff_sync_gifts(db: Session, telegram_id: int, gifts_data: List[Dict[str, Any]],
+                    max_gifts: int = MAX_GIFTS_PER_USER) -> Dict[str, int]:
+    """
+    Apply a gift inventory to the database as a diff keyed on (telegram_id, gift_id).
+
+    New gifts are inserted, gifts missing from the payload are hidden via
+    is_visible, and changed gifts are updated in place so Gift.id (and the
+    swipes pointing at it) stays stable. Only the first max_gifts distinct
+    gifts of the payload are kept. Does not commit.
+    """
+    # Deduplicate the payload, last occurrence wins
+    incoming: Dict[str, Dict[str, Any]] = {}
+    skipped = 0
+    for gift_data in gifts_data:
+        gift_id = gift_data.get("id")
+        if gift_id is None:
+            continue
+        gift_id = str(gift_id)
+        if gift_id not in incoming and len(incoming) >= max_gifts:
+            skipped += 1
+            continue
+        incoming[gift_id] = _payload_fields(gift_data)
+
+    existing = db.query(
+        Gift.id,
+        Gift.gift_id,
+        Gift.gift_name,
+        Gift.gift_description,
+        Gift.gift_image_url,
+        Gift.is_visible
+    ).filter(Gift.telegram_id == telegram_id).all()
+
+    to_update = []
+    to_hide = []
+    seen = set()
+    for row in existing:
+        fields = incoming.get(row.gift_id)
+        if fields is None or row.gift_id in seen:
+            # Removed from the inventory (or a leftover duplicate row)
+            if row.is_visible:
+                to_hide.append(row.id)
+            continue
+
+        seen.add(row.gift_id)
+        changed = {
+            name: value for name, value in fields.items()
+            if getattr(row, name) != value
+        }
+        if "gift_image_url" in changed:
+            # Re-resolved by the image cache
+            changed["image_hash"] = None
+        if not row.is_visible:
+            changed["is_visible"] = True
+        if changed:
+            changed["id"] = row.id
+            to_update.append(changed)
+
+    to_insert = [
+        dict(fields, telegram_id=telegram_id, gift_id=gift_id)
+        for gift_id, fields in incoming.items()
+        if gift_id not in seen
+    ]
+
+    if to_insert:
+        db.execute(insert(Gift), to_insert)
+    if to_update:
+        # Group by changed column set so each group is a single executemany
+        groups: Dict[tuple, List[Dict[str, Any]]] = {}
+        for params in to_update:
+            groups.setdefault(tuple(sorted(params)), []).append(params)
+        for params_list in groups.values():
+            db.execute(update(Gift), params_list)
+    if to_hide:
+        db.execute(
+            update(Gift)
+            .where(Gift.id.in_(to_hide))
+            .values(is_visible=False)
+            .execution_options(synchronize_session=False)
+        )
+
+    return {
+        "inserted": len(to_insert),
+        "updated": len(to_update),
+        "hidden": len(to_hide),
+        "unchanged": len(seen) - len(to_update),
+        "skipped": skipped
+    }
+
+def mark_synced(db: Session, telegram_ids: Iterable[int]):
+    """
+    Record a gift push for the users (orders the userbot listing). Leaves
+    updated_at alone, a sync is not a profile change. Does not commit.
+    """
+    db.execute(
+        update(User)
+        .where(User.telegram_id.in_(list(telegram_ids)))
+        .values(last_synced_at=datetime.utcnow(), updated_at=User.updated_at)
+    )
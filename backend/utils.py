@@ -1,85 +1,157 @@
 import hashlib
 import hmac
 import json
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from functools import lru_cache
 from typing import Dict, Any, Optional
-from config import SECRET_KEY
+from urllib.parse import parse_qsl
+from config import SECRET_KEY, INIT_DATA_MAX_AGE_SECONDS, INIT_DATA_CACHE_SIZE, IMAGE_BASE_URL, IMAGE_CARD_SIZE
 
-def validate_telegram_webapp_data(init_data: str) -> bool:
+@dataclass(frozen=True)
+class InitData:
+    """Verified Telegram WebApp initData"""
+    user: Dict[str, Any]
+    auth_date: int
+    hash: str
+    query_id: Optional[str] = None
+
+@lru_cache(maxsize=4)
+def webapp_secret_key(bot_token: str) -> bytes:
     """
-    Validate Telegram WebApp initData
+    Derive the WebAppData secret key (constant for a given bot token)
     """
-    try:
-        # Parse init_data
-        data_dict = {}
-        for item in init_data.split('&'):
-            if '=' in item:
-                key, value = item.split('=', 1)
-                data_dict[key] = value
-        
-        # Check if hash exists
-        if 'hash' not in data_dict:
-            return False
-        
+    return hmac.new(b"WebAppData", bot_token.encode(), hashlib.sha256).digest()
+
+# Raw initData string -> verified result, most recently used last
+_verified_cache: "OrderedDict[str, InitData]" = OrderedDict()
+_verified_cache_lock = threading.Lock()
+
+def _cache_get(init_data: str) -> Optional[InitData]:
+    with _verified_cache_lock:
+        result = _verified_cache.get(init_data)
+        if result is not None:
+            _verified_cache.move_to_end(init_data)
+        return result
+
+def _cache_put(init_data: str, result: InitData):
+    with _verified_cache_lock:
+        _verified_cache[init_data] = result
+        _verified_cache.move_to_end(init_data)
+        while len(_verified_cache) > INIT_DATA_CACHE_SIZE:
+            _verified_cache.popitem(last=False)
+
+def verify_init_data(init_data: str, max_age: int = INIT_DATA_MAX_AGE_SECONDS,
+                     now: Optional[float] = None) -> Optional[InitData]:
+    """
+    Verify Telegram WebApp initData and parse it in one pass.
+
+    Returns None if the signature is wrong, the user is missing or auth_date
+    is older than max_age seconds. Already verified strings are served from
+    a bounded LRU cache without hashing again.
+    """
+    if not init_data:
+        return None
+
+    now = time.time() if now is None else now
+    result = _cache_get(init_data)
+
+    if result is None:
+        try:
+            data_dict = dict(parse_qsl(init_data, keep_blank_values=True, strict_parsing=True))
+        except ValueError:
+            return None
+
         # Get hash and remove it from data
-        data_hash = data_dict.pop('hash')
-        
+        data_hash = data_dict.pop('hash', None)
+        if not data_hash:
+            return None
+
         # Sort data alphabetically
-        data_check_string = '\n'.join([
+        data_check_string = '\n'.join(
             f"{k}={v}" for k, v in sorted(data_dict.items())
-        ])
-        
-        # Create secret key
-        secret_key = hmac.new(
-            b"WebAppData",
-            SECRET_KEY.encode(),
-            hashlib.sha256
-        ).digest()
-        
-        # Calculate hash
+        )
         calculated_hash = hmac.new(
-            secret_key,
+            webapp_secret_key(SECRET_KEY),
             data_check_string.encode(),
             hashlib.sha256
         ).hexdigest()
-        
-        return calculated_hash == data_hash
-        
-    except Exception:
-        return False
+
+        if not hmac.compare_digest(calculated_hash, data_hash):
+            return None
+
+        try:
+            user = json.loads(data_dict['user'])
+            auth_date = int(data_dict['auth_date'])
+        except (KeyError, ValueError):
+            return None
+        if not isinstance(user, dict):
+            return None
+
+        result = InitData(
+            user=user,
+            auth_date=auth_date,
+            hash=data_hash,
+            query_id=data_dict.get('query_id')
+        )
+        _cache_put(init_data, result)
+
+    # Freshness is checked on every call, cached or not
+    if max_age and now - result.auth_date > max_age:
+        return None
+
+    return result
+
+def validate_telegram_webapp_data(init_data: str) -> bool:
+    """
+    Validate Telegram WebApp initData
+    """
+    return verify_init_data(init_data) is not None
 
 def extract_user_from_init_data(init_data: str) -> Optional[Dict[str, Any]]:
     """
-    Extract user data from Telegram WebApp initData
+    Extract user data from verified Telegram WebApp initData
     """
-    try:
-        data_dict = {}
-        for item in init_data.split('&'):
-            if '=' in item:
-                key, value = item.split('=', 1)
-                data_dict[key] = value
-        
-        if 'user' in data_dict:
-            user_data = json.loads(data_dict['user'])
-            return user_data
-        
-        return None
-        
-    except Exception:
-        return None
+    result = verify_init_data(init_data)
+    return result.user if result else None
 
 def format_gift_data(gift: Dict[str, Any]) -> Dict[str, Any]:
     """
     Format gift data for frontend
     """
+    image_hash = gift.get("image_hash")
     return {
         "id": gift.get("id"),
         "name": gift.get("gift_name", "Unknown Gift"),
         "description": gift.get("gift_description", ""),
         "image_url": gift.get("gift_image_url", ""),
+        # Served by the backend image cache once downloaded
+        "thumbnail_url": f"{IMAGE_BASE_URL}/api/images/{image_hash}?size={IMAGE_CARD_SIZE}" if image_hash else None,
         "user_id": gift.get("telegram_id"),
         "created_at": gift.get("created_at")
     }
 
+def format_user_data(user: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Format user data for the sync worker listing
+    """
+    updated_at = user.get("updated_at")
+    last_active_at = user.get("last_active_at")
+    last_synced_at = user.get("last_synced_at")
+    return {
+        "id": user.get("id"),
+        "telegram_id": user.get("telegram_id"),
+        "username": user.get("username"),
+        "first_name": user.get("first_name"),
+        "last_name": user.get("last_name"),
+        "is_active": user.get("is_active", True),
+        "updated_at": updated_at.isoformat() if updated_at else None,
+        "last_active_at": last_active_at.isoformat() if last_active_at else None,
+        "last_synced_at": last_synced_at.isoformat() if last_synced_at else None
+    }
+
 def format_match_data(match: Dict[str, Any]) -> Dict[str, Any]:
     """
     Format match data for frontend
@@ -0,0 +1,138 @@
+"""
+Per-endpoint latency percentiles and queries per request for the API hot paths.
+
+    python benchmarks/seed.py --scale 10k --db-url sqlite:///./bench.db
+    python benchmarks/bench_api.py --db-url sqlite:///./bench.db --output bench.json
+
+Requests go through FastAPI's TestClient (in process, no network), so the
+numbers cover routing, validation, database work and serialization. Run
+against a seeded database; users and gifts are sampled with --seed.
+"""
+import argparse
+import random
+import sys
+import time
+from collections import Counter
+from typing import Any, Callable, Dict, List
+
+from common import QueryCounter, configure, environment, summarize, write_json
+
+DEFAULT_ENDPOINTS = ("user", "gifts", "matches", "bootstrap", "deck", "next_gift", "swipe", "swipes")
+
+def _scenarios(client, headers: Callable[[int], Dict[str, str]], rng: random.Random,
+               max_gift_id: int) -> Dict[str, Callable[[int], Any]]:
+    """Endpoint name -> function issuing one request for a user"""
+    def swipe(telegram_id):
+        return client.post("/api/swipe", headers=headers(telegram_id), params={
+            "gift_id": rng.randint(1, max_gift_id),
+            "is_like": rng.random() < 0.3
+        })
+
+    def swipes(telegram_id):
+        batch = [
+            {"gift_id": rng.randint(1, max_gift_id), "is_like": rng.random() < 0.3}
+            for _ in range(10)
+        ]
+        return client.post("/api/swipes", headers=headers(telegram_id), json=batch)
+
+    return {
+        "user": lambda telegram_id: client.get(f"/api/user/{telegram_id}", headers=headers(telegram_id)),
+        "gifts": lambda telegram_id: client.get(f"/api/gifts/{telegram_id}", headers=headers(telegram_id)),
+        "matches": lambda telegram_id: client.get(f"/api/matches/{telegram_id}", headers=headers(telegram_id)),
+        "bootstrap": lambda telegram_id: client.get(f"/api/bootstrap/{telegram_id}", headers=headers(telegram_id)),
+        "deck": lambda telegram_id: client.get(f"/api/deck/{telegram_id}?size=10", headers=headers(telegram_id)),
+        "next_gift": lambda telegram_id: client.get(f"/api/next_gift/{telegram_id}", headers=headers(telegram_id)),
+        "swipe": swipe,
+        "swipes": swipes,
+    }
+
+def run(endpoints: List[str], requests: int, warmup: int, seed_value: int) -> Dict[str, Any]:
+    from fastapi.testclient import TestClient
+    from sqlalchemy import func, select
+
+    import main
+    from auth import issue_session_token
+    from database import SessionLocal, async_engine, engine, read_engines, write_engine
+    from models import Gift, User
+
+    db = SessionLocal()
+    try:
+        telegram_ids = db.execute(select(User.telegram_id)).scalars().all()
+        max_gift_id = db.execute(select(func.max(Gift.id))).scalar() or 0
+    finally:
+        db.close()
+    if not telegram_ids or not max_gift_id:
+        raise SystemExit("The database is empty, run benchmarks/seed.py first")
+
+    tokens: Dict[int, str] = {}
+
+    def headers(telegram_id: int) -> Dict[str, str]:
+        if telegram_id not in tokens:
+            tokens[telegram_id] = issue_session_token(telegram_id)
+        return {"Authorization": f"Bearer {tokens[telegram_id]}"}
+
+    rng = random.Random(seed_value)
+    # Reads, the SQLite writer connection and replicas (when configured) all count
+    counter = QueryCounter(
+        engine, async_engine.sync_engine, write_engine.sync_engine,
+        *(read_engine.sync_engine for read_engine in read_engines)
+    )
+    results = {}
+    with TestClient(main.app) as client:
+        scenarios = _scenarios(client, headers, rng, max_gift_id)
+        for name in endpoints:
+            call = scenarios[name]
+            for _ in range(warmup):
+                call(rng.choice(telegram_ids))
+
+            latencies = []
+            statuses = Counter()
+            queries_before = counter.count
+            for _ in range(requests):
+                telegram_id = rng.choice(telegram_ids)
+                started = time.perf_counter()
+                response = call(telegram_id)
+                latencies.append(time.perf_counter() - started)
+                statuses[response.status_code] += 1
+
+            results[name] = dict(
+                summarize(latencies),
+                queries_per_request=round((counter.count - queries_before) / requests, 2),
+                status_codes=dict(statuses)
+            )
+            print(
+                f"{name:<10} p50 {results[name]['p50_ms']:>8.2f} ms  p90 {results[name]['p90_ms']:>8.2f} ms  "
+                f"p99 {results[name]['p99_ms']:>8.2f} ms  queries/req {results[name]['queries_per_request']:>6.2f}"
+            )
+
+    return {"users": len(telegram_ids), "gifts": max_gift_id, "endpoints": results}
+
+def main(argv: List[str]) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--db-url", default="sqlite:///./bench.db")
+    parser.add_argument("--endpoints", default=",".join(DEFAULT_ENDPOINTS),
+                        help=f"Comma separated subset of {', '.join(DEFAULT_ENDPOINTS)}")
+    parser.add_argument("--requests", type=int, default=200, help="Measured requests per endpoint")
+    parser.add_argument("--warmup", type=int, default=10, help="Unmeasured requests per endpoint")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="Write JSON results to this file (- for stdout)")
+    args = parser.parse_args(argv[1:])
+
+    endpoints = [name.strip() for name in args.endpoints.split(",") if name.strip()]
+    unknown = set(endpoints) - set(DEFAULT_ENDPOINTS)
+    if unknown:
+        parser.error(f"Unknown endpoints: {', '.join(sorted(unknown))}")
+
+    configure(args.db_url)
+    result = run(endpoints, args.requests, args.warmup, args.seed)
+    write_json(args.output, dict(
+        result,
+        db_url=args.db_url.split("@")[-1],  # Drop credentials
+        seed=args.seed,
+        requests=args.requests,
+        environment=environment()
+    ))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
@@ -0,0 +1,94 @@
+"""
+Shared helpers for the benchmark scripts.
+
+Backend modules read their settings from the environment when they are
+first imported, so scripts call configure() before importing anything
+from backend/.
+"""
+import json
+import math
+import os
+import platform
+import subprocess
+import sys
+import time
+from typing import Any, Dict, List, Optional, Sequence
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BACKEND = os.path.join(ROOT, "backend")
+
+# users, gifts per user, swipes (the scale name is the swipe count)
+SCALES = {
+    "10k": {"users": 500, "gifts_per_user": 20, "swipes": 10_000},
+    "1m": {"users": 20_000, "gifts_per_user": 10, "swipes": 1_000_000},
+    "10m": {"users": 100_000, "gifts_per_user": 10, "swipes": 10_000_000},
+}
+
+def configure(db_url: Optional[str] = None, **env: str):
+    """Point the backend at db_url and make backend/ importable"""
+    if db_url:
+        os.environ["DB_URL"] = db_url
+    for name, value in env.items():
+        os.environ[name] = value
+    for path in (ROOT, BACKEND):
+        if path not in sys.path:
+            sys.path.insert(0, path)
+
+def percentile(sorted_samples: Sequence[float], q: float) -> float:
+    """Nearest-rank percentile of already sorted samples"""
+    if not sorted_samples:
+        return 0.0
+    rank = max(1, math.ceil(q / 100 * len(sorted_samples)))
+    return sorted_samples[rank - 1]
+
+def summarize(samples: List[float]) -> Dict[str, float]:
+    """Latency summary in milliseconds"""
+    ordered = sorted(samples)
+    count = len(ordered)
+    return {
+        "count": count,
+        "mean_ms": round(sum(ordered) / count * 1000, 3) if count else 0.0,
+        "p50_ms": round(percentile(ordered, 50) * 1000, 3),
+        "p90_ms": round(percentile(ordered, 90) * 1000, 3),
+        "p99_ms": round(percentile(ordered, 99) * 1000, 3),
+        "max_ms": round(ordered[-1] * 1000, 3) if count else 0.0,
+    }
+
+class QueryCounter:
+    """Counts SQL statements executed on the given engines (each counted once if passed twice)"""
+
+    def __init__(self, *engines):
+        from sqlalchemy import event
+
+        self.count = 0
+        for engine in set(engines):
+            event.listen(engine, "before_cursor_execute", self._on_execute)
+
+    def _on_execute(self, conn, cursor, statement, parameters, context, executemany):
+        self.count += 1
+
+def environment() -> Dict[str, Any]:
+    """Run metadata stored with every result for comparing runs"""
+    try:
+        revision = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT,
+            capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        revision = None
+    return {
+        "git_revision": revision,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+    }
+
+def write_json(path: Optional[str], result: Dict[str, Any]):
+    """Write result to path, or to stdout when path is "-" """
+    data = json.dumps(result, indent=2, default=str)
+    if path == "-":
+        print(data)
+    elif path:
+        with open(path, "w") as f:
+            f.write(data + "\n")
+        print(f"Results written to {path}")
@@ -0,0 +1,154 @@
+"""
+Concurrent swipe load generator (locust-style) against a running API.
+
+    cd backend && uvicorn main:app --port 8000
+    python benchmarks/load.py --url http://localhost:8000 --scale 10k --users 50 --duration 60
+
+Each virtual user signs in as one of the seeded users (see seed.py, same
+--scale), then loops: fetch a deck, swipe through it with think time
+between swipes, and check matches every few swipes. Virtual user i draws
+from random.Random(seed + i), so runs with the same arguments issue the
+same request sequence. Results (per request latency percentiles, status
+codes, throughput) can be written as JSON for comparing runs.
+"""
+import argparse
+import asyncio
+import random
+import sys
+import time
+from collections import Counter, defaultdict
+from typing import Any, Dict, List
+
+from common import SCALES, configure, environment, summarize, write_json
+
+LIKE_RATE = 0.3
+MATCHES_EVERY = 20
+
+class LoadStats:
+    def __init__(self):
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.statuses: Dict[str, Counter] = defaultdict(Counter)
+        self.errors: Counter = Counter()
+
+    def record(self, name: str, seconds: float, status: int):
+        self.latencies[name].append(seconds)
+        self.statuses[name][status] += 1
+
+    def report(self, elapsed: float) -> Dict[str, Any]:
+        total = sum(len(samples) for samples in self.latencies.values())
+        return {
+            "seconds": round(elapsed, 3),
+            "requests": total,
+            "requests_per_second": round(total / elapsed, 2) if elapsed else 0.0,
+            "errors": dict(self.errors),
+            "endpoints": {
+                name: dict(summarize(samples), status_codes=dict(self.statuses[name]))
+                for name, samples in sorted(self.latencies.items())
+            },
+        }
+
+async def _request(session, stats: LoadStats, name: str, method: str, url: str, **kwargs):
+    started = time.perf_counter()
+    try:
+        async with session.request(method, url, **kwargs) as response:
+            body = await response.json(content_type=None) if response.status == 200 else None
+            stats.record(name, time.perf_counter() - started, response.status)
+            return response.status, body
+    except Exception as e:
+        stats.errors[f"{name}: {type(e).__name__}"] += 1
+        return None, None
+
+async def virtual_user(session, base_url: str, telegram_id: int, token: str, rng: random.Random,
+                       stats: LoadStats, deadline: float, think_time: float):
+    headers = {"Authorization": f"Bearer {token}"}
+    swipes = 0
+    while time.monotonic() < deadline:
+        status, deck = await _request(
+            session, stats, "deck", "GET", f"{base_url}/api/deck/{telegram_id}?size=10", headers=headers
+        )
+        gifts = deck["gifts"] if deck else []
+        if not gifts:
+            await asyncio.sleep(rng.uniform(1, 2))
+            continue
+
+        for gift in gifts:
+            if time.monotonic() >= deadline:
+                return
+            await asyncio.sleep(rng.expovariate(1 / think_time) if think_time > 0 else 0)
+            status, _ = await _request(session, stats, "swipe", "POST", f"{base_url}/api/swipe", headers=headers, params={
+                "gift_id": gift["id"],
+                "is_like": "true" if rng.random() < LIKE_RATE else "false"
+            })
+            if status == 429:
+                # Daily quota used up, this user only browses matches from now on
+                await asyncio.sleep(rng.uniform(1, 2))
+                await _request(session, stats, "matches", "GET", f"{base_url}/api/matches/{telegram_id}", headers=headers)
+                break
+
+            swipes += 1
+            if swipes % MATCHES_EVERY == 0:
+                await _request(session, stats, "matches", "GET", f"{base_url}/api/matches/{telegram_id}", headers=headers)
+
+async def run(base_url: str, scale: str, users: int, spawn_rate: float, duration: float,
+              think_time: float, seed_value: int) -> Dict[str, Any]:
+    import aiohttp
+
+    from auth import issue_session_token
+    from seed import user_ids
+
+    candidates = user_ids(SCALES[scale])
+    picked = random.Random(seed_value).sample(candidates, min(users, len(candidates)))
+    stats = LoadStats()
+
+    started = time.monotonic()
+    deadline = started + duration
+    connector = aiohttp.TCPConnector(limit=len(picked))
+    async with aiohttp.ClientSession(connector=connector) as session:
+        tasks = []
+        for index, telegram_id in enumerate(picked):
+            tasks.append(asyncio.create_task(virtual_user(
+                session, base_url.rstrip("/"), telegram_id, issue_session_token(telegram_id),
+                random.Random(seed_value + index), stats, deadline, think_time
+            )))
+            if spawn_rate > 0:
+                await asyncio.sleep(1 / spawn_rate)
+        await asyncio.gather(*tasks)
+
+    return dict(stats.report(time.monotonic() - started), users=len(picked))
+
+def main(argv: List[str]) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--scale", choices=sorted(SCALES), default="10k", help="Scale the database was seeded with")
+    parser.add_argument("--users", type=int, default=50, help="Concurrent virtual users")
+    parser.add_argument("--spawn-rate", type=float, default=10, help="Virtual users started per second")
+    parser.add_argument("--duration", type=float, default=60, help="Seconds to run")
+    parser.add_argument("--think-time", type=float, default=0.5, help="Mean seconds between swipes")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="Write JSON results to this file (- for stdout)")
+    args = parser.parse_args(argv[1:])
+
+    # Session tokens are signed with the server's SECRET_KEY from the same .env
+    configure()
+    result = asyncio.run(run(
+        args.url, args.scale, args.users, args.spawn_rate, args.duration, args.think_time, args.seed
+    ))
+
+    for name, summary in result["endpoints"].items():
+        print(f"{name:<8} n={summary['count']:<6} p50 {summary['p50_ms']:>8.2f} ms  "
+              f"p90 {summary['p90_ms']:>8.2f} ms  p99 {summary['p99_ms']:>8.2f} ms  {summary['status_codes']}")
+    print(f"{result['requests']} requests in {result['seconds']}s ({result['requests_per_second']} req/s), "
+          f"errors: {result['errors'] or 'none'}")
+
+    write_json(args.output, dict(
+        result,
+        url=args.url,
+        scale=args.scale,
+        seed=args.seed,
+        think_time=args.think_time,
+        environment=environment()
+    ))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
@@ -0,0 +1,149 @@
+"""
+Seed a database with synthetic users, gifts, swipes, likes and matches.
+
+    python benchmarks/seed.py --scale 10k --db-url sqlite:///./bench.db
+    python benchmarks/seed.py --scale 1m --db-url postgresql://localhost/bench
+
+Scales are named after the number of swipes (see common.SCALES). The same
+--seed always produces the same data set. The database must be empty.
+"""
+import argparse
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+from typing import Dict, List
+
+from common import SCALES, configure, environment, write_json
+
+CHUNK_SIZE = 20_000
+FIRST_TELEGRAM_ID = 1_000_000
+LIKE_RATE = 0.3
+
+def user_ids(scale: Dict[str, int]) -> List[int]:
+    """Telegram ids of the seeded users (shared with the other scripts)"""
+    return [FIRST_TELEGRAM_ID + i for i in range(scale["users"])]
+
+def _insert_chunked(conn, table, rows):
+    from sqlalchemy import insert
+
+    for start in range(0, len(rows), CHUNK_SIZE):
+        conn.execute(insert(table), rows[start:start + CHUNK_SIZE])
+
+def seed(scale_name: str, seed_value: int = 42) -> Dict[str, int]:
+    from sqlalchemy import and_, insert, select
+    from sqlalchemy.orm import aliased
+
+    from database import SessionLocal, create_tables, engine
+    from features import refresh_features
+    from matching import backfill_like_edges
+    from models import Gift, LikeEdge, Match, Swipe, User
+
+    scale = SCALES[scale_name]
+    rng = random.Random(seed_value)
+    now = datetime.utcnow()
+    users = user_ids(scale)
+    gifts_per_user = scale["gifts_per_user"]
+    gift_count = len(users) * gifts_per_user
+
+    create_tables()
+    with engine.connect() as conn:
+        if conn.execute(select(User.id).limit(1)).first() is not None:
+            raise SystemExit("The database already has users, seed an empty one")
+
+    with engine.begin() as conn:
+        _insert_chunked(conn, User, [
+            {"telegram_id": telegram_id, "username": f"user{telegram_id}", "first_name": f"User {telegram_id}"}
+            for telegram_id in users
+        ])
+
+        # Gift ids on an empty database are 1..gift_count, grouped by owner
+        gifts = []
+        for telegram_id in users:
+            for i in range(gifts_per_user):
+                gift_type = rng.randrange(200)  # Many users own the same gift types
+                gifts.append({
+                    "telegram_id": telegram_id,
+                    "gift_id": f"{telegram_id}-{i}",
+                    "gift_name": f"Gift {gift_type}",
+                    "gift_description": "",
+                    "gift_image_url": f"https://example.com/gifts/{gift_type}.png",
+                    "is_visible": True,
+                    "created_at": now - timedelta(seconds=rng.randrange(60 * 24 * 3600))
+                })
+        _insert_chunked(conn, Gift, gifts)
+        del gifts
+
+        # Swipes are older than the daily quota window
+        per_user = min(scale["swipes"] // len(users), gift_count - gifts_per_user)
+        users_per_chunk = max(1, CHUNK_SIZE // max(per_user, 1))
+        for start in range(0, len(users), users_per_chunk):
+            rows = []
+            for index in range(start, min(len(users), start + users_per_chunk)):
+                telegram_id = users[index]
+                own = range(index * gifts_per_user + 1, (index + 1) * gifts_per_user + 1)
+                picked = [
+                    gift_id for gift_id in rng.sample(range(1, gift_count + 1), per_user + gifts_per_user)
+                    if gift_id not in own
+                ][:per_user]
+                for gift_id in picked:
+                    rows.append({
+                        "user_id": telegram_id,
+                        "gift_id": gift_id,
+                        "is_like": rng.random() < LIKE_RATE,
+                        "created_at": now - timedelta(seconds=rng.randrange(3 * 24 * 3600, 30 * 24 * 3600))
+                    })
+            _insert_chunked(conn, Swipe, rows)
+
+    db = SessionLocal()
+    try:
+        likes = backfill_like_edges(db)
+
+        # Every mutual like pair becomes a match
+        reverse = aliased(LikeEdge)
+        mutual = select(LikeEdge.liker_id, LikeEdge.owner_id).join(reverse, and_(
+            reverse.liker_id == LikeEdge.owner_id,
+            reverse.owner_id == LikeEdge.liker_id
+        )).where(LikeEdge.liker_id < LikeEdge.owner_id)
+        matches = db.execute(
+            insert(Match).from_select(["user1_id", "user2_id"], mutual)
+        ).rowcount
+        db.commit()
+
+        refresh_features(db)
+    finally:
+        db.close()
+
+    return {
+        "users": len(users),
+        "gifts": gift_count,
+        "swipes": per_user * len(users),
+        "likes": likes,
+        "matches": matches,
+    }
+
+def main(argv: List[str]) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scale", choices=sorted(SCALES), default="10k")
+    parser.add_argument("--db-url", default="sqlite:///./bench.db")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="Write a JSON summary to this file (- for stdout)")
+    args = parser.parse_args(argv[1:])
+
+    configure(args.db_url)
+    started = time.perf_counter()
+    counts = seed(args.scale, args.seed)
+    elapsed = time.perf_counter() - started
+
+    print(f"Seeded {args.scale} in {elapsed:.1f}s: " + ", ".join(f"{k}={v}" for k, v in counts.items()))
+    write_json(args.output, {
+        "scale": args.scale,
+        "seed": args.seed,
+        "seconds": round(elapsed, 3),
+        "counts": counts,
+        "environment": environment(),
+    })
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
@@ -13,16 +13,119 @@ API_HASH = os.getenv("API_HASH", "your_api_hash_here")
 
 # Database Configuration
 DB_URL = os.getenv("DB_URL", "sqlite:///./gift_tinder.db")
+ASYNC_DB_URL = os.getenv("ASYNC_DB_URL", "")  # Derived from DB_URL when empty
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "20"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+DB_READ_URLS = [url.strip() for url in os.getenv("DB_READ_URLS", "").split(",") if url.strip()]  # Read replicas, comma separated
+DB_READ_STICKY_SECONDS = float(os.getenv("DB_READ_STICKY_SECONDS", "5"))  # A user's reads stay on the primary this long after their writes
+
+# SQLite tuning (WAL, pragmas and a single writer connection; ignored for other databases)
+SQLITE_TUNING = os.getenv("SQLITE_TUNING", "True").lower() == "true"
+SQLITE_SYNCHRONOUS = os.getenv("SQLITE_SYNCHRONOUS", "NORMAL")
+SQLITE_MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024)))
+SQLITE_CACHE_SIZE_KB = int(os.getenv("SQLITE_CACHE_SIZE_KB", str(64 * 1024)))
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+SQLITE_WRITER = SQLITE_TUNING and DB_URL.startswith("sqlite")
 
 # App Configuration
 APP_NAME = "Gift Tinder"
 APP_VERSION = "1.0.0"
 DEBUG = os.getenv("DEBUG", "True").lower() == "true"
+BACKGROUND_JOBS = os.getenv("BACKGROUND_JOBS", "True").lower() == "true"  # Feature refresh; one API worker only
+
+# Production launcher (run.py)
+API_HOST = os.getenv("API_HOST", "0.0.0.0")
+API_PORT = int(os.getenv("API_PORT", "8000"))
+API_WORKERS = int(os.getenv("API_WORKERS", "0"))  # 0: one per CPU core, one on SQLite
+MULTI_WORKER_CACHE_TTL_SECONDS = 5  # Response cache TTL when workers cannot invalidate each other's caches
+HEALTH_CHECK_INTERVAL_SECONDS = float(os.getenv("HEALTH_CHECK_INTERVAL_SECONDS", "10"))
+HEALTH_CHECK_FAILURES = 3  # Missed heartbeat intervals before an API worker is restarted
+API_HEARTBEAT_PATH = os.getenv("API_HEARTBEAT_PATH", "")  # Set by run.py: touched by the worker's event loop while it is responsive
+SHUTDOWN_TIMEOUT_SECONDS = float(os.getenv("SHUTDOWN_TIMEOUT_SECONDS", "30"))
 
 # Security
 SECRET_KEY = os.getenv("SECRET_KEY", "your-secret-key-change-this")
 WEBAPP_URL = os.getenv("WEBAPP_URL", "https://your-domain.com")
+INIT_DATA_MAX_AGE_SECONDS = int(os.getenv("INIT_DATA_MAX_AGE_SECONDS", str(24 * 60 * 60)))
+INIT_DATA_CACHE_SIZE = int(os.getenv("INIT_DATA_CACHE_SIZE", "10000"))
+SESSION_TTL_SECONDS = int(os.getenv("SESSION_TTL_SECONDS", str(60 * 60)))
+SYNC_API_KEY = os.getenv("SYNC_API_KEY", "")  # Shared with the userbot for the user listing and gift sync; empty disables those endpoints
 
 # Limits
 MAX_GIFTS_PER_USER = 50
-MAX_SWIPES_PER_DAY = 100 
\ No newline at end of file
+MAX_SWIPES_PER_DAY = 100
+QUOTA_STORE_PATH = os.getenv("QUOTA_STORE_PATH", "")  # SQLite file sharing swipe quotas between API workers; empty keeps them in-process
+MAX_SWIPES_PER_BATCH = 100
+
+# Swipe write-behind buffer (groups swipe batches of many users per transaction, on by default with the SQLite writer)
+SWIPE_WRITE_BEHIND = os.getenv("SWIPE_WRITE_BEHIND", str(SQLITE_WRITER)).lower() == "true"
+SWIPE_BUFFER_FLUSH_MS = float(os.getenv("SWIPE_BUFFER_FLUSH_MS", "5"))
+SWIPE_BUFFER_MAX_ITEMS = int(os.getenv("SWIPE_BUFFER_MAX_ITEMS", "500"))
+
+# Users listing
+USERS_PAGE_SIZE = 1000
+USERS_MAX_PAGE_SIZE = 10000
+
+# Matches listing
+MATCHES_PAGE_SIZE = 100
+MATCHES_MAX_PAGE_SIZE = 1000
+
+# Swipe deck
+DECK_SIZE = int(os.getenv("DECK_SIZE", "10"))
+DECK_MAX_SIZE = 50
+DECK_QUEUE_CAPACITY = int(os.getenv("DECK_QUEUE_CAPACITY", "100"))
+DECK_REFILL_THRESHOLD = int(os.getenv("DECK_REFILL_THRESHOLD", "20"))
+DECK_MAX_USERS = int(os.getenv("DECK_MAX_USERS", "10000"))
+DECK_EXHAUSTED_RETRY_SECONDS = 60
+DECK_RANKING = os.getenv("DECK_RANKING", "True").lower() == "true"
+DECK_RANK_POOL_SIZE = int(os.getenv("DECK_RANK_POOL_SIZE", "2000"))
+DECK_RECIPROCITY = os.getenv("DECK_RECIPROCITY", "True").lower() == "true"
+DECK_RECIPROCAL_SHARE = 0.5  # At most this share of each refill comes from users who liked you
+
+# Ranking features
+FEATURE_REFRESH_SECONDS = int(os.getenv("FEATURE_REFRESH_SECONDS", "60"))
+FEATURE_REFRESH_BATCH = 2000
+
+# Read endpoint response cache
+RESPONSE_CACHE_TTL_SECONDS = int(os.getenv("RESPONSE_CACHE_TTL_SECONDS", "300"))
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "10000"))
+
+# Gift image cache (originals deduplicated by content hash, plus thumbnails)
+IMAGE_CACHE_DIR = os.getenv("IMAGE_CACHE_DIR", "./image_cache")
+IMAGE_BASE_URL = os.getenv("IMAGE_BASE_URL", "")  # Public backend origin, empty for relative URLs
+IMAGE_THUMBNAIL_SIZES = (160, 480)
+IMAGE_CARD_SIZE = 480
+IMAGE_MAX_BYTES = 5 * 1024 * 1024
+IMAGE_FETCH_CONCURRENCY = int(os.getenv("IMAGE_FETCH_CONCURRENCY", "4"))
+IMAGE_ALLOWED_HOSTS = [
+    host.strip().lower()
+    for host in os.getenv("IMAGE_ALLOWED_HOSTS", "telegram.org,t.me,cdn-telegram.org,telesco.pe").split(",")
+    if host.strip()
+]  # Image URLs must be on these domains (or their subdomains); empty allows any public host
+IMAGE_MAX_REDIRECTS = 3
+IMAGE_FETCH_TIMEOUT_SECONDS = 20
+IMAGE_RETRY_SECONDS = 60 * 60
+
+# Request metrics (Prometheus text format on /metrics)
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "True").lower() == "true"
+METRICS_TOKEN = os.getenv("METRICS_TOKEN", "")  # Scrapers may send "Authorization: Bearer <token>" from anywhere
+METRICS_ALLOWED_IPS = [
+    network.strip()
+    for network in os.getenv("METRICS_ALLOWED_IPS", "127.0.0.1,::1").split(",")
+    if network.strip()
+]  # Addresses or CIDR ranges allowed to scrape without the token
+METRICS_SLOW_QUERY_MS = float(os.getenv("METRICS_SLOW_QUERY_MS", "200"))  # 0 disables the slow-query log
+METRICS_PROFILE_SAMPLE_RATE = float(os.getenv("METRICS_PROFILE_SAMPLE_RATE", "0"))  # Share of requests run under cProfile
+METRICS_PROFILE_THRESHOLD_MS = float(os.getenv("METRICS_PROFILE_THRESHOLD_MS", "500"))  # Profiles are kept for slower requests
+METRICS_PROFILE_DIR = os.getenv("METRICS_PROFILE_DIR", "./profiles")
+
+# Userbot gift sync
+SYNC_INTERVAL_SECONDS = int(os.getenv("SYNC_INTERVAL_SECONDS", str(6 * 60 * 60)))
+SYNC_CONCURRENCY = int(os.getenv("SYNC_CONCURRENCY", "8"))
+SYNC_RATE_PER_SECOND = float(os.getenv("SYNC_RATE_PER_SECOND", "5"))
+SYNC_BURST = int(os.getenv("SYNC_BURST", "10"))
+SYNC_PUSH_BATCH_SIZE = int(os.getenv("SYNC_PUSH_BATCH_SIZE", "100"))
+SYNC_PUSH_INTERVAL_SECONDS = float(os.getenv("SYNC_PUSH_INTERVAL_SECONDS", "2"))
+BACKEND_POOL_SIZE = int(os.getenv("BACKEND_POOL_SIZE", "20"))
+BACKEND_TIMEOUT_SECONDS = float(os.getenv("BACKEND_TIMEOUT_SECONDS", "30"))
\ No newline at end of file
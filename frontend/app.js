@@ -7,11 +7,30 @@ tg.ready();
 let currentUser = null;
 let currentGift = null;
 let gifts = [];
+let deck = [];
+let sessionToken = null;
+let sessionExpiresAt = 0;
 let matches = [];
 
 // API base URL
 const API_BASE = 'http://localhost:8000/api';
 
+// Swipe deck settings
+const DECK_SIZE = 10;
+const DECK_PREFETCH_AT = 3;
+
+// Dislikes are sent in batches, likes are sent right away (they can match)
+const SWIPE_BATCH_SIZE = 5;
+const SWIPE_FLUSH_DELAY = 2000;
+const SWIPE_MAX_BATCH = 100;  // MAX_SWIPES_PER_BATCH on the backend
+const SWIPE_RETRY_MAX_DELAY = 60000;
+let pendingSwipes = [];
+let swipeFlushTimer = null;
+let swipeFlushFailures = 0;
+// Gifts swiped this session, including ones not yet confirmed by the backend
+const swipedGiftIds = new Set();
+let swipeLimitReached = false;
+
 // DOM elements
 const loadingScreen = document.getElementById('loading');
 const swipeScreen = document.getElementById('swipe-screen');
@@ -31,12 +50,9 @@ async function initApp() {
         // Register user with backend
         await registerUser();
 
-        // Load initial data
-        await Promise.all([
-            loadNextGift(),
-            loadUserProfile(),
-            loadMatches()
-        ]);
+        // Load profile, matches and the first deck batch in one request
+        await loadBootstrap();
+        await loadNextGift();
 
         // Show main screen
         showScreen('swipe-screen');
@@ -63,6 +79,8 @@ async function registerUser() {
         }
 
         const userData = await response.json();
+        sessionToken = userData.session_token;
+        sessionExpiresAt = Date.now() + userData.expires_in * 1000;
         console.log('User registered:', userData);
         
     } catch (error) {
@@ -71,24 +89,85 @@ async function registerUser() {
     }
 }
 
+// Call the API with the session token, re-registering when it expires
+async function apiFetch(path, options = {}) {
+    if (!sessionToken || Date.now() >= sessionExpiresAt - 60000) {
+        await registerUser();
+    }
+
+    const headers = Object.assign({}, options.headers, {
+        'Authorization': `Bearer ${sessionToken}`
+    });
+    return fetch(`${API_BASE}${path}`, Object.assign({}, options, { headers }));
+}
+
+// Load everything shown on open with a single request
+async function loadBootstrap() {
+    const response = await apiFetch(`/bootstrap/${currentUser.id}?deck_size=${DECK_SIZE}`);
+
+    if (!response.ok) {
+        throw new Error('Failed to load app data');
+    }
+
+    const data = await response.json();
+    deck = data.deck;
+    matches = data.matches;
+
+    displayUserProfile(data.user);
+    displayUserGifts(data.gifts);
+    displayMatches(matches);
+    updateStats(data.counts.matches);
+
+    // Fetch the rest of the matches only if they did not fit in one page
+    if (data.matches_next_cursor !== null) {
+        loadMatches();
+    }
+}
+
+// Fetch a batch of gifts to swipe
+async function loadDeck() {
+    const response = await apiFetch(`/deck/${currentUser.id}?size=${DECK_SIZE}`);
+
+    if (!response.ok) {
+        throw new Error('Failed to load deck');
+    }
+
+    const deckData = await response.json();
+    const queued = new Set(deck.map(gift => gift.id));
+    deckData.gifts.forEach(gift => {
+        // The deck may be served before queued swipes reach the backend
+        if (!queued.has(gift.id) && !swipedGiftIds.has(gift.id) && (!currentGift || gift.id !== currentGift.id)) {
+            deck.push(gift);
+        }
+    });
+}
+
 // Load next gift to swipe
 async function loadNextGift() {
     try {
-        const response = await fetch(`${API_BASE}/next_gift/${currentUser.id}`);
-        
-        if (!response.ok) {
-            throw new Error('Failed to load next gift');
+        if (swipeLimitReached) {
+            currentGift = null;
+            showNoMoreGifts();
+            return;
         }
 
-        const giftData = await response.json();
-        
-        if (giftData.message === 'No more gifts to swipe') {
+        if (deck.length === 0) {
+            await loadDeck();
+        }
+
+        if (deck.length === 0) {
+            currentGift = null;
             showNoMoreGifts();
             return;
         }
 
-        currentGift = giftData;
+        currentGift = deck.shift();
         displayGift(currentGift);
+
+        // Prefetch the next batch before the local deck runs out
+        if (deck.length < DECK_PREFETCH_AT) {
+            loadDeck().catch(error => console.error('Failed to prefetch deck:', error));
+        }
         
     } catch (error) {
         console.error('Failed to load next gift:', error);
@@ -96,13 +175,25 @@ async function loadNextGift() {
     }
 }
 
+// Cached thumbnail served by the backend when available, else the original image
+function giftImageSrc(gift, size) {
+    if (gift.thumbnail_url) {
+        const url = new URL(gift.thumbnail_url, API_BASE);
+        if (size) {
+            url.searchParams.set('size', size);
+        }
+        return url.toString();
+    }
+    return gift.image_url;
+}
+
 // Display gift on screen
 function displayGift(gift) {
     const giftImg = document.getElementById('gift-img');
     const giftName = document.getElementById('gift-name');
     const giftDescription = document.getElementById('gift-description');
 
-    giftImg.src = gift.image_url || 'data:image/svg+xml;base64,PHN2ZyB3aWR0aD0iMjAwIiBoZWlnaHQ9IjIwMCIgdmlld0JveD0iMCAwIDIwMCAyMDAiIGZpbGw9Im5vbmUiIHhtbG5zPSJodHRwOi8vd3d3LnczLm9yZy8yMDAwL3N2ZyI+CjxyZWN0IHdpZHRoPSIyMDAiIGhlaWdodD0iMjAwIiBmaWxsPSIjRjBGMEYwIi8+Cjx0ZXh0IHg9IjEwMCIgeT0iMTAwIiBmb250LWZhbWlseT0iQXJpYWwiIGZvbnQtc2l6ZT0iMTYiIGZpbGw9IiM5OTk5OTkiIHRleHQtYW5jaG9yPSJtaWRkbGUiIGR5PSIuM2VtIj7Qn9C+0LvRg9GH0LjRgtGMINGP0LfQvdC10YHRgtC90L7QuSDQv9C+0LvQsNGC0YvQuyDQv9GA0L7QsdC10LvRj9C30LDRgtC10LvRjzwvdGV4dD4KPC9zdmc+';
+    giftImg.src = giftImageSrc(gift) || 'data:image/svg+xml;base64,PHN2ZyB3aWR0aD0iMjAwIiBoZWlnaHQ9IjIwMCIgdmlld0JveD0iMCAwIDIwMCAyMDAiIGZpbGw9Im5vbmUiIHhtbG5zPSJodHRwOi8vd3d3LnczLm9yZy8yMDAwL3N2ZyI+CjxyZWN0IHdpZHRoPSIyMDAiIGhlaWdodD0iMjAwIiBmaWxsPSIjRjBGMEYwIi8+Cjx0ZXh0IHg9IjEwMCIgeT0iMTAwIiBmb250LWZhbWlseT0iQXJpYWwiIGZvbnQtc2l6ZT0iMTYiIGZpbGw9IiM5OTk5OTkiIHRleHQtYW5jaG9yPSJtaWRkbGUiIGR5PSIuM2VtIj7Qn9C+0LvRg9GH0LjRgtGMINGP0LfQvdC10YHRgtC90L7QuSDQv9C+0LvQsNGC0YvQuyDQv9GA0L7QsdC10LvRj9C30LDRgtC10LvRjzwvdGV4dD4KPC9zdmc+';
     giftName.textContent = gift.name || 'Неизвестный подарок';
     giftDescription.textContent = gift.description || 'Описание недоступно';
 
@@ -117,37 +208,85 @@ function showNoMoreGifts() {
     document.getElementById('no-more-gifts').style.display = 'block';
 }
 
-// Handle swipe action
-async function handleSwipe(isLike) {
-    if (!currentGift) return;
+function scheduleSwipeFlush(delay) {
+    if (swipeFlushTimer) return;
+    swipeFlushTimer = setTimeout(() => {
+        flushSwipes().catch(error => console.error('Swipe flush failed:', error));
+    }, delay);
+}
 
-    try {
-        // Add swiping animation
-        const giftCard = document.getElementById('gift-card');
-        giftCard.classList.add('swiping');
+// Send queued swipes to backend in one request
+async function flushSwipes() {
+    clearTimeout(swipeFlushTimer);
+    swipeFlushTimer = null;
+    if (pendingSwipes.length === 0) return;
+
+    const batch = pendingSwipes.splice(0, SWIPE_MAX_BATCH);
 
-        // Send swipe to backend
-        const response = await fetch(`${API_BASE}/swipe`, {
+    let response;
+    try {
+        response = await apiFetch('/swipes', {
             method: 'POST',
             headers: {
                 'Content-Type': 'application/json'
             },
-            body: JSON.stringify({
-                telegram_id: currentUser.id,
-                gift_id: currentGift.id,
-                is_like: isLike
-            })
+            body: JSON.stringify(batch)
         });
-
         if (!response.ok) {
-            throw new Error('Failed to record swipe');
+            throw new Error(`Failed to record swipes: ${response.status}`);
         }
+    } catch (error) {
+        // Put the batch back ahead of newer swipes and retry with backoff;
+        // swipes the backend did record come back as "duplicate" next time
+        pendingSwipes = batch.concat(pendingSwipes);
+        swipeFlushFailures += 1;
+        scheduleSwipeFlush(Math.min(SWIPE_FLUSH_DELAY * 2 ** swipeFlushFailures, SWIPE_RETRY_MAX_DELAY));
+        throw error;
+    }
+    swipeFlushFailures = 0;
+    if (pendingSwipes.length > 0) {
+        scheduleSwipeFlush(pendingSwipes.length >= SWIPE_BATCH_SIZE ? 0 : SWIPE_FLUSH_DELAY);
+    }
 
-        const result = await response.json();
-        
-        // Check for match
-        if (isLike && result.is_match) {
-            showMatchNotification();
+    const result = await response.json();
+    
+    // Check for match
+    if (result.matches > 0) {
+        showMatchNotification();
+    }
+
+    // "duplicate" swipes were already recorded elsewhere and need nothing more;
+    // once the daily quota is used up stop offering gifts
+    const limitHit = result.results.some(swipe => swipe.status === 'quota_exceeded');
+    if ((limitHit || result.swipes_left === 0) && !swipeLimitReached) {
+        swipeLimitReached = true;
+        deck = [];
+        currentGift = null;
+        showNoMoreGifts();
+        showError('Дневной лимит свайпов исчерпан');
+    }
+}
+
+// Handle swipe action
+async function handleSwipe(isLike) {
+    if (!currentGift) return;
+    if (swipeLimitReached) {
+        showError('Дневной лимит свайпов исчерпан');
+        return;
+    }
+
+    try {
+        // Add swiping animation
+        const giftCard = document.getElementById('gift-card');
+        giftCard.classList.add('swiping');
+
+        swipedGiftIds.add(currentGift.id);
+        pendingSwipes.push({ gift_id: currentGift.id, is_like: isLike });
+        if (isLike || pendingSwipes.length >= SWIPE_BATCH_SIZE) {
+            // A failed flush stays queued and is retried, swiping goes on
+            await flushSwipes().catch(error => console.error('Swipe flush failed:', error));
+        } else {
+            scheduleSwipeFlush(SWIPE_FLUSH_DELAY);
         }
 
         // Load next gift
@@ -165,10 +304,10 @@ async function handleSwipe(isLike) {
 // Load user profile
 async function loadUserProfile() {
     try {
-        const [userResponse, giftsResponse, matchesResponse] = await Promise.all([
-            fetch(`${API_BASE}/user/${currentUser.id}`),
-            fetch(`${API_BASE}/gifts/${currentUser.id}`),
-            fetch(`${API_BASE}/matches/${currentUser.id}`)
+        const [userResponse, giftsResponse] = await Promise.all([
+            apiFetch(`/user/${currentUser.id}`),
+            apiFetch(`/gifts/${currentUser.id}`),
+            loadMatches()
         ]);
 
         if (userResponse.ok) {
@@ -181,10 +320,7 @@ async function loadUserProfile() {
             displayUserGifts(giftsData);
         }
 
-        if (matchesResponse.ok) {
-            const matchesData = await matchesResponse.json();
-            updateStats(matchesData.length);
-        }
+        updateStats(matches.length);
 
     } catch (error) {
         console.error('Failed to load profile:', error);
@@ -216,22 +352,30 @@ function displayUserGifts(giftsData) {
         const giftItem = document.createElement('div');
         giftItem.className = 'gift-item';
         giftItem.innerHTML = `
-            <img src="${gift.image_url || 'data:image/svg+xml;base64,PHN2ZyB3aWR0aD0iNjAiIGhlaWdodD0iNjAiIHZpZXdCb3g9IjAgMCA2MCA2MCIgZmlsbD0ibm9uZSIgeG1sbnM9Imh0dHA6Ly93d3cudzMub3JnLzIwMDAvc3ZnIj4KPHJlY3Qgd2lkdGg9IjYwIiBoZWlnaHQ9IjYwIiBmaWxsPSIjRjBGMEYwIi8+Cjx0ZXh0IHg9IjMwIiB5PSIzMCIgZm9udC1mYW1pbHk9IkFyaWFsIiBmb250LXNpemU9IjEyIiBmaWxsPSIjOTk5OTk5IiB0ZXh0LWFuY2hvcj0ibWlkZGxlIiBkeT0iLjNlbSI+0J/QvtC70YPRh9C40YLRjCDRj9C30L3QtdGB0YLRvdC+0Lkg0L/QvtC70LDRgtGL0Lsg0L/RgNC+0LHQtdC70Y/Qt9Cw0YLQtdC70Y88L3RleHQ+Cjwvc3ZnPgo='}" alt="${gift.name}">
+            <img src="${giftImageSrc(gift, 160) || 'data:image/svg+xml;base64,PHN2ZyB3aWR0aD0iNjAiIGhlaWdodD0iNjAiIHZpZXdCb3g9IjAgMCA2MCA2MCIgZmlsbD0ibm9uZSIgeG1sbnM9Imh0dHA6Ly93d3cudzMub3JnLzIwMDAvc3ZnIj4KPHJlY3Qgd2lkdGg9IjYwIiBoZWlnaHQ9IjYwIiBmaWxsPSIjRjBGMEYwIi8+Cjx0ZXh0IHg9IjMwIiB5PSIzMCIgZm9udC1mYW1pbHk9IkFyaWFsIiBmb250LXNpemU9IjEyIiBmaWxsPSIjOTk5OTk5IiB0ZXh0LWFuY2hvcj0ibWlkZGxlIiBkeT0iLjNlbSI+0J/QvtC70YPRh9C40YLRjCDRj9C30L3QtdGB0YLRvdC+0Lkg0L/QvtC70LDRgtGL0Lsg0L/RgNC+0LHQtdC70Y/Qt9Cw0YLQtdC70Y88L3RleHQ+Cjwvc3ZnPgo='}" alt="${gift.name}">
             <p>${gift.name}</p>
         `;
         giftsList.appendChild(giftItem);
     });
 }
 
-// Load matches
+// Load matches, fetching only the ones newer than what is already loaded
 async function loadMatches() {
     try {
-        const response = await fetch(`${API_BASE}/matches/${currentUser.id}`);
-        
-        if (response.ok) {
-            matches = await response.json();
-            displayMatches(matches);
+        let cursor = matches.length ? matches[matches.length - 1].match_id : 0;
+
+        while (cursor !== null) {
+            const response = await apiFetch(`/matches/${currentUser.id}?after_id=${cursor}`);
+            if (!response.ok) {
+                break;
+            }
+
+            const page = await response.json();
+            matches = matches.concat(page.matches);
+            cursor = page.next_cursor;
         }
+
+        displayMatches(matches);
         
     } catch (error) {
         console.error('Failed to load matches:', error);
@@ -331,6 +475,7 @@ document.addEventListener('DOMContentLoaded', () => {
     // Refresh button
     document.getElementById('refresh-btn').addEventListener('click', () => {
         showScreen('swipe-screen');
+        deck = [];
         loadNextGift();
     });
     
@@ -341,6 +486,13 @@ document.addEventListener('DOMContentLoaded', () => {
         loadMatches();
     });
     
+    // Don't lose queued swipes when the Mini App is hidden or closed
+    document.addEventListener('visibilitychange', () => {
+        if (document.visibilityState === 'hidden') {
+            flushSwipes().catch(error => console.error('Swipe flush failed:', error));
+        }
+    });
+    
     // Initialize app
     initApp();
 });
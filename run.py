@@ -2,15 +2,47 @@
 """
 Gift Tinder - Main Runner
 Запуск всех компонентов приложения
+
+    python run.py                         # интерактивное меню
+    python run.py all [--workers N]       # API на N процессах + userbot + бот
+    python run.py backend [--workers N]   # только API
+    python run.py userbot | bot           # один компонент
+    python run.py dev                     # API с --reload в одном процессе
+
+Компоненты работают как дочерние процессы под супервизором: упавший
+процесс перезапускается (с растущей паузой при повторных падениях),
+зависший процесс API (перестал обновлять heartbeat-файл) перезапускается
+отдельно, /health только сообщает о недоступности базы. Ctrl+C / SIGTERM
+останавливает всё штатно (SHUTDOWN_TIMEOUT_SECONDS на завершение, затем kill).
 """
 
+import argparse
 import os
-import sys
+import shutil
+import signal
+import socket
 import subprocess
+import sys
+import tempfile
 import time
-import signal
-import threading
+import urllib.error
+import urllib.request
 from pathlib import Path
+from typing import List, Optional, Sequence
+
+ROOT = Path(__file__).resolve().parent
+sys.path.insert(0, str(ROOT))
+
+from config import (
+    DB_URL, API_HOST, API_PORT, API_WORKERS, MULTI_WORKER_CACHE_TTL_SECONDS,
+    HEALTH_CHECK_INTERVAL_SECONDS, HEALTH_CHECK_FAILURES, SHUTDOWN_TIMEOUT_SECONDS
+)
+
+# A process that ran this long before exiting is restarted without delay
+STABLE_SECONDS = 60
+MAX_RESTART_DELAY_SECONDS = 60
+# Time for a new API worker to start answering before health checks count
+HEALTH_GRACE_SECONDS = 30
 
 def check_dependencies():
     """Проверка наличия необходимых зависимостей"""
@@ -30,145 +62,388 @@ def check_config():
     """Проверка конфигурации"""
     required_vars = [
         'BOT_TOKEN',
-        'API_ID', 
+        'API_ID',
         'API_HASH',
         'WEBAPP_URL'
     ]
-    
+
     missing_vars = []
     for var in required_vars:
         if not os.getenv(var):
             missing_vars.append(var)
-    
+
     if missing_vars:
         print(f"❌ Отсутствуют переменные окружения: {', '.join(missing_vars)}")
         print("Создайте файл .env с необходимыми переменными")
         return False
-    
+
     print("✅ Конфигурация проверена")
     return True
 
-def run_backend():
-    """Запуск backend API"""
-    print("🚀 Запуск Backend API...")
+def child_env(**overrides: str) -> dict:
+    """Environment of a component: config.py importable from every working directory"""
+    env = dict(os.environ)
+    paths = [str(ROOT)] + ([env["PYTHONPATH"]] if env.get("PYTHONPATH") else [])
+    env["PYTHONPATH"] = os.pathsep.join(paths)
+    env.update(overrides)
+    return env
+
+class ManagedProcess:
+    """A component process that is restarted when it exits"""
+
+    def __init__(self, name: str, args: Sequence[str], cwd: Path, env: dict, sockets: Sequence[socket.socket] = (),
+                 heartbeat: Optional[Path] = None):
+        self.name = name
+        self.args = list(args)
+        self.cwd = cwd
+        self.env = env
+        # Inherited by the child (and kept open here for its restarts)
+        self.sockets = tuple(sockets)
+        # File the child touches while it is responsive (API_HEARTBEAT_PATH)
+        self.heartbeat = heartbeat
+        self.process: Optional[subprocess.Popen] = None
+        self.started_at = 0.0
+        self.next_start = 0.0
+        self.failures = 0
+        self._restart_requested = False
+        self._kill_at = 0.0
+
+    @property
+    def running(self) -> bool:
+        return self.process is not None and self.process.poll() is None
+
+    @property
+    def restarting(self) -> bool:
+        return self._restart_requested
+
+    def heartbeat_age(self) -> Optional[float]:
+        """Seconds since the child last touched its heartbeat file, None if it never did"""
+        try:
+            return time.time() - self.heartbeat.stat().st_mtime
+        except (AttributeError, OSError):
+            return None
+
+    def start(self):
+        if self.heartbeat is not None:
+            # A heartbeat left by the previous process must not count for this one
+            self.heartbeat.unlink(missing_ok=True)
+        self.process = subprocess.Popen(
+            self.args,
+            cwd=self.cwd,
+            env=self.env,
+            pass_fds=tuple(sock.fileno() for sock in self.sockets),
+            # Own process group: Ctrl+C reaches only the supervisor, which stops children once
+            start_new_session=os.name != "nt"
+        )
+        self.started_at = time.monotonic()
+        print(f"▶️ {self.name} запущен (pid {self.process.pid})")
+
+    def poll(self, now: float):
+        """Start the process when it is due, schedule a restart when it has exited"""
+        if self.process is None:
+            if now >= self.next_start:
+                self.start()
+            return
+
+        code = self.process.poll()
+        if code is None:
+            if self._restart_requested and now >= self._kill_at:
+                # A hung process may never get to handle SIGTERM
+                print(f"⚠️ {self.name} не остановился за {SHUTDOWN_TIMEOUT_SECONDS:.0f} с, kill")
+                self.process.kill()
+            return
+        self.process = None
+
+        if self._restart_requested:
+            self._restart_requested = False
+            self.next_start = now
+            return
+
+        # Back off when the process keeps crashing right after start
+        self.failures = 0 if now - self.started_at >= STABLE_SECONDS else self.failures + 1
+        delay = min(MAX_RESTART_DELAY_SECONDS, 2 ** self.failures - 1)
+        print(f"⚠️ {self.name} завершился с кодом {code}, перезапуск через {delay} с")
+        self.next_start = now + delay
+
+    def restart(self):
+        """Stop gracefully (kill after SHUTDOWN_TIMEOUT_SECONDS); poll() starts it again right away"""
+        if self.running and not self._restart_requested:
+            self._restart_requested = True
+            self._kill_at = time.monotonic() + SHUTDOWN_TIMEOUT_SECONDS
+            self.stop()
+
+    def stop(self):
+        if self.running:
+            self.process.send_signal(signal.SIGTERM)
+
+    def wait(self, deadline: float):
+        if self.process is None:
+            return
+        try:
+            self.process.wait(timeout=max(0.0, deadline - time.monotonic()))
+        except subprocess.TimeoutExpired:
+            print(f"⚠️ {self.name} не остановился за {SHUTDOWN_TIMEOUT_SECONDS:.0f} с, kill")
+            self.process.kill()
+            self.process.wait()
+
+class Supervisor:
+    """
+    Keeps components running until SIGINT/SIGTERM.
+
+    Each API worker touches its own heartbeat file from its event loop; a
+    worker that misses HEALTH_CHECK_FAILURES check intervals is hung and
+    only that worker is restarted (the others keep serving). /health is
+    requested through the shared socket and cannot tell workers apart: a
+    failure there (typically the database being down) is reported but
+    restarting workers would not fix it.
+    """
+
+    def __init__(self, processes: List[ManagedProcess], api_workers: Sequence[ManagedProcess] = (),
+                 health_url: Optional[str] = None):
+        self.processes = processes
+        self.api_workers = list(api_workers)
+        self.health_url = health_url
+        self._stopping = False
+        self._health_status: Optional[int] = 200
+        self._next_health_check = 0.0
+
+    def _on_signal(self, signum, frame):
+        self._stopping = True
+
+    def _fetch_health(self) -> Optional[int]:
+        """HTTP status of /health, None when nothing answered"""
+        try:
+            with urllib.request.urlopen(self.health_url, timeout=5) as response:
+                return response.status
+        except urllib.error.HTTPError as e:
+            return e.code
+        except Exception:
+            return None
+
+    def _check_health(self, now: float):
+        if now < self._next_health_check:
+            return
+        self._next_health_check = now + HEALTH_CHECK_INTERVAL_SECONDS
+        # Workers still starting up are not judged yet
+        ready = [
+            worker for worker in self.api_workers
+            if worker.running and now - worker.started_at >= HEALTH_GRACE_SECONDS
+        ]
+
+        for worker in ready:
+            if worker.heartbeat is None or worker.restarting:
+                continue
+            age = worker.heartbeat_age()
+            if age is None or age > HEALTH_CHECK_INTERVAL_SECONDS * HEALTH_CHECK_FAILURES:
+                silence = "ни разу" if age is None else f"{age:.0f} с"
+                print(f"🔄 {worker.name} завис (heartbeat: {silence}), перезапуск")
+                worker.restart()
+
+        if not self.health_url or len(ready) < len(self.api_workers):
+            return
+        status = self._fetch_health()
+        if status != self._health_status:
+            if status == 200:
+                print("✅ /health снова в порядке")
+            elif status is None:
+                print("⚠️ /health не отвечает")
+            else:
+                print(f"⚠️ /health вернул {status} (база данных недоступна?)")
+            self._health_status = status
+
+    def run(self):
+        signal.signal(signal.SIGINT, self._on_signal)
+        signal.signal(signal.SIGTERM, self._on_signal)
+        print("✅ Все компоненты запускаются, Ctrl+C для остановки")
+
+        while not self._stopping:
+            now = time.monotonic()
+            for process in self.processes:
+                process.poll(now)
+            self._check_health(now)
+            time.sleep(0.5)
+
+        print("\n⏹️ Остановка всех компонентов...")
+        for process in self.processes:
+            process.stop()
+        deadline = time.monotonic() + SHUTDOWN_TIMEOUT_SECONDS
+        for process in self.processes:
+            process.wait(deadline)
+        print("👋 Все компоненты остановлены")
+
+def default_workers() -> int:
+    # SQLite has one writer and per-process caches: more workers only contend for it
+    if API_WORKERS:
+        return API_WORKERS
+    if DB_URL.startswith("sqlite"):
+        return 1
+    return os.cpu_count() or 1
+
+def api_processes(host: str, port: int, workers: int) -> List[ManagedProcess]:
+    """
+    API worker processes sharing one listening socket (as gunicorn does).
+
+    The supervisor binds the socket and every uvicorn worker accepts on it
+    through --fd, so each worker can be restarted on its own. Only the
+    first worker runs the background jobs. Workers do not see each other's
+    cache invalidations, so cached responses expire quickly when there are
+    several (unless RESPONSE_CACHE_TTL_SECONDS is set explicitly); swipe
+    quotas are shared through a SQLite file (unless QUOTA_STORE_PATH is set).
+    Each worker gets a heartbeat file in a temporary directory.
+    """
+    backend = ROOT / "backend"
+    overrides = {}
+    if workers > 1 and "RESPONSE_CACHE_TTL_SECONDS" not in os.environ:
+        overrides["RESPONSE_CACHE_TTL_SECONDS"] = str(MULTI_WORKER_CACHE_TTL_SECONDS)
+    if workers > 1 and "QUOTA_STORE_PATH" not in os.environ:
+        overrides["QUOTA_STORE_PATH"] = str(ROOT / "swipe_quota.db")
+    if workers > 1 and DB_URL.startswith("sqlite"):
+        print("⚠️ Несколько процессов API на SQLite: записи всё равно идут по одной")
+    heartbeats = Path(tempfile.mkdtemp(prefix="gift-tinder-"))
+
+    if os.name == "nt":
+        # No descriptor passing on Windows: uvicorn's own worker manager
+        args = [sys.executable, "-m", "uvicorn", "main:app", "--host", host, "--port", str(port), "--workers", str(workers)]
+        heartbeat = heartbeats / "api.heartbeat"
+        return [ManagedProcess("api", args, backend, child_env(**overrides, API_HEARTBEAT_PATH=str(heartbeat)), heartbeat=heartbeat)]
+
+    family = socket.AF_INET6 if ":" in host else socket.AF_INET
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(2048)
+
+    return [
+        ManagedProcess(
+            f"api-{index}",
+            [sys.executable, "-m", "uvicorn", "main:app", "--fd", str(sock.fileno())],
+            backend,
+            child_env(
+                **overrides,
+                BACKGROUND_JOBS="True" if index == 0 else "False",
+                API_HEARTBEAT_PATH=str(heartbeats / f"api-{index}.heartbeat")
+            ),
+            sockets=(sock,),
+            heartbeat=heartbeats / f"api-{index}.heartbeat"
+        )
+        for index in range(workers)
+    ]
+
+def migrate():
+    """Apply migrations once before the workers start, so they do not race on them"""
+    subprocess.run([sys.executable, "migrations.py", "upgrade"], cwd=ROOT / "backend", env=child_env(), check=True)
+
+def userbot_process() -> ManagedProcess:
+    return ManagedProcess("userbot", [sys.executable, "run.py"], ROOT / "userbot", child_env())
+
+def bot_process() -> ManagedProcess:
+    return ManagedProcess("bot", [sys.executable, "bot.py"], ROOT, child_env())
+
+def run_components(backend: bool, userbot: bool, bot: bool, host: str = API_HOST, port: int = API_PORT,
+                   workers: Optional[int] = None):
+    """Запуск компонентов под супервизором"""
+    processes, api_workers, health_url = [], [], None
+    if backend:
+        workers = workers or default_workers()
+        print(f"🚀 Запуск Backend API: {workers} процесс(ов) на http://{host}:{port}")
+        migrate()
+        api_workers = api_processes(host, port, workers)
+        processes.extend(api_workers)
+        health_host = "127.0.0.1" if host in ("0.0.0.0", "") else ("::1" if host == "::" else host)
+        health_url = f"http://{f'[{health_host}]' if ':' in health_host else health_host}:{port}/health"
+    if userbot:
+        print("🤖 Запуск Userbot...")
+        processes.append(userbot_process())
+    if bot:
+        print("📱 Запуск Telegram Bot...")
+        processes.append(bot_process())
+
+    try:
+        Supervisor(processes, api_workers, health_url).run()
+    finally:
+        for heartbeat_dir in {worker.heartbeat.parent for worker in api_workers}:
+            shutil.rmtree(heartbeat_dir, ignore_errors=True)
+
+def run_dev(host: str = API_HOST, port: int = API_PORT):
+    """Backend в режиме разработки (один процесс, автоперезагрузка)"""
+    print("🔧 Запуск в режиме разработки...")
+    print(f"Backend будет доступен на http://localhost:{port}")
+    print("Frontend откройте frontend/index.html в браузере")
     try:
-        os.chdir("backend")
         subprocess.run([
-            sys.executable, "-m", "uvicorn", 
-            "main:app", 
-            "--reload", 
-            "--host", "0.0.0.0", 
-            "--port", "8000"
-        ], check=True)
+            sys.executable, "-m", "uvicorn",
+            "main:app",
+            "--reload",
+            "--host", host,
+            "--port", str(port)
+        ], cwd=ROOT / "backend", env=child_env(), check=True)
     except subprocess.CalledProcessError as e:
         print(f"❌ Ошибка запуска backend: {e}")
     except KeyboardInterrupt:
         print("⏹️ Backend остановлен")
 
-def run_userbot():
-    """Запуск userbot"""
-    print("🤖 Запуск Userbot...")
-    try:
-        os.chdir("userbot")
-        subprocess.run([
-            sys.executable, "run.py"
-        ], check=True)
-    except subprocess.CalledProcessError as e:
-        print(f"❌ Ошибка запуска userbot: {e}")
-    except KeyboardInterrupt:
-        print("⏹️ Userbot остановлен")
+COMMANDS = {
+    "all": lambda args: run_components(True, True, True, args.host, args.port, args.workers),
+    "backend": lambda args: run_components(True, False, False, args.host, args.port, args.workers),
+    "userbot": lambda args: run_components(False, True, False),
+    "bot": lambda args: run_components(False, False, True),
+    "dev": lambda args: run_dev(args.host, args.port),
+}
+
+# Пункты интерактивного меню: выбираются номером или названием
+MENU = (
+    ("backend", "Запустить только Backend API"),
+    ("userbot", "Запустить только Userbot"),
+    ("bot", "Запустить только Telegram Bot"),
+    ("all", "Запустить все компоненты"),
+    ("dev", "Запустить в режиме разработки"),
+    ("exit", "Выход"),
+)
+
+def interactive(args):
+    print("\n📋 Доступные команды:")
+    for number, (name, description) in enumerate(MENU, 1):
+        print(f"{number}. {name:<8} - {description}")
 
-def run_bot():
-    """Запуск Telegram бота"""
-    print("📱 Запуск Telegram Bot...")
     try:
-        os.chdir("..")
-        subprocess.run([
-            sys.executable, "bot.py"
-        ], check=True)
-    except subprocess.CalledProcessError as e:
-        print(f"❌ Ошибка запуска bot: {e}")
+        choice = input("\nВыберите команду: ").strip().lower()
     except KeyboardInterrupt:
-        print("⏹️ Bot остановлен")
+        print("\n⏹️ Остановка...")
+        return
+
+    if choice.isdigit() and 1 <= int(choice) <= len(MENU):
+        choice = MENU[int(choice) - 1][0]
+
+    if choice == "exit":
+        print("👋 До свидания!")
+    elif choice in COMMANDS:
+        COMMANDS[choice](args)
+    else:
+        print("❌ Неизвестная команда")
 
 def main():
     """Главная функция"""
+    parser = argparse.ArgumentParser(description="Gift Tinder - запуск компонентов")
+    parser.add_argument("command", nargs="?", choices=sorted(COMMANDS), help="Без команды - интерактивное меню")
+    parser.add_argument("--workers", type=int, default=None, help="Процессов API (по умолчанию API_WORKERS, иначе число ядер, на SQLite - 1)")
+    parser.add_argument("--host", default=API_HOST)
+    parser.add_argument("--port", type=int, default=API_PORT)
+    args = parser.parse_args()
+
     print("🎁 Gift Tinder - Запуск приложения")
     print("=" * 50)
-    
+
     # Проверки
     if not check_dependencies():
         return
-    
+
     if not check_config():
         return
-    
-    print("\n📋 Доступные команды:")
-    print("1. backend  - Запустить только Backend API")
-    print("2. userbot  - Запустить только Userbot")
-    print("3. bot      - Запустить только Telegram Bot")
-    print("4. all      - Запустить все компоненты")
-    print("5. dev      - Запустить в режиме разработки")
-    print("6. exit     - Выход")
-    
-    while True:
-        try:
-            choice = input("\nВыберите команду: ").strip().lower()
-            
-            if choice == "exit":
-                print("👋 До свидания!")
-                break
-                
-            elif choice == "backend":
-                run_backend()
-                
-            elif choice == "userbot":
-                run_userbot()
-                
-            elif choice == "bot":
-                run_bot()
-                
-            elif choice == "all":
-                print("🚀 Запуск всех компонентов...")
-                
-                # Запуск в отдельных потоках
-                backend_thread = threading.Thread(target=run_backend, daemon=True)
-                userbot_thread = threading.Thread(target=run_userbot, daemon=True)
-                bot_thread = threading.Thread(target=run_bot, daemon=True)
-                
-                backend_thread.start()
-                time.sleep(2)
-                
-                userbot_thread.start()
-                time.sleep(2)
-                
-                bot_thread.start()
-                
-                print("✅ Все компоненты запущены")
-                print("Нажмите Ctrl+C для остановки")
-                
-                try:
-                    while True:
-                        time.sleep(1)
-                except KeyboardInterrupt:
-                    print("\n⏹️ Остановка всех компонентов...")
-                    break
-                    
-            elif choice == "dev":
-                print("🔧 Запуск в режиме разработки...")
-                print("Backend будет доступен на http://localhost:8000")
-                print("Frontend откройте frontend/index.html в браузере")
-                
-                run_backend()
-                
-            else:
-                print("❌ Неизвестная команда")
-                
-        except KeyboardInterrupt:
-            print("\n⏹️ Остановка...")
-            break
-        except Exception as e:
-            print(f"❌ Ошибка: {e}")
+
+    if args.command:
+        COMMANDS[args.command](args)
+    else:
+        interactive(args)
 
 if __name__ == "__main__":
-    main() 
\ No newline at end of file
+    main()
\ No newline at end of file
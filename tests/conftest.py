@@ -0,0 +1,98 @@
+"""
+Shared fixtures.
+
+Backend modules read their settings from the environment when they are
+first imported, so the test database and caches are pointed at a
+temporary directory here, before anything from backend/ is imported.
+"""
+import itertools
+import os
+import shutil
+import sys
+import tempfile
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BACKEND = os.path.join(ROOT, "backend")
+for path in (ROOT, BACKEND):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+TMP_DIR = tempfile.mkdtemp(prefix="gift_tinder_tests_")
+SYNC_API_KEY = "test-sync-key"
+os.environ.update({
+    "DB_URL": f"sqlite:///{os.path.join(TMP_DIR, 'test.db')}",
+    "SYNC_API_KEY": SYNC_API_KEY,
+    "QUOTA_STORE_PATH": "",
+    "IMAGE_CACHE_DIR": os.path.join(TMP_DIR, "image_cache"),
+    "METRICS_PROFILE_DIR": os.path.join(TMP_DIR, "profiles"),
+    "BACKGROUND_JOBS": "False",
+})
+
+# Every test gets users no other test has touched, so per-user caches,
+# decks and swipe quotas never leak between tests
+_telegram_ids = itertools.count(1_000)
+
+def pytest_sessionfinish(session, exitstatus):
+    shutil.rmtree(TMP_DIR, ignore_errors=True)
+
+@pytest.fixture(scope="session")
+def client():
+    from fastapi.testclient import TestClient
+
+    import main
+
+    with TestClient(main.app) as test_client:
+        yield test_client
+
+@pytest.fixture
+def db(client):
+    from database import SessionLocal
+
+    session = SessionLocal()
+    try:
+        yield session
+    finally:
+        session.close()
+
+@pytest.fixture
+def make_user(db):
+    """Create a user, optionally owning gift_count gifts, returns the telegram id"""
+    from models import User
+    from sync import diff_sync_gifts
+
+    def make(gift_count: int = 0) -> int:
+        telegram_id = next(_telegram_ids)
+        db.add(User(telegram_id=telegram_id))
+        db.flush()
+        diff_sync_gifts(db, telegram_id, [
+            {"id": f"{telegram_id}-{i}", "name": f"Gift {i}"} for i in range(gift_count)
+        ])
+        db.commit()
+        return telegram_id
+
+    return make
+
+@pytest.fixture
+def user_headers():
+    """Authorization headers of a web app user"""
+    from auth import issue_session_token
+
+    return lambda telegram_id: {"Authorization": f"Bearer {issue_session_token(telegram_id)}"}
+
+@pytest.fixture
+def service_headers():
+    """Headers of the userbot (service API)"""
+    return {"X-API-Key": SYNC_API_KEY}
+
+@pytest.fixture
+def gift_ids(db):
+    """Ids of a user's visible gifts, oldest first"""
+    from sqlalchemy import select
+
+    from models import Gift
+
+    return lambda telegram_id: db.execute(
+        select(Gift.id).where(Gift.telegram_id == telegram_id, Gift.is_visible == True).order_by(Gift.id)
+    ).scalars().all()
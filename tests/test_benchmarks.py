@@ -0,0 +1,78 @@
+"""
+Micro-benchmarks of the hot paths (pytest-benchmark).
+
+    python -m pytest tests/test_benchmarks.py --benchmark-only
+    python -m pytest tests/test_benchmarks.py --benchmark-autosave --benchmark-compare
+
+Skipped when pytest-benchmark is not installed. For whole-API numbers on
+seeded data see benchmarks/.
+"""
+import random
+from collections import namedtuple
+from datetime import datetime, timedelta
+
+import pytest
+
+pytest.importorskip("pytest_benchmark")
+
+from ranking import FeatureRanker, score_features, top_k
+
+PoolRow = namedtuple("PoolRow", (
+    "id", "created_at", "likes", "swipes", "likes_given", "swipes_given", "swipes_received"
+))
+
+@pytest.fixture(scope="module")
+def pool():
+    """A ranker pool of 2000 candidates with random features"""
+    rng = random.Random(42)
+    now = datetime.utcnow()
+    rows = []
+    for gift_id in range(2000, 0, -1):
+        swipes = rng.randint(0, 200)
+        given = rng.randint(0, 500)
+        rows.append(PoolRow(
+            gift_id, now - timedelta(seconds=rng.randint(0, 30 * 86400)),
+            rng.randint(0, swipes), swipes, rng.randint(0, given), given, rng.randint(0, 5000)
+        ))
+    match_likes = {row.id: rng.randint(1, 3) for row in rng.sample(rows, 40)}
+    return rows, match_likes, now
+
+def test_feature_matrix(benchmark, pool):
+    rows, match_likes, now = pool
+    matrix = benchmark(FeatureRanker().feature_matrix, rows, match_likes, now)
+    assert len(matrix) == len(rows)
+
+def test_score_and_top_k(benchmark, pool):
+    rows, match_likes, now = pool
+    ranker = FeatureRanker()
+    matrix = ranker.feature_matrix(rows, match_likes, now)
+    best = benchmark(lambda: top_k(score_features(matrix, ranker.weights), 50))
+    assert len(best) == 50
+
+def test_deck(benchmark, client, make_user, user_headers):
+    for _ in range(5):
+        make_user(gift_count=20)
+    telegram_id = make_user()
+    headers = user_headers(telegram_id)
+
+    response = benchmark(client.get, f"/api/deck/{telegram_id}", params={"size": 10}, headers=headers)
+    assert response.status_code == 200
+
+def test_swipe_batch(benchmark, client, make_user, gift_ids, user_headers):
+    gifts = gift_ids(make_user(gift_count=10))
+
+    def fresh_swiper():
+        telegram_id = make_user()
+        batch = [{"gift_id": gift_id, "is_like": False} for gift_id in gifts]
+        return ("/api/swipes",), {"json": batch, "headers": user_headers(telegram_id)}
+
+    response = benchmark.pedantic(client.post, setup=fresh_swiper, rounds=30)
+    assert response.status_code == 200
+
+def test_users_stream(benchmark, client, make_user, service_headers):
+    for _ in range(200):
+        make_user()
+
+    response = benchmark(client.get, "/api/users", headers=service_headers,
+                         params={"stream": "true", "order": "priority", "limit": 100})
+    assert response.status_code == 200
@@ -0,0 +1,34 @@
+import pytest
+from fastapi import HTTPException
+from starlette.requests import Request
+
+import auth
+
+def scraper(host: str, authorization: str = "") -> Request:
+    headers = [(b"authorization", authorization.encode())] if authorization else []
+    return Request({"type": "http", "headers": headers, "client": (host, 40000)})
+
+def test_metrics_are_not_public(client):
+    assert client.get("/metrics").status_code == 403
+
+def test_metrics_token(client, monkeypatch):
+    monkeypatch.setattr(auth, "METRICS_TOKEN", "scrape-secret")
+
+    assert client.get("/metrics").status_code == 401
+    assert client.get("/metrics", headers={"Authorization": "Bearer wrong"}).status_code == 401
+    response = client.get("/metrics", headers={"Authorization": "Bearer scrape-secret"})
+    assert response.status_code == 200
+    assert "http_request_duration_seconds" in response.text
+
+@pytest.mark.parametrize("host", ["127.0.0.1", "::1", "::ffff:127.0.0.1"])
+def test_loopback_may_scrape(host):
+    auth.metrics_client(scraper(host))
+
+@pytest.mark.parametrize("host", ["203.0.113.7", "10.0.0.5", "testclient"])
+def test_other_addresses_may_not(host):
+    with pytest.raises(HTTPException):
+        auth.metrics_client(scraper(host))
+
+def test_allowed_network(monkeypatch):
+    monkeypatch.setattr(auth, "_METRICS_NETWORKS", [auth.ipaddress.ip_network("10.0.0.0/8")])
+    auth.metrics_client(scraper("10.1.2.3"))
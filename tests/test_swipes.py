@@ -0,0 +1,109 @@
+import pytest
+
+import swipes
+from quota import swipe_quota
+
+@pytest.fixture(params=[False, True], ids=["direct", "write_behind"])
+def write_behind(request, monkeypatch):
+    """Run the test with swipes committed per request and through the write-behind buffer"""
+    import main
+
+    monkeypatch.setattr(main, "SWIPE_WRITE_BEHIND", request.param)
+    return request.param
+
+@pytest.fixture
+def swiper(make_user, gift_ids):
+    """A fresh user and the ids of another user's gifts"""
+    owner = make_user(gift_count=3)
+    return make_user(), gift_ids(owner)
+
+def statuses(response):
+    return [result["status"] for result in response.json()["results"]]
+
+def test_swiping_a_gift_twice_is_rejected(client, write_behind, swiper, user_headers):
+    telegram_id, gifts = swiper
+    before = swipe_quota.remaining(telegram_id)
+    params = {"gift_id": gifts[0], "is_like": False}
+
+    assert client.post("/api/swipe", params=params, headers=user_headers(telegram_id)).status_code == 200
+    response = client.post("/api/swipe", params=params, headers=user_headers(telegram_id))
+
+    assert response.status_code == 400
+    assert response.json()["detail"] == "Already swiped on this gift"
+    assert before - swipe_quota.remaining(telegram_id) == 1
+
+def test_batch_reports_duplicates(client, write_behind, swiper, user_headers):
+    telegram_id, gifts = swiper
+    before = swipe_quota.remaining(telegram_id)
+    headers = user_headers(telegram_id)
+
+    first = client.post("/api/swipes", headers=headers, json=[
+        {"gift_id": gifts[0], "is_like": False},
+        {"gift_id": gifts[0], "is_like": True},
+        {"gift_id": gifts[1], "is_like": False},
+    ])
+    second = client.post("/api/swipes", headers=headers, json=[
+        {"gift_id": gifts[1], "is_like": False},
+        {"gift_id": gifts[2], "is_like": False},
+    ])
+
+    assert statuses(first) == ["recorded", "duplicate", "recorded"]
+    assert statuses(second) == ["duplicate", "recorded"]
+    # Duplicates do not use up the quota
+    assert before - swipe_quota.remaining(telegram_id) == 3
+
+def test_conflicting_insert_is_reported_as_duplicate(client, write_behind, swiper, user_headers, db, monkeypatch):
+    from models import Swipe
+
+    telegram_id, gifts = swiper
+    # Recorded by another worker after the duplicate check ran
+    db.add(Swipe(user_id=telegram_id, gift_id=gifts[0], is_like=False))
+    db.commit()
+    checks = []
+    real_check = swipes.swiped_gift_ids
+
+    def racing_check(session, user_id, ids):
+        checks.append(user_id)
+        return set() if len(checks) == 1 else real_check(session, user_id, ids)
+
+    monkeypatch.setattr(swipes, "swiped_gift_ids", racing_check)
+    before = swipe_quota.remaining(telegram_id)
+
+    response = client.post("/api/swipe", params={"gift_id": gifts[0], "is_like": True},
+                           headers=user_headers(telegram_id))
+
+    assert response.status_code == 400
+    assert len(checks) == 2
+    # The quota taken by the rolled back insert is given back
+    assert swipe_quota.remaining(telegram_id) == before
+
+def test_failed_write_releases_quota(client, write_behind, swiper, user_headers, monkeypatch):
+    telegram_id, gifts = swiper
+
+    def broken_record_like(*args, **kwargs):
+        raise RuntimeError("database went away")
+
+    monkeypatch.setattr(swipes, "record_like", broken_record_like)
+    before = swipe_quota.remaining(telegram_id)
+
+    with pytest.raises(RuntimeError):
+        client.post("/api/swipes", headers=user_headers(telegram_id), json=[
+            {"gift_id": gifts[0], "is_like": True},
+            {"gift_id": gifts[1], "is_like": False},
+        ])
+
+    assert swipe_quota.remaining(telegram_id) == before
+
+def test_quota_exceeded(client, write_behind, swiper, user_headers, monkeypatch):
+    telegram_id, gifts = swiper
+    monkeypatch.setattr(swipe_quota, "limit", 2)
+    headers = user_headers(telegram_id)
+
+    batch = client.post("/api/swipes", headers=headers, json=[
+        {"gift_id": gift_id, "is_like": False} for gift_id in gifts
+    ])
+    single = client.post("/api/swipe", params={"gift_id": gifts[2], "is_like": False}, headers=headers)
+
+    assert statuses(batch) == ["recorded", "recorded", "quota_exceeded"]
+    assert batch.json()["swipes_left"] == 0
+    assert single.status_code == 429
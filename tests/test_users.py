@@ -0,0 +1,55 @@
+import json
+from datetime import datetime, timedelta
+
+from models import User
+
+def stream(client, headers, **params):
+    response = client.get("/api/users", headers=headers, params=dict(params, stream="true"))
+    assert response.status_code == 200
+    return [json.loads(line)["telegram_id"] for line in response.text.splitlines()]
+
+def test_listing_requires_the_service_key(client):
+    assert client.get("/api/users").status_code == 401
+    assert client.get("/api/users", headers={"X-API-Key": "wrong"}).status_code == 401
+
+def test_priority_order(client, db, make_user, service_headers):
+    now = datetime.utcnow()
+    hours_ago = lambda hours: now - timedelta(hours=hours)
+    # (last login, last sync)
+    states = {
+        "never_synced": (hours_ago(1), None),
+        "active_since_sync": (hours_ago(2), hours_ago(5)),
+        "active_earlier": (hours_ago(4), hours_ago(6)),
+        "stale": (None, hours_ago(10)),
+        "synced_after_login": (hours_ago(20), hours_ago(3)),
+    }
+    users = {}
+    for name, (last_active_at, last_synced_at) in states.items():
+        users[name] = make_user()
+        user = db.query(User).filter(User.telegram_id == users[name]).one()
+        user.last_active_at, user.last_synced_at = last_active_at, last_synced_at
+    db.commit()
+
+    # Page size 1: every row is fetched by its own keyset page
+    listed = stream(client, service_headers, order="priority", limit=1)
+    order = [telegram_id for telegram_id in listed if telegram_id in users.values()]
+
+    assert order == [users[name] for name in (
+        "never_synced", "active_since_sync", "active_earlier", "stale", "synced_after_login"
+    )]
+
+def test_sync_moves_a_user_to_the_back(client, make_user, service_headers):
+    synced, waiting = make_user(), make_user()
+
+    response = client.post(f"/api/sync_gifts/{synced}", headers=service_headers, json=[])
+    assert response.status_code == 200
+
+    listed = stream(client, service_headers, order="priority")
+    assert listed.index(waiting) < listed.index(synced)
+    assert listed[-1] == synced
+
+def test_id_order_streams_everyone(client, make_user, service_headers):
+    created = [make_user() for _ in range(3)]
+    listed = stream(client, service_headers, limit=2)
+    assert listed[-3:] == created
+    assert len(listed) == len(set(listed))
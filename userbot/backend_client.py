@@ -0,0 +1,175 @@
+import asyncio
+import json
+import logging
+from typing import Any, AsyncIterator, Dict, List, Optional, Set, Tuple
+
+import aiohttp
+
+from config import (
+    WEBAPP_URL,
+    SYNC_API_KEY,
+    BACKEND_POOL_SIZE,
+    BACKEND_TIMEOUT_SECONDS,
+    SYNC_PUSH_BATCH_SIZE,
+    SYNC_PUSH_INTERVAL_SECONDS,
+)
+
+logger = logging.getLogger(__name__)
+
+class BackendClient:
+    """
+    Long-lived HTTP client for the backend API.
+
+    One pooled keep-alive session is shared by every request instead of
+    opening a new connection (and TLS handshake) per user.
+    """
+
+    def __init__(self, base_url: str = WEBAPP_URL, pool_size: int = BACKEND_POOL_SIZE,
+                 timeout: float = BACKEND_TIMEOUT_SECONDS, api_key: str = SYNC_API_KEY):
+        self.base_url = base_url.rstrip("/")
+        self.api_key = api_key
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self._session: Optional[aiohttp.ClientSession] = None
+
+    @property
+    def session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=self.pool_size,
+                keepalive_timeout=60,
+                ttl_dns_cache=300
+            )
+            self._session = aiohttp.ClientSession(
+                connector=connector,
+                timeout=aiohttp.ClientTimeout(total=self.timeout),
+                headers={"X-API-Key": self.api_key}
+            )
+        return self._session
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+    async def iter_users(self, updated_since: Optional[str] = None, page_size: int = 1000,
+                         priority: bool = False) -> AsyncIterator[Dict[str, Any]]:
+        """Stream the user listing as NDJSON without loading it whole"""
+        url = f"{self.base_url}/api/users"
+        params = {"stream": "true", "limit": page_size, "order": "priority" if priority else "id"}
+        if updated_since:
+            params["updated_since"] = updated_since
+
+        # Streaming the whole listing can outlast the default request timeout
+        timeout = aiohttp.ClientTimeout(total=None, sock_read=self.timeout)
+        async with self.session.get(url, params=params, timeout=timeout) as response:
+            if response.status != 200:
+                logger.error(f"Failed to load users: {response.status}")
+                return
+            async for line in response.content:
+                line = line.strip()
+                if line:
+                    yield json.loads(line)
+
+    async def push_gifts(self, telegram_id: int, gifts: List[Dict[str, Any]]) -> bool:
+        """Push one user's inventory"""
+        url = f"{self.base_url}/api/sync_gifts/{telegram_id}"
+        async with self.session.post(url, json=gifts) as response:
+            if response.status == 200:
+                return True
+            logger.error(f"Failed to sync gifts for user {telegram_id}: {response.status}")
+            return False
+
+    async def push_gifts_bulk(self, inventories: List[Dict[str, Any]]) -> bool:
+        """Push many users' inventories in one request"""
+        url = f"{self.base_url}/api/sync_gifts"
+        async with self.session.post(url, json=inventories) as response:
+            if response.status == 200:
+                return True
+            logger.error(f"Failed to bulk sync gifts for {len(inventories)} users: {response.status}")
+            return False
+
+class GiftPushBatcher:
+    """
+    Collects inventories and pushes them to the backend in bulk requests.
+
+    A batch is sent once it reaches batch_size or has waited for interval
+    seconds, whichever comes first. A failed push is retried max_retries
+    times with exponential backoff. add() returns without waiting for the
+    push: its future resolves to whether the inventory finally made it.
+    At most max_in_flight inventories may be unsettled at once, after that
+    add() waits (backpressure when the backend is slow).
+    """
+
+    def __init__(self, client: BackendClient, batch_size: int = SYNC_PUSH_BATCH_SIZE,
+                 interval: float = SYNC_PUSH_INTERVAL_SECONDS, max_retries: int = 3,
+                 retry_delay: float = 1.0, max_in_flight: Optional[int] = None):
+        self.client = client
+        self.batch_size = batch_size
+        self.interval = interval
+        self.max_retries = max_retries
+        self.retry_delay = retry_delay
+        self._pending: List[Tuple[Dict[str, Any], asyncio.Future]] = []
+        self._in_flight = asyncio.Semaphore(max_in_flight or batch_size * 4)
+        self._lock = asyncio.Lock()
+        self._timer: Optional[asyncio.Task] = None
+        self._flushes: Set[asyncio.Task] = set()
+        self.requests_sent = 0
+        self.users_pushed = 0
+
+    async def add(self, telegram_id: int, gifts: List[Dict[str, Any]]) -> asyncio.Future:
+        """Queue an inventory for a bulk push, returns a future of whether it was pushed"""
+        await self._in_flight.acquire()
+        future = asyncio.get_running_loop().create_future()
+        future.add_done_callback(lambda _: self._in_flight.release())
+        self._pending.append(({"telegram_id": telegram_id, "gifts": gifts}, future))
+        if len(self._pending) >= self.batch_size:
+            # Cut the batch now so that adds made while it waits for the lock
+            # start the next one instead of piling onto this one
+            batch, self._pending = self._pending, []
+            flush = asyncio.create_task(self._send(batch))
+            # Keep a reference until it is done
+            self._flushes.add(flush)
+            flush.add_done_callback(self._flushes.discard)
+        elif self._timer is None or self._timer.done():
+            self._timer = asyncio.create_task(self._flush_later())
+        return future
+
+    async def _flush_later(self):
+        await asyncio.sleep(self.interval)
+        await self.flush()
+
+    async def flush(self) -> bool:
+        """Send everything queued so far"""
+        batch, self._pending = self._pending, []
+        if not batch:
+            return True
+        return await self._send(batch)
+
+    async def _send(self, batch: List[Tuple[Dict[str, Any], asyncio.Future]]) -> bool:
+        async with self._lock:
+            inventories = [inventory for inventory, _ in batch]
+            ok = False
+            try:
+                for attempt in range(self.max_retries + 1):
+                    if attempt:
+                        await asyncio.sleep(self.retry_delay * 2 ** (attempt - 1))
+                    try:
+                        ok = await self.client.push_gifts_bulk(inventories)
+                    except Exception as e:
+                        logger.error(f"Error bulk syncing gifts to backend: {e}")
+                    self.requests_sent += 1
+                    if ok:
+                        break
+
+                if ok:
+                    self.users_pushed += len(batch)
+                    logger.info(f"Synced gifts for {len(batch)} users")
+                else:
+                    logger.error(f"Giving up on gifts of {len(batch)} users after {self.max_retries + 1} attempts")
+            finally:
+                # Also settles the callers if the flush is cancelled midway
+                for _, future in batch:
+                    if not future.done():
+                        future.set_result(ok)
+            return ok
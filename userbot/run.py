@@ -2,7 +2,7 @@ import asyncio
 import logging
 from pyrogram import Client
 from config import API_ID, API_HASH
-from tasks import sync_gifts_task
+from tasks import sync_gifts_task, backend
 
 # Configure logging
 logging.basicConfig(
@@ -26,11 +26,14 @@ async def main():
     async with app:
         logger.info("Userbot started successfully!")
         
-        # Start the gift sync task
-        await sync_gifts_task(app)
-        
-        # Keep the userbot running
-        await asyncio.Event().wait()
+        try:
+            # Start the gift sync task
+            await sync_gifts_task(app)
+            
+            # Keep the userbot running
+            await asyncio.Event().wait()
+        finally:
+            await backend.close()
 
 if __name__ == "__main__":
     try:
@@ -0,0 +1,242 @@
+import asyncio
+import logging
+import time
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Set, Union
+
+from pyrogram.errors import FloodWait
+
+logger = logging.getLogger(__name__)
+
+class TokenBucket:
+    """
+    Async token bucket that adapts to Telegram FloodWait responses.
+
+    The refill rate is halved and the bucket paused for the requested
+    wait on every FloodWait, then recovers additively on each success
+    back up to max_rate.
+    """
+
+    def __init__(self, max_rate: float, burst: int, min_rate: float = 0.1):
+        self.max_rate = max_rate
+        self.min_rate = min_rate
+        self.rate = max_rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.paused_until = 0.0
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self, now: float):
+        elapsed = now - self._updated
+        self._updated = now
+        self.tokens = min(self.burst, self.tokens + elapsed * self.rate)
+
+    async def acquire(self):
+        """Wait until a request may be sent"""
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self.paused_until:
+                    await asyncio.sleep(self.paused_until - now)
+                    continue
+
+                self._refill(now)
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+    def on_flood_wait(self, seconds: float):
+        """Back off after Telegram asked us to wait"""
+        now = time.monotonic()
+        self.paused_until = max(self.paused_until, now + seconds)
+        self.rate = max(self.min_rate, self.rate / 2)
+        self.tokens = 0
+        self._updated = self.paused_until
+        logger.warning(f"FloodWait for {seconds}s, rate lowered to {self.rate:.2f} req/s")
+
+    def on_success(self):
+        """Slowly recover the rate after successful requests"""
+        if self.rate < self.max_rate:
+            self.rate = min(self.max_rate, self.rate + self.max_rate / 100)
+
+@dataclass
+class CycleMetrics:
+    """Throughput and lag metrics of one sync cycle"""
+    started_at: float = field(default_factory=time.monotonic)
+    finished_at: Optional[float] = None
+    users_total: int = 0
+    users_synced: int = 0
+    users_failed: int = 0
+    flood_waits: int = 0
+    flood_wait_seconds: float = 0.0
+    max_lag: float = 0.0  # Longest time since a user's previous sync
+    total_lag: float = 0.0
+    lagged_users: int = 0
+
+    @property
+    def duration(self) -> float:
+        end = self.finished_at if self.finished_at is not None else time.monotonic()
+        return end - self.started_at
+
+    @property
+    def throughput(self) -> float:
+        """Users processed per second"""
+        duration = self.duration
+        processed = self.users_synced + self.users_failed
+        return processed / duration if duration > 0 else 0.0
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "duration": round(self.duration, 3),
+            "users_total": self.users_total,
+            "users_synced": self.users_synced,
+            "users_failed": self.users_failed,
+            "throughput": round(self.throughput, 3),
+            "flood_waits": self.flood_waits,
+            "flood_wait_seconds": self.flood_wait_seconds,
+            "max_lag": round(self.max_lag, 3),
+            "avg_lag": round(self.total_lag / self.lagged_users, 3) if self.lagged_users else 0.0
+        }
+
+def _timestamp(value: Any) -> float:
+    """Convert an ISO datetime string (or epoch number) to epoch seconds"""
+    if not value:
+        return 0.0
+    if isinstance(value, (int, float)):
+        return float(value)
+    try:
+        return datetime.fromisoformat(str(value)).timestamp()
+    except ValueError:
+        return 0.0
+
+class SyncScheduler:
+    """
+    Runs gift syncs for many users with bounded concurrency.
+
+    Streamed users (run_stream) are synced in the order they arrive. For an
+    in-memory list (run_cycle) users that were never synced go first, then
+    recently active users, then the ones with the oldest sync.
+
+    sync_user returns whether the sync succeeded, or a future of that when
+    its result is only known later (a queued bulk push): the worker moves
+    on to the next user and the outcome is recorded when the future settles.
+    """
+
+    def __init__(self, sync_user: Callable[[int], Awaitable[Union[bool, asyncio.Future]]],
+                 concurrency: int, bucket: TokenBucket, max_retries: int = 3):
+        self.sync_user = sync_user
+        self.concurrency = concurrency
+        self.bucket = bucket
+        self.max_retries = max_retries
+        self.last_synced: Dict[int, float] = {}  # telegram_id -> wall clock time
+        self._unsettled: Set[asyncio.Future] = set()
+        self.metrics: Optional[CycleMetrics] = None
+        self.history: List[Dict[str, Any]] = []
+
+    def prioritise(self, users: List[Dict[str, Any]]) -> List[int]:
+        """Order users for the next cycle"""
+        def key(user):
+            telegram_id = user["telegram_id"]
+            synced_at = self.last_synced.get(telegram_id) or _timestamp(user.get("last_synced_at"))
+            active_at = _timestamp(user.get("last_active_at") or user.get("updated_at"))
+            never_synced = synced_at == 0
+            recently_active = active_at > synced_at
+            return (not never_synced, not recently_active, -active_at, synced_at)
+
+        users = [user for user in users if user.get("telegram_id")]
+        return [user["telegram_id"] for user in sorted(users, key=key)]
+
+    async def _run_one(self, telegram_id: int, metrics: CycleMetrics):
+        for _ in range(self.max_retries):
+            await self.bucket.acquire()
+            try:
+                ok = await self.sync_user(telegram_id)
+            except FloodWait as e:
+                metrics.flood_waits += 1
+                metrics.flood_wait_seconds += e.value
+                self.bucket.on_flood_wait(e.value)
+                continue
+            except Exception as e:
+                logger.error(f"Error syncing user {telegram_id}: {e}")
+                ok = False
+
+            self.bucket.on_success()
+            break
+        else:
+            ok = False
+
+        if isinstance(ok, asyncio.Future):
+            self._unsettled.add(ok)
+            ok.add_done_callback(lambda future: self._settle(telegram_id, future, metrics))
+            return
+        self._record(telegram_id, ok, metrics)
+
+    def _settle(self, telegram_id: int, future: asyncio.Future, metrics: CycleMetrics):
+        self._unsettled.discard(future)
+        ok = not future.cancelled() and future.exception() is None and bool(future.result())
+        self._record(telegram_id, ok, metrics)
+
+    def _record(self, telegram_id: int, ok: bool, metrics: CycleMetrics):
+        now = time.time()
+        previous = self.last_synced.get(telegram_id)
+        if previous:
+            lag = now - previous
+            metrics.max_lag = max(metrics.max_lag, lag)
+            metrics.total_lag += lag
+            metrics.lagged_users += 1
+
+        if ok:
+            self.last_synced[telegram_id] = now
+            metrics.users_synced += 1
+        else:
+            metrics.users_failed += 1
+
+    async def run_cycle(self, users: List[Dict[str, Any]]) -> CycleMetrics:
+        """Sync every user of an in-memory list once, in priority order"""
+        async def ordered():
+            for telegram_id in self.prioritise(users):
+                yield {"telegram_id": telegram_id}
+
+        return await self.run_stream(ordered())
+
+    async def run_stream(self, users: AsyncIterator[Dict[str, Any]]) -> CycleMetrics:
+        """
+        Sync every user once in the order they arrive and return the cycle
+        metrics. Only a small window of users is held in memory, so the
+        priority order has to come from the source (the backend's
+        order=priority listing).
+        """
+        metrics = CycleMetrics()
+        self.metrics = metrics
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self.concurrency * 2)
+
+        async def worker():
+            while True:
+                telegram_id = await queue.get()
+                if telegram_id is None:
+                    return
+                await self._run_one(telegram_id, metrics)
+
+        workers = [asyncio.create_task(worker()) for _ in range(self.concurrency)]
+        try:
+            async for user in users:
+                if user.get("telegram_id"):
+                    metrics.users_total += 1
+                    await queue.put(user["telegram_id"])
+        finally:
+            # Users already queued are still synced if the stream breaks off
+            for _ in workers:
+                await queue.put(None)
+            await asyncio.gather(*workers)
+            # Pushes still in flight belong to this cycle
+            if self._unsettled:
+                await asyncio.wait(set(self._unsettled))
+
+        metrics.finished_at = time.monotonic()
+        self.history.append(metrics.to_dict())
+        del self.history[:-24]
+        logger.info(f"Sync cycle finished: {metrics.to_dict()}")
+        return metrics
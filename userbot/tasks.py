@@ -1,12 +1,24 @@
 import asyncio
-import aiohttp
 import logging
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Union
 from pyrogram import Client
-from config import WEBAPP_URL
+from pyrogram.errors import FloodWait
+from config import (
+    WEBAPP_URL,
+    SYNC_INTERVAL_SECONDS,
+    SYNC_CONCURRENCY,
+    SYNC_RATE_PER_SECOND,
+    SYNC_BURST,
+    MAX_GIFTS_PER_USER,
+)
+from scheduler import SyncScheduler, TokenBucket
+from backend_client import BackendClient, GiftPushBatcher
 
 logger = logging.getLogger(__name__)
 
+# Shared keep-alive connection pool to the backend
+backend = BackendClient(WEBAPP_URL)
+
 async def get_user_gifts(client: Client, user_id: int) -> List[Dict[str, Any]]:
     """
     Get gifts for a specific user using Pyrogram
@@ -16,7 +28,7 @@ async def get_user_gifts(client: Client, user_id: int) -> List[Dict[str, Any]]:
         gifts = await client.get_gifts(user_id)
         
         formatted_gifts = []
-        for gift in gifts:
+        for gift in gifts[:MAX_GIFTS_PER_USER]:
             formatted_gift = {
                 "id": str(gift.id),
                 "name": getattr(gift, 'name', 'Unknown Gift'),
@@ -28,6 +40,9 @@ async def get_user_gifts(client: Client, user_id: int) -> List[Dict[str, Any]]:
         
         return formatted_gifts
         
+    except FloodWait:
+        # Let the scheduler back off and retry
+        raise
     except Exception as e:
         logger.error(f"Error getting gifts for user {user_id}: {e}")
         return []
@@ -37,15 +52,10 @@ async def sync_gifts_to_backend(telegram_id: int, gifts: List[Dict[str, Any]]) -
     Sync gifts to backend API
     """
     try:
-        async with aiohttp.ClientSession() as session:
-            url = f"{WEBAPP_URL}/api/sync_gifts/{telegram_id}"
-            async with session.post(url, json=gifts) as response:
-                if response.status == 200:
-                    logger.info(f"Synced {len(gifts)} gifts for user {telegram_id}")
-                    return True
-                else:
-                    logger.error(f"Failed to sync gifts for user {telegram_id}: {response.status}")
-                    return False
+        if await backend.push_gifts(telegram_id, gifts):
+            logger.info(f"Synced {len(gifts)} gifts for user {telegram_id}")
+            return True
+        return False
     except Exception as e:
         logger.error(f"Error syncing gifts to backend: {e}")
         return False
@@ -55,32 +65,41 @@ async def sync_gifts_task(client: Client):
     Main task to sync gifts for all users
     """
     logger.info("Starting gift sync task...")
+    batcher = GiftPushBatcher(backend)
+
+    async def sync_user(telegram_id: int) -> Union[bool, asyncio.Future]:
+        gifts = await get_user_gifts(client, telegram_id)
+        if not gifts:
+            return True
+        # Pushed to the backend together with other users' inventories; the
+        # scheduler counts the user as synced once that bulk push succeeds
+        return await batcher.add(telegram_id, gifts)
+
+    scheduler = SyncScheduler(
+        sync_user,
+        concurrency=SYNC_CONCURRENCY,
+        bucket=TokenBucket(SYNC_RATE_PER_SECOND, SYNC_BURST)
+    )
     
     while True:
         try:
-            # Get all users from backend
-            async with aiohttp.ClientSession() as session:
-                url = f"{WEBAPP_URL}/api/users"
-                async with session.get(url) as response:
-                    if response.status == 200:
-                        users = await response.json()
-                        
-                        for user in users:
-                            telegram_id = user.get("telegram_id")
-                            if telegram_id:
-                                # Get gifts for this user
-                                gifts = await get_user_gifts(client, telegram_id)
-                                
-                                if gifts:
-                                    # Sync to backend
-                                    await sync_gifts_to_backend(telegram_id, gifts)
-                                
-                                # Small delay between users
-                                await asyncio.sleep(1)
+            # Users arrive in sync priority order (never synced, then active
+            # since their last sync, then the longest unsynced) and are synced
+            # as they stream in, without holding the whole listing in memory
+            async def active_users():
+                async for user in backend.iter_users(priority=True):
+                    if user.get("is_active", True):
+                        yield user
+
+            # Every push has settled once the cycle is over
+            await scheduler.run_stream(active_users())
+            logger.info(
+                f"Backend push: {batcher.users_pushed} users in {batcher.requests_sent} requests"
+            )
                     
-            # Wait before next sync cycle (every 6 hours)
-            logger.info("Gift sync completed. Waiting 6 hours before next sync...")
-            await asyncio.sleep(6 * 60 * 60)  # 6 hours
+            # Wait before next sync cycle
+            logger.info(f"Gift sync completed. Waiting {SYNC_INTERVAL_SECONDS}s before next sync...")
+            await asyncio.sleep(SYNC_INTERVAL_SECONDS)
             
         except Exception as e:
             logger.error(f"Error in gift sync task: {e}")